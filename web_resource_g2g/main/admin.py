@@ -1,5 +1,6 @@
 import asyncio
 import datetime
+import json
 import os
 import sys
 import time
@@ -8,19 +9,28 @@ from decimal import Decimal
 from django import forms
 from django.contrib import admin
 from django.contrib.admin import SimpleListFilter
+from django.core.exceptions import PermissionDenied
 from django.db import models
 from django.shortcuts import redirect
+from django.template.response import TemplateResponse
 from django.templatetags.static import static
 from django.utils import timezone
+from django.urls import path, reverse
 from django.utils.html import format_html
 from import_export.admin import ExportActionModelAdmin
 from import_export import resources
 
-from .crud import update_seller_balance, update_technical_balance, update_owner_balance
+from . import ledger, stock_history
+from .crud import (reconcile_server_strategies, enqueue_telegram_messages, get_interest_rate_matrix,
+                   save_interest_rate_matrix)
 from .models import Sellers, SoldOrders, SellerServerInterestRate, ServerUrls, ChangeStockHistory, OffersForPlacement, \
-    Commission
-from .utils.logger_config import logger
-from .tg_bot_run import send_messages_sync
+    Commission, TelegramOutbox, VideoProcessingJob, ChangeStockDailySummary
+from .utils.cache import seller_choices_cache
+from .utils.logger_config import get_logger
+from .utils.admin_changelist import EstimatedCountPaginator, indexed_dates
+from .tg_bot_run import order_notification_messages
+
+logger = get_logger(__name__)
 
 
 @admin.register(ServerUrls)
@@ -34,22 +44,6 @@ class ServerUrlsAdmin(admin.ModelAdmin):
         return False
 
 
-@admin.register(ChangeStockHistory)
-class ChangeStockHistoryAdmin(admin.ModelAdmin):
-    # Поля для відображення у списку
-    list_display = (
-        "seller", "server", "stock",
-        "active_rate_record", "created_time",
-        "description"
-    )
-
-    # Фільтрація за цими полями
-    list_filter = ("seller", "active_rate_record", "created_time", "description")
-
-    # Сортування за замовчуванням
-    ordering = ('-created_time',)
-
-
 class SellersResource(resources.ModelResource):
     class Meta:
         model = Sellers
@@ -89,6 +83,27 @@ class SellerBalanceFilter(SimpleListFilter):
         return queryset
 
 
+class SellerListFilter(SimpleListFilter):
+    # Варіанти беруться з таблиці продавців і кешуються, а не DISTINCT по всіх замовленнях
+    title = 'Продавець'
+    parameter_name = 'seller'
+
+    def lookups(self, request, model_admin):
+        return seller_choices_cache.get('all', lambda: [
+            (str(seller_id), username)
+            for seller_id, username in Sellers.objects.order_by('auth_user__username')
+            .values_list('id', 'auth_user__username')
+        ])
+
+    def queryset(self, request, queryset):
+        try:
+            seller_id = int(self.value())
+        except (TypeError, ValueError):
+            # Без параметра або з довільним рядком в URL - список без фільтра, а не помилка
+            return queryset
+        return queryset.filter(seller_id=seller_id)
+
+
 class CreatedTimeFilter(admin.SimpleListFilter):
     title = 'Час створення'  # Назва фільтра, що відображається в адмін-панелі
     parameter_name = 'created_time'  # Ім'я параметра, що передається в URL
@@ -107,8 +122,78 @@ class CreatedTimeFilter(admin.SimpleListFilter):
         return queryset  # Повертаємо початковий queryset, якщо фільтр не застосовано
 
 
+class OrderVideoLinkMixin:
+    # Посилання на потокове відео замовлення (main:order_video), його постер та легку копію
+    def video_link(self, obj):
+        if not obj.path_to_video:
+            return '-'
+        url = reverse('main:order_video', args=[obj.id])
+        if obj.video_thumbnail:
+            link = format_html('<a href="{}" target="_blank"><img src="{}?version=thumbnail" alt="Переглянути" '
+                               'height="54" loading="lazy"></a>', url, url)
+        else:
+            link = format_html('<a href="{}" target="_blank">Переглянути</a>', url)
+        if obj.video_review_path:
+            return format_html('{} | <a href="{}?version=review" target="_blank">легка копія</a>', link, url)
+        return link
+
+    video_link.short_description = 'Перегляд відео'
+
+
+class LargeChangelistMixin:
+    # Мільйони рядків: кількість зі статистики бази, без другого COUNT(*) для "показати всі"
+    # та date_hierarchy через індекс по created_time
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        return indexed_dates(super().get_queryset(request))
+
+
+class StockEventFilter(SimpleListFilter):
+    # Фіксований перелік подій замість DISTINCT по всій історії
+    title = 'Подія'
+    parameter_name = 'description'
+
+    def lookups(self, request, model_admin):
+        return [(stock_history.STOCK_CHANGED, 'Зміна запасу'), (stock_history.STATUS_CHANGED, 'Зміна статусу')]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(description=self.value())
+        return queryset
+
+
+@admin.register(ChangeStockHistory)
+class ChangeStockHistoryAdmin(LargeChangelistMixin, admin.ModelAdmin):
+    # Поля для відображення у списку
+    list_display = (
+        "seller", "server", "stock",
+        "active_rate_record", "created_time",
+        "description"
+    )
+    list_select_related = ('seller__auth_user', 'server')
+
+    # Фільтрація за цими полями
+    list_filter = (SellerListFilter, "active_rate_record", "created_time", StockEventFilter)
+
+    # Сортування за замовчуванням
+    ordering = ('-created_time',)
+    date_hierarchy = 'created_time'
+
+
+@admin.register(ChangeStockDailySummary)
+class ChangeStockDailySummaryAdmin(LargeChangelistMixin, admin.ModelAdmin):
+    list_display = ("seller", "server", "day", "events", "first_stock", "last_stock", "min_stock", "max_stock",
+                    "last_active_rate")
+    list_select_related = ('seller__auth_user', 'server')
+    list_filter = (SellerListFilter, "last_active_rate", "day")
+    ordering = ('-day',)
+    date_hierarchy = 'day'
+
+
 @admin.register(SoldOrders)
-class SoldOrdersAdmin(admin.ModelAdmin):
+class SoldOrdersAdmin(OrderVideoLinkMixin, LargeChangelistMixin, admin.ModelAdmin):
     # Поля для відображення у списку
     list_display = (
         'seller_name',
@@ -121,10 +206,12 @@ class SoldOrdersAdmin(admin.ModelAdmin):
         'paid_to_owner',
         'technical_commission',
         'paid_to_technical',
+        'video_info',
+        'video_link',
     )
 
     # Фільтрація за цими полями
-    list_filter = ('seller__auth_user__username',
+    list_filter = (SellerListFilter,
                    ('paid_in_salary', admin.BooleanFieldListFilter),
                    ('charged_to_payment', admin.BooleanFieldListFilter),
                    ('paid_to_technical', admin.BooleanFieldListFilter),
@@ -134,6 +221,7 @@ class SoldOrdersAdmin(admin.ModelAdmin):
 
     # Сортування за замовчуванням
     ordering = ('-created_time',)
+    date_hierarchy = 'created_time'
 
     # Вказуємо список доступних дій
     actions = ['mark_paid', 'pay_technical_commission', 'mark_reviewed', 'send_message_to_seller']
@@ -156,10 +244,20 @@ class SoldOrdersAdmin(admin.ModelAdmin):
     seller_balance.admin_order_field = 'seller__balance'
     seller_balance.short_description = 'Баланс'
 
+    # Тривалість і контейнер відео, які записав process_videos
+    def video_info(self, obj):
+        if obj.video_duration is None:
+            return obj.video_container or '-'
+        minutes, seconds = divmod(int(obj.video_duration), 60)
+        return f"{minutes}:{seconds:02d} {obj.video_container}"
+
+    video_info.admin_order_field = 'video_duration'
+    video_info.short_description = 'Відео'
+
     def get_queryset(self, request):
         # Додаткові оптимізації для зменшення кількості запитів до БД
         queryset = super().get_queryset(request)
-        return queryset.select_related('seller')
+        return queryset.select_related('seller__auth_user')
 
     def seller(self, obj):
         return obj.seller.auth_user.username
@@ -169,22 +267,8 @@ class SoldOrdersAdmin(admin.ModelAdmin):
 
     @admin.action(description='Відмітити як оплачені')
     def mark_paid(self, request, queryset):
-
-        # Отримуємо список унікальних продавців з оновлених замовлень
-        sellers_ids = set(queryset.values_list('seller_id', flat=True).distinct())
-        logger.info(f"sellers_ids__{sellers_ids}")
-
-        # Оновлюємо всі записи, які відповідають фільтрації
-        updated_count = queryset.update(paid_in_salary=True)
-
-        # Виключаємо продавців з ID 1 та 2
-        excluded_sellers = {1, 2}
-
-        for seller_id in sellers_ids:
-            logger.info(seller_id)
-            logger.info(f"seller_id__{seller_id}")
-            if seller_id not in excluded_sellers:
-                update_seller_balance(seller_id)
+        # Оновлюємо всі записи, які відповідають фільтрації, і віднімаємо виплачене з балансів продавців
+        updated_count = ledger.pay_sellers(queryset)
 
         self.message_user(
             request,
@@ -193,16 +277,13 @@ class SoldOrdersAdmin(admin.ModelAdmin):
 
     @admin.action(description='Сплатити технічну комісію')
     def pay_technical_commission(self, request, queryset):
-        updated_count = queryset.update(paid_to_technical=True)
-        update_technical_balance()  # Виклик celery task
+        updated_count = ledger.pay_technical(queryset)
         self.message_user(request, f"Оновлено записів: {updated_count}."
                                    f" Встановлено статус 'оплачено технічну комісію'.")
 
     @admin.action(description='Відмітити як переглянуто')
     def mark_reviewed(self, request, queryset):
-        updated_count = queryset.update(paid_to_owner=True)
-        for order in queryset:  # Ітерація по оновленим об'єктам
-            update_owner_balance()
+        updated_count = ledger.pay_owner(queryset)
         self.message_user(request, f"Успішно оновлено {updated_count} записів, відмічено як переглянуті.")
 
     def order_value(self, obj):
@@ -239,6 +320,44 @@ class SoldOrdersAdmin(admin.ModelAdmin):
     paid_to_owner_icon.short_description = 'Власнику сплачено'
 
 
+@admin.register(TelegramOutbox)
+class TelegramOutboxAdmin(admin.ModelAdmin):
+    list_display = ('chat_id', 'sold_order', 'status', 'attempts', 'created_time', 'sent_time', 'last_error')
+    list_filter = ('status',)
+    ordering = ('-created_time',)
+    actions = ['retry_messages']
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.action(description='Надіслати повторно')
+    def retry_messages(self, request, queryset):
+        # Повідомлення, яке саме надсилає диспетчер, не повертається в чергу: інакше воно піде двічі
+        retryable = [TelegramOutbox.STATUS_PENDING, TelegramOutbox.STATUS_FAILED]
+        updated_count = queryset.filter(status__in=retryable).update(
+            status=TelegramOutbox.STATUS_PENDING, attempts=0, next_attempt_time=timezone.now()
+        )
+        self.message_user(request, f"Повернуто в чергу повідомлень: {updated_count}.")
+
+
+@admin.register(VideoProcessingJob)
+class VideoProcessingJobAdmin(admin.ModelAdmin):
+    list_display = ('sold_order', 'path', 'status', 'attempts', 'created_time', 'finished_time', 'last_error')
+    list_filter = ('status',)
+    ordering = ('-created_time',)
+    actions = ['retry_jobs']
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.action(description='Обробити повторно')
+    def retry_jobs(self, request, queryset):
+        updated_count = queryset.exclude(status=VideoProcessingJob.STATUS_PROCESSING).update(
+            status=VideoProcessingJob.STATUS_PENDING, attempts=0, next_attempt_time=timezone.now(), finished_time=None
+        )
+        self.message_user(request, f"Повернуто в чергу відео: {updated_count}.")
+
+
 class ServerUrlsChoiceField(forms.ModelChoiceField):
     def label_from_instance(self, obj):
         return f"{obj.server_name} - {obj.game_name}"
@@ -249,7 +368,101 @@ class SellerServerInterestRateAdmin(admin.ModelAdmin):
     list_display = ('seller', 'server_display', 'interest_rate')
     list_filter = ('seller', 'server__game_name')
     list_editable = ('interest_rate',)
+    list_select_related = ('seller__auth_user', 'server')
     search_fields = ('seller__auth_user__username', 'server__game_name', 'server__server_name')
+    # Скільки продавців (рядків) показує матриця ставок за раз
+    matrix_max_sellers = 50
+
+    def get_urls(self):
+        return [
+            path('matrix/', self.admin_site.admin_view(self.matrix_view),
+                 name='main_sellerserverinterestrate_matrix'),
+        ] + super().get_urls()
+
+    def matrix_view(self, request):
+        """
+        Редактор ставок продавці x сервери: змінені клітинки зберігаються разом однією транзакцією.
+        GET: game - лише сервери гри, q - частина імені продавця.
+        """
+        if not self.has_change_permission(request):
+            raise PermissionDenied
+        game_name = request.GET.get('game', '')
+        username = request.GET.get('q', '')
+        sellers, servers, rates, truncated = get_interest_rate_matrix(game_name, username, self.matrix_max_sellers)
+
+        errors, submitted = [], {}
+        if request.method == 'POST':
+            # changes - JSON {"<seller_id>_<server_id>": "80" або "" (видалити ставку)}, який збирає сторінка
+            try:
+                submitted = json.loads(request.POST.get('changes', '{}'))
+            except ValueError:
+                submitted = None
+            if not isinstance(submitted, dict):
+                submitted = {}
+                errors = ["Некоректні дані форми."]
+            cells, cell_errors = self.parse_matrix_changes(submitted, sellers, servers)
+            errors += cell_errors
+            if not errors:
+                updated, created, deleted = save_interest_rate_matrix(cells)
+                self.message_user(request, f"Ставки збережено: змінено {updated}, додано {created}, "
+                                           f"видалено {deleted}.")
+                return redirect(request.get_full_path())
+
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Матриця ставок',
+            'games': ServerUrls.objects.order_by('game_name').values_list('game_name', flat=True).distinct(),
+            'game_name': game_name,
+            'username': username,
+            'servers': servers,
+            'rows': [
+                {'seller': seller, 'cells': [self.matrix_cell(seller['id'], server['id'], rates, submitted)
+                                             for server in servers]}
+                for seller in sellers
+            ],
+            'truncated': truncated,
+            'max_sellers': self.matrix_max_sellers,
+            'errors': errors,
+        }
+        return TemplateResponse(request, 'admin/main/sellerserverinterestrate/matrix.html', context)
+
+    @staticmethod
+    def matrix_cell(seller_id, server_id, rates, submitted):
+        # Після помилки сторінка показує введені значення, щоб їх не довелося вводити знову
+        key = f"{seller_id}_{server_id}"
+        initial = rates.get((seller_id, server_id), '')
+        return {'key': key, 'initial': initial, 'value': submitted.get(key, initial)}
+
+    @staticmethod
+    def parse_matrix_changes(changes, sellers, servers):
+        seller_names = {seller['id']: seller['auth_user__username'] for seller in sellers}
+        server_names = {server['id']: server['server_name'] for server in servers}
+        cells, errors = {}, []
+        for key, value in changes.items():
+            seller_id, _, server_id = str(key).partition('_')
+            try:
+                seller_id, server_id = int(seller_id), int(server_id)
+            except ValueError:
+                errors.append(f"Невідома клітинка {key}.")
+                continue
+            if seller_id not in seller_names or server_id not in server_names:
+                errors.append(f"Невідома клітинка {key}.")
+                continue
+            value = str(value).strip()
+            if not value:
+                cells[(seller_id, server_id)] = None
+                continue
+            try:
+                interest_rate = int(value)
+            except ValueError:
+                interest_rate = None
+            if interest_rate is None or not 1 <= interest_rate <= 100:
+                errors.append(f"{seller_names[seller_id]} / {server_names[server_id]}: "
+                              f"ставка має бути цілим числом від 1 до 100, а не «{value}».")
+                continue
+            cells[(seller_id, server_id)] = interest_rate
+        return cells, errors
 
     def formfield_for_foreignkey(self, db_field, request, **kwargs):
         if db_field.name == "server":
@@ -275,6 +488,13 @@ class OffersForPlacementAdmin(admin.ModelAdmin):
         queryset = super().get_queryset(request)
         return queryset.select_related('sellers', 'server_urls')
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        # Зміна `active_rate` може вимагати переходу сервера на спільну стратегію, а власна стратегія
+        # чи доставка на спільному сервері не зберігається
+        if not change or {'active_rate', 'price', 'face_to_face_trade'} & set(form.changed_data):
+            reconcile_server_strategies([obj.server_urls_id])
+
 
 class AddOrder(SoldOrders):
     class Meta:
@@ -333,7 +553,7 @@ class AddOrderForm(forms.ModelForm):
 
 
 @admin.register(AddOrder)
-class AddOrderAdmin(admin.ModelAdmin):
+class AddOrderAdmin(OrderVideoLinkMixin, LargeChangelistMixin, admin.ModelAdmin):
     technical_commission_percent = Decimal(5)  # Перетворюємо в Decimal
 
     form = AddOrderForm  # Використовуємо кастомну форму
@@ -356,7 +576,7 @@ class AddOrderAdmin(admin.ModelAdmin):
         'price_unit',
         'comission_fee',  # Note the correct spelling: commission_fee
         'send_message',
-        'path_to_video',
+        'video_link',
         'download_video_status',
         'send_video_status',
         'charged_to_payment',
@@ -364,7 +584,9 @@ class AddOrderAdmin(admin.ModelAdmin):
         'paid_to_owner',
         'paid_to_technical',
     )
-    list_filter = ('seller', 'created_time', 'download_video_status', 'paid_in_salary')
+    list_filter = (SellerListFilter, 'created_time', 'download_video_status', 'paid_in_salary')
+    list_select_related = ('server', 'seller__auth_user')
+    date_hierarchy = 'created_time'
     actions = ['send_message_to_seller']
 
     # Поля для відображення у формі створення замовлення
@@ -390,7 +612,10 @@ class AddOrderAdmin(admin.ModelAdmin):
 
     @admin.action(description='Надіслати повідомлення продавцю')
     def send_message_to_seller(self, request, queryset):
-        for order in queryset:
+        outbox_messages = []
+        queued_orders = []
+        skipped_orders = []
+        for order in queryset.select_related('seller__auth_user', 'server'):
             seller = order.seller
             if seller.id_telegram:  # Перевіряємо, чи є у продавця Telegram ID
                 message = str(f"Вітаю, {seller.auth_user.username} для вас замовлення від {order.created_time} \n"
@@ -401,19 +626,20 @@ class AddOrderAdmin(admin.ModelAdmin):
                               f"Спосіб доставки___________{order.trade_mode}\n"
                               f"Сума замовлення: {order.earned_without_admins_commission}\n"
                               )
-                logger.info(message)
-                logger.info(f"seller.id_telegram__{seller.id_telegram},"
-                            f" seller.auth_user.username__{seller.auth_user.username}")
-
-                response = send_messages_sync(seller.id_telegram, seller.auth_user.username, message)
-                if response:
-                    SoldOrders.objects.filter(sold_order_number=order.sold_order_number).update(send_message=True)
-                else:
-                    "Telegram повідомлення не надіслано"
+                outbox_messages.extend(order_notification_messages(order, seller.id_telegram, message))
+                queued_orders.append(str(order.sold_order_number))
 
             else:
-                self.message_user(request, f"У продавця {seller.auth_user.username} немає Telegram ID.",
-                                  level='WARNING')
+                skipped_orders.append(f"{order.sold_order_number} ({seller.auth_user.username})")
+
+        # Повідомлення надішле диспетчер черги, він же позначить send_message
+        enqueue_telegram_messages(outbox_messages)
+        if queued_orders:
+            logger.info("Telegram notifications queued for orders %s", queued_orders)
+            self.message_user(request, f"Повідомлення поставлено в чергу для замовлень: {', '.join(queued_orders)}.")
+        if skipped_orders:
+            self.message_user(request, f"У продавців немає Telegram ID, замовлення пропущено: "
+                                       f"{', '.join(skipped_orders)}.", level='WARNING')
 
     # Встановлення значень за замовчанням для полів
     def save_model(self, request, obj, form, change):
@@ -428,7 +654,7 @@ class AddOrderAdmin(admin.ModelAdmin):
             seller_interest_rate = Decimal(seller_interest.interest_rate)
         except SellerServerInterestRate.DoesNotExist:
             seller_interest_rate = Decimal(0)  # Якщо немає ставки
-            logger.critical(f"Ставка не знайдена для продавця {obj.seller} та сервера {obj.server}")
+            logger.critical("Ставка не знайдена для продавця %s та сервера %s", obj.seller, obj.server)
 
         total_amount = Decimal(obj.total_amount)  # Перетворюємо в Decimal
 
@@ -461,13 +687,13 @@ class AddOrderAdmin(admin.ModelAdmin):
             obj.price_unit = obj.earned_without_admins_commission / obj.quantity if obj.quantity else 0
 
         # Вивід результатів перед збереженням
-        logger.warning(f"Загальна вартість: {obj.total_amount}")
-        logger.warning(f"Ставка {obj.seller.auth_user.username} на сервері {obj.server.server_name}: {seller_interest_rate}")
-        logger.warning(f"З вирахуванням  комісії біржі: {obj.to_be_earned}")
-        logger.warning(f"З вирахуванням адміністративної комісії: {obj.earned_without_admins_commission}")
-        logger.warning(f"Комісія власника: {obj.owner_commission}")
-        logger.warning(f"Технічна комісія: {obj.technical_commission}")
-        logger.warning(f"Ціна за одиницю з урахуванням усіх комісій: {obj.price_unit}")
+        logger.warning("Загальна вартість: %s", obj.total_amount)
+        logger.warning("Ставка %s на сервері %s: %s", obj.seller.auth_user.username, obj.server.server_name, seller_interest_rate)
+        logger.warning("З вирахуванням  комісії біржі: %s", obj.to_be_earned)
+        logger.warning("З вирахуванням адміністративної комісії: %s", obj.earned_without_admins_commission)
+        logger.warning("Комісія власника: %s", obj.owner_commission)
+        logger.warning("Технічна комісія: %s", obj.technical_commission)
+        logger.warning("Ціна за одиницю з урахуванням усіх комісій: %s", obj.price_unit)
 
         # Зберігаємо об'єкт
         super().save_model(request, obj, form, change)
@@ -5,3 +5,5 @@ class MainConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "main"
 
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,26 @@
+from channels.generic.websocket import AsyncWebsocketConsumer
+
+from .realtime import seller_updates_watcher
+
+
+class SellerUpdatesConsumer(AsyncWebsocketConsumer):
+    """WebSocket продавця: лише отримує оновлення, які SellerUpdatesWatcher надсилає в канал з'єднання."""
+
+    auth_user_id = None
+
+    async def connect(self):
+        user = self.scope.get('user')
+        if user is None or not user.is_authenticated:
+            await self.close()
+            return
+        self.auth_user_id = user.id
+        await self.accept()
+        seller_updates_watcher.subscribe(self.auth_user_id, self.channel_name)
+
+    async def disconnect(self, code):
+        if self.auth_user_id is None:
+            return
+        seller_updates_watcher.unsubscribe(self.auth_user_id, self.channel_name)
+
+    async def seller_update(self, event):
+        await self.send(text_data=event['text'])
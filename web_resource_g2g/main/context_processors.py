@@ -1,11 +1,10 @@
-from . crud import get_balance
+from django.utils.functional import SimpleLazyObject
+
+from .crud import get_cached_balance
 
 
 def user_balance(request):
     if request.user.is_authenticated:
-        try:
-            balance = get_balance(request.user.id)
-        except AttributeError:
-            return f"Продавця не додано. Зверніться до адміністратора"
-        return {'user_balance': balance}
+        # Баланс завантажується лише тоді, коли шаблон його виводить
+        return {'user_balance': SimpleLazyObject(lambda: get_cached_balance(request.user.id))}
     return {}
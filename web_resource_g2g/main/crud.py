@@ -1,17 +1,49 @@
-from datetime import datetime
+import hashlib
+import json
+import os
+from datetime import timedelta
 
-from django.db import transaction
+from django.db import connection, transaction
 from django.core.exceptions import ObjectDoesNotExist
-from django.forms import model_to_dict
 from django.utils import timezone
 
-from .models import (OffersForPlacement, ServerUrls, Sellers, TopPrices,
-                     SoldOrders, Commission, SellerServerInterestRate, ChangeStockHistory)
-from django.db.models import F, Sum, DecimalField
-from .utils.logger_config import logger
+from .models import (OffersForPlacement, ServerUrls, Sellers, TopPrices, LatestTopPrices,
+                     SoldOrders, Commission, SellerServerInterestRate, TelegramOutbox,
+                     VideoUpload, VideoProcessingJob, StoredVideo)
+from django.db.models import F, Q, Sum, DecimalField, Count, Case, When, Value, Window
+from django.db.models.expressions import RowRange
+from . import ledger, stock_history, video_storage
+from .utils.cache import (commission_cache, interest_rates_cache, seller_ids_cache, balance_cache,
+                          server_catalog_cache)
+from .utils.logger_config import get_logger
+from .utils.video_upload import create_part_file, remove_upload_lock
+
+logger = get_logger(__name__)
+
+# Колонки `TopPrices`, які можуть бути стратегією ціни лота
+TOP_PRICE_STRATEGIES = ('top1', 'top5', 'top10', 'top20', 'mean10', 'mean20', 'minimal',
+                        'mean10_lot', 'mean20_lot', 'double_minimal')
+BALANCE_STRATEGY = 'mean10_lot'
+
+# Колонки лотів у таблиці продавця
+OFFERS_TABLE_COLUMNS = ('id', 'sellers', 'server_urls', 'currency', 'description', 'price', 'stock',
+                        'min_units_per_order', 'active_rate', 'percent_offset', 'duration', 'face_to_face_trade',
+                        'mail_delivery', 'auction_house', 'delivery_online_hrs', 'delivery_offline_hrs',
+                        'is_created_lot', 'reserve_stock', 'game_name', 'region', 'server_name', 'order_status')
+# Поля, які calculate_offers_table додає до колонок
+OFFERS_TABLE_CALCULATED_FIELDS = ('strategy_price', 'exists_strategy', 'interest_rate', 'full_cost')
 
 
 def get_main_data_from_table(auth_user_id: int):
+    return calculate_offers_table(load_offers_table(auth_user_id))
+
+
+def load_offers_table(auth_user_id: int, offer_ids=None):
+    """
+    Усе, з чого будується таблиця лотів продавця, без розрахунку цін: рядки лотів, контекст цін
+    і сервери зі спільною стратегією. Кількість запитів не залежить від кількості рядків.
+    `offer_ids` обмежує таблицю вказаними лотами.
+    """
     main_data = (
         OffersForPlacement.objects
         .select_related('server_urls')
@@ -20,49 +52,48 @@ def get_main_data_from_table(auth_user_id: int):
             region=F('server_urls__region'),
             server_name=F('server_urls__server_name'),
         ).filter(sellers__auth_user__id=auth_user_id)
-        .values(
-            'id',
-            'sellers',
-            'server_urls',
-            'currency',
-            'description',
-            'price',
-            'stock',
-            'min_units_per_order',
-            'active_rate',
-            'percent_offset',
-            'duration',
-            'face_to_face_trade',
-            'mail_delivery',
-            'auction_house',
-            'delivery_online_hrs',
-            'delivery_offline_hrs',
-            'is_created_lot',
-            'reserve_stock',
-            'game_name',
-            'region',
-            'server_name',
-            'order_status',
-        )
+        .values(*OFFERS_TABLE_COLUMNS)
     )
-    # Оновлюємо ціни та створюємо новий список
+    if offer_ids is not None:
+        main_data = main_data.filter(id__in=offer_ids)
+    main_data = list(main_data)
+    server_ids = {row['server_urls'] for row in main_data}
+    return {
+        'rows': main_data,
+        'pricing': load_pricing_context(auth_user_id, server_ids),
+        'competing_servers': get_servers_with_competing_strategy(auth_user_id, server_ids),
+    }
+
+
+def get_offers_table_version(table):
+    """
+    Версія таблиці лотів з даних load_offers_table: змінюється разом з лотами продавця, знімками TopPrices
+    його серверів, комісією біржі, ставками та спільною стратегією на серверах.
+    """
+    pricing = table['pricing']
+    state = (
+        [tuple(row.values()) for row in table['rows']],
+        sorted((server_id, prices['top_price_id']) for server_id, prices in pricing['top_prices'].items()),
+        pricing['commission'],
+        sorted(pricing['interest_rates'].items()),
+        sorted(table['competing_servers']),
+    )
+    return hashlib.sha256(repr(state).encode()).hexdigest()[:20]
+
+
+def calculate_offers_table(table):
+    pricing = table['pricing']
+    competing_servers = table['competing_servers']
 
+    # Оновлюємо ціни та створюємо новий список
     main_data_float_price = []
-    for row in main_data:
+    for row in table['rows']:
+        row = dict(row)
         try:
-            # #Шукаємо стратегію на активному лоті такого ж сервера
-            current_strategy = OffersForPlacement.objects.filter(
-                server_urls=row['server_urls'],
-                active_rate=True
-            ).exclude(sellers=row['sellers']).values_list('price', flat=True).first()
-
-            if current_strategy:
-                ballance_strategy_for_all = 'mean10_lot'
-                change_all_strategy = OffersForPlacement.objects.filter(server_urls_id=row['server_urls'])
-                change_all_strategy.update(price=ballance_strategy_for_all, face_to_face_trade=True)
-
-                row['strategy_price'] = ballance_strategy_for_all
-                row['price'] = ballance_strategy_for_all
+            # Якщо на сервері є активний лот іншого продавця, торгуємо за спільною стратегією
+            if row['server_urls'] in competing_servers:
+                row['strategy_price'] = BALANCE_STRATEGY
+                row['price'] = BALANCE_STRATEGY
                 row['exists_strategy'] = True
                 row['face_to_face_trade'] = False
             else:
@@ -71,7 +102,7 @@ def get_main_data_from_table(auth_user_id: int):
 
             stock = row['stock']
             if row['price']:
-                new_price, interest_rate = get_float_price(row, auth_user_id)
+                new_price, interest_rate = calculate_float_price(row, pricing)
                 row['price'] = new_price
                 row['interest_rate'] = interest_rate
                 row['full_cost'] = round(new_price * stock, 3)
@@ -81,85 +112,194 @@ def get_main_data_from_table(auth_user_id: int):
 
             main_data_float_price.append(row)
         except (ValueError, TypeError) as e:
-            logger.info(f"Error updating {row['server_name']}: {e}")
+            logger.info("Error updating %s: %s", row['server_name'], e)
             continue  # Пропустити помилковий рядок і перейти до наступного
 
     return main_data_float_price
 
 
-def get_float_price(row, auth_user_id):
-    try:
-        # Перевірка наявності ключів у `row`
-        currently_strategy = row.get('price')
-        server_urls_id = row.get('server_urls')
-        rang_exchange = get_exchange_commission()
-        interest_rate = get_interest_rate_by_user_id(auth_user_id, server_urls_id)
+def get_servers_with_competing_strategy(auth_user_id, server_ids):
+    # Сервери, на яких вже є активний лот іншого продавця
+    return set(
+        OffersForPlacement.objects.filter(server_urls_id__in=server_ids, active_rate=True)
+        .exclude(sellers__auth_user_id=auth_user_id)
+        .exclude(price='')
+        .values_list('server_urls_id', flat=True)
+        .distinct()
+    )
 
-        if not currently_strategy or not server_urls_id:
-            logger.error("Missing 'price' or 'server_urls' in row.")
-            return None, None
 
-        # Отримання `float_price` з `TopPrices`
-        float_price = TopPrices.objects.filter(server_name=server_urls_id).values_list(
-            currently_strategy, flat=True
-        ).first()
+def reconcile_server_strategies(server_ids=None):
+    # Якщо на сервері є активний лот і лот іншого продавця, всі лоти сервера переводяться на спільну стратегію.
+    # Повторний виклик нічого не змінює, тому його безпечно запускати після кожної зміни `active_rate`.
+    active_offers = OffersForPlacement.objects.filter(active_rate=True).exclude(price='')
+    if server_ids is not None:
+        active_offers = active_offers.filter(server_urls_id__in=server_ids)
+
+    shared_servers = list(
+        OffersForPlacement.objects.filter(server_urls_id__in=active_offers.values('server_urls_id'))
+        .order_by()
+        .values('server_urls_id')
+        .annotate(sellers_count=Count('sellers_id', distinct=True))
+        .filter(sellers_count__gt=1)
+        .values_list('server_urls_id', flat=True)
+    )
+    if not shared_servers:
+        return 0
 
-        if float_price is None:
-            logger.warning(f"No TopPrices record found for server_name={server_urls_id}.")
-            float_price_without_exchange = 0
-            return round(float_price_without_exchange, 3), interest_rate
+    with transaction.atomic():
+        updated_count = (
+            OffersForPlacement.objects.filter(server_urls_id__in=shared_servers)
+            .exclude(price=BALANCE_STRATEGY, face_to_face_trade=True)
+            .update(price=BALANCE_STRATEGY, face_to_face_trade=True)
+        )
+    if updated_count:
+        logger.info("Shared strategy applied to %s offers on servers %s", updated_count, shared_servers)
+    return updated_count
+
+
+def load_pricing_context(auth_user_id, server_ids):
+    server_ids = set(server_ids)
+
+    interest_rates = get_seller_interest_rates(auth_user_id)
+
+    # Останній знімок `TopPrices` для кожного сервера одним запитом
+    top_prices = {
+        row['server_id']: row
+        for row in (LatestTopPrices.objects.filter(server_id__in=server_ids)
+                    .values('server_id', 'top_price_id', *TOP_PRICE_STRATEGIES))
+    }
+
+    return {
+        'commission': get_exchange_commission(),
+        'interest_rates': interest_rates,
+        'top_prices': top_prices,
+    }
 
-        total_percent = interest_rate - rang_exchange
-        float_price_without_exchange = float_price * (total_percent / 100)
 
-        # logger.info(f"float_price__{float_price}, rang_exchange__{rang_exchange},"
-        #             f" interest_rate__{interest_rate} float_price_without_exchange__{float_price_without_exchange},"
-        #             f" total_percent__{total_percent}")
+def calculate_float_price(row, pricing):
+    currently_strategy = row.get('price')
+    server_urls_id = row.get('server_urls')
 
+    if not currently_strategy or not server_urls_id:
+        logger.error("Missing 'price' or 'server_urls' in row.")
+        return None, None
+
+    if currently_strategy not in TOP_PRICE_STRATEGIES:
+        logger.error("Unknown price strategy %s for server_name=%s.", currently_strategy, server_urls_id)
+        return None, None
+
+    interest_rate = pricing['interest_rates'].get(server_urls_id, 0)
+    top_prices = pricing['top_prices'].get(server_urls_id)
+
+    if top_prices is None:
+        logger.warning("No TopPrices record found for server_name=%s.", server_urls_id)
+        float_price_without_exchange = 0
         return round(float_price_without_exchange, 3), interest_rate
 
-    except Exception as e:
-        # Логування будь-якої несподіваної помилки
-        logger.error(f"Unexpected error in get_float_price: {e}", exc_info=True)
+    rang_exchange = pricing['commission']
+    if rang_exchange is None:
         return None, None
 
+    total_percent = interest_rate - rang_exchange
+    float_price_without_exchange = top_prices[currently_strategy] * (total_percent / 100)
 
-def update_price_delivery(data, user_id):
-    field = data['field_name']
-    value = data['new_value']
-    row_id = data['row_id']
-    if field == 'stock' and value == '':
-        value = 0
+    return round(float_price_without_exchange, 3), interest_rate
 
-    try:
-        # Retrieve the  OffersForPlacement object
-        offer = OffersForPlacement.objects.get(id=row_id)
 
-        if field == 'price' or field == 'stock':
-            # Update the specified field with the new value
-            setattr(offer, field, value)
-        elif field == 'face_to_face_trade':
-            setattr(offer, field, True if value == 'face_to_face_trade' else False)
+def get_float_price(row, auth_user_id):
+    try:
+        pricing = load_pricing_context(auth_user_id, [row.get('server_urls')])
+        return calculate_float_price(row, pricing)
 
-        offer.save()
-        if field == 'stock':
-            update_stock_table(row_id, 'change stock')
+    except Exception as e:
+        # Логування будь-якої несподіваної помилки
+        logger.error("Unexpected error in get_float_price: %s", e, exc_info=True)
+        return None, None
 
-        offer_dict = model_to_dict(offer)
-        logger.info(f"offer_dict__{offer_dict}")
 
-        try:
-            # Retrieve the TopPrices object
-            show_price, interest_rate = get_float_price(offer_dict, user_id)
-        except TopPrices.DoesNotExist:
-            # Handle the case where the TopPrices object does not exist
-            new_price = 0
+def update_price_delivery(data, user_id):
+    # Одна зміна з update_table_data - окремий випадок пакетної
+    offers = update_offers_batch([data], user_id)
+    return offers[0]['price'] if offers else None
 
-    except OffersForPlacement.DoesNotExist:
-        # Handle the case where the OffersForPlacement object does not exist
-        raise ValueError(f"OffersForPlacement with id {data['row_id']} does not exist.")
 
-    return show_price
+def parse_offer_edit(edit):
+    """(row_id, field, value) з правки {'row_id', 'field_name', 'new_value'} таблиці лотів, або ValueError."""
+    try:
+        row_id = int(edit['row_id'])
+        field = edit['field_name']
+        value = edit['new_value']
+    except (KeyError, TypeError, ValueError):
+        raise ValueError(f"Некоректна правка: {edit!r}")
+
+    if field == 'price':
+        if value not in TOP_PRICE_STRATEGIES:
+            raise ValueError(f"Невідома стратегія ціни {value!r}")
+    elif field == 'stock':
+        try:
+            value = int(value) if value != '' else 0
+        except (TypeError, ValueError):
+            raise ValueError(f"Запас має бути цілим числом, отримано {value!r}")
+        if value < 0:
+            raise ValueError("Запас не може бути від'ємним")
+    elif field == 'face_to_face_trade':
+        if value not in ('face_to_face_trade', 'mail_delivery'):
+            raise ValueError(f"Невідомий спосіб доставки {value!r}")
+        value = value == 'face_to_face_trade'
+    else:
+        raise ValueError(f"Поле {field!r} не можна змінювати")
+    return row_id, field, value
+
+
+def update_offers_batch(edits, auth_user_id):
+    """
+    Застосовує правки таблиці лотів продавця однією транзакцією: bulk_update лише змінених полів,
+    ChangeStockHistory для змін запасу одним bulk_create. Повертає перераховані рядки змінених лотів
+    (як у get_main_data_from_table). Правки чужих чи неіснуючих лотів - ValueError, нічого не змінюється.
+    """
+    parsed = [parse_offer_edit(edit) for edit in edits]
+    offer_ids = {row_id for row_id, _, _ in parsed}
+
+    with transaction.atomic():
+        offers = OffersForPlacement.objects.select_for_update().filter(
+            id__in=offer_ids, sellers__auth_user_id=auth_user_id).in_bulk()
+        missing = offer_ids - set(offers)
+        if missing:
+            raise ValueError(f"Лоти {sorted(missing)} не знайдено серед лотів продавця")
+
+        # Порівнюємо з початковими значеннями: кілька правок одного поля можуть повернути його назад
+        original = {}
+        for row_id, field, value in parsed:
+            original.setdefault((row_id, field), getattr(offers[row_id], field))
+            setattr(offers[row_id], field, value)
+        changed_fields = {}
+        for (row_id, field), value in original.items():
+            if getattr(offers[row_id], field) != value:
+                changed_fields.setdefault(row_id, set()).add(field)
+
+        # Групуємо лоти за набором змінених полів, щоб не перезаписувати незмінені колонки
+        by_fields = {}
+        for row_id, fields in changed_fields.items():
+            by_fields.setdefault(tuple(sorted(fields)), []).append(offers[row_id])
+        for fields, group in by_fields.items():
+            OffersForPlacement.objects.bulk_update(group, fields, batch_size=500)
+
+        with stock_history.buffered():
+            for row_id, offer in offers.items():
+                if 'stock' in changed_fields.get(row_id, ()):
+                    stock_history.record_offer(offer, stock_history.STOCK_CHANGED)
+
+        # На сервері зі спільною стратегією власна стратегія чи доставка продавця не зберігається:
+        # сторінка могла бути відкрита ще до того, як сервер став спільним
+        strategy_servers = {offers[row_id].server_urls_id for row_id, fields in changed_fields.items()
+                            if fields & {'price', 'face_to_face_trade'}}
+        if strategy_servers:
+            reconcile_server_strategies(strategy_servers)
+    logger.info("Offers batch for auth_user_id=%s: %s edits, %s offers changed",
+                auth_user_id, len(parsed), len(changed_fields))
+
+    return calculate_offers_table(load_offers_table(auth_user_id, offer_ids))
 
 
 def get_servers_for_add():
@@ -167,34 +307,37 @@ def get_servers_for_add():
     return servers
 
 
-def query_servers():
-    servers = ServerUrls.objects.all()
-    return servers
-
-
 def get_grouped_data(servers):
-    server_data = []
-    for server in servers:
-        server_data.append({
-            'game_name': server.game_name,
-            'region': server.region,
-            'server_name': server.server_name
-        })
-    # Групуємо дані за грою та регіоном і сортуємо сервери
+    """Гра -> регіон -> відсортовані назви серверів з рядків values('game_name', 'region', 'server_name')."""
     grouped_data = {}
-    for data in server_data:
-        game = data['game_name']
-        region = data['region']
-        if game not in grouped_data:
-            grouped_data[game] = {}
-        if region not in grouped_data[game]:
-            grouped_data[game][region] = []
-        grouped_data[game][region].append(data['server_name'])
-        # Сортуємо список серверів за алфавітом
-        grouped_data[game][region].sort()
+    for server in servers:
+        grouped_data.setdefault(server['game_name'], {}).setdefault(server['region'], []).append(
+            server['server_name'])
+    # Сортуємо кожен список один раз, після групування
+    for regions in grouped_data.values():
+        for server_names in regions.values():
+            server_names.sort()
     return grouped_data
 
 
+def build_server_catalog():
+    servers = ServerUrls.objects.values('game_name', 'region', 'server_name')
+    grouped_data = get_grouped_data(servers)
+    # sort_keys: однаковий вміст завжди дає однакові байти, а отже й однакову версію
+    body = json.dumps(grouped_data, ensure_ascii=False, sort_keys=True, separators=(',', ':')).encode()
+    return {
+        'version': hashlib.sha256(body).hexdigest()[:20],
+        'games': sorted(grouped_data),
+        'regions': sorted({region for regions in grouped_data.values() for region in regions}),
+        'body': body,
+    }
+
+
+def get_server_catalog():
+    """Каталог серверів з кешу: version, games, regions та готовий JSON у body."""
+    return server_catalog_cache.get('current', build_server_catalog)
+
+
 def add_server_to_db(data):
     auth_user_id = data['auth_user_id']
     server_name = data['server']
@@ -204,7 +347,7 @@ def add_server_to_db(data):
     server_id = ServerUrls.objects.get(server_name=server_name,
                                        game_name=game_name)
 
-    logger.info(f'seller_id__{seller_id.id}, server_id__{server_id.id}')
+    logger.info('seller_id__%s, server_id__%s', seller_id.id, server_id.id)
     new_offer = OffersForPlacement(sellers=seller_id,
                                    server_urls=server_id,
                                    currency='USD',
@@ -225,6 +368,7 @@ def add_server_to_db(data):
                                    order_status=False,
                                    )
     new_offer.save()
+    reconcile_server_strategies([server_id.id])
 
 
 def delete_server_from_list(offer_id):
@@ -241,7 +385,8 @@ def pause_offer(offer_id, action):
         setattr(offer, 'active_rate', 1)
 
     offer.save()
-    update_stock_table(offer_id, 'Change status')
+    stock_history.record_offer(offer, stock_history.STATUS_CHANGED)
+    reconcile_server_strategies([offer.server_urls_id])
 
 
 def get_order_info(user_id):
@@ -249,30 +394,33 @@ def get_order_info(user_id):
     order_info = (SoldOrders.objects.filter(seller_id=seller_id, download_video_status=False).
                   select_related('server').first())
 
-    logger.info(f"server_id__{order_info.server_id}, seller_id_{seller_id}") if order_info else None
+    logger.info("server_id__%s, seller_id_%s", order_info.server_id, seller_id) if order_info else None
 
     return order_info
 
 
 def update_sold_order_when_video_download(user, order_number, path_to_video, sent_gold):
-    logger.info(f"sold_order_number__{order_number}, path_to_video__{path_to_video}, sent_gold__{sent_gold}")
+    logger.info("sold_order_number__%s, path_to_video__%s, sent_gold__%s", order_number, path_to_video, sent_gold)
     seller_id = Sellers.objects.get(auth_user_id=user)
     try:
         with transaction.atomic():  # Забезпечує цілісність транзакції
             # Оновлюємо запис у SoldOrders
-            sold_order = SoldOrders.objects.get(sold_order_number=order_number, seller_id=seller_id.id)
-            seller_id = sold_order.seller_id
+            sold_order = SoldOrders.objects.select_for_update().get(sold_order_number=order_number,
+                                                                    seller_id=seller_id.id)
+            already_charged = sold_order.charged_to_payment
+            video_storage.change_video_reference(sold_order.path_to_video, path_to_video)
             sold_order.path_to_video = path_to_video
             sold_order.sent_gold = sent_gold
             sold_order.download_video_status = True
             sold_order.charged_to_payment = True
             sold_order.save()
 
-            # Оновлюємо баланс продавця
-            response = update_seller_balance(seller_id)
-            update_owner_balance()
-            update_technical_balance()
-            logger.info(response)
+            # Додаємо суми замовлення до балансів продавця, власника та технічного адміністратора
+            if not already_charged:
+                ledger.charge_order(sold_order)
+
+            # Перевірку та стиснення відео виконує process_videos поза запитом
+            VideoProcessingJob.objects.create(sold_order=sold_order, path=path_to_video)
 
             # Знаходимо запис у OffersForPlacement, пов'язаний із SoldOrders
             offer = OffersForPlacement.objects.filter(
@@ -298,6 +446,64 @@ def get_orders_history(user_id):
     return orders_history
 
 
+HISTORY_PAGE_SIZE = 100
+# Поля SoldOrders, які виводить show_history.html
+HISTORY_FIELDS = ('id', 'server__server_name', 'server__game_name', 'server__fraction', 'quantity',
+                  'character_name', 'trade_mode', 'price_unit', 'earned_without_admins_commission',
+                  'created_time', 'sold_order_number', 'download_video_status', 'charged_to_payment',
+                  'paid_in_salary')
+
+# Заробіток замовлення, що входить у баланс історії: ще не виплачене продавцю
+_UNPAID_EARNED = Case(
+    When(paid_in_salary=False, then=F('earned_without_admins_commission')),
+    default=Value(0),
+    output_field=DecimalField(max_digits=10, decimal_places=3),
+)
+
+
+def get_orders_history_page(user_id, date_from=None, date_to=None, before=None, limit=HISTORY_PAGE_SIZE):
+    """
+    Сторінка історії замовлень продавця від найновіших, з накопиченим балансом `current_balance`.
+    `before` - курсор (created_time, id) останнього рядка попередньої сторінки,
+    `date_from`/`date_to` - межі created_time (date_to не включно).
+    Повертає (rows, next_cursor); next_cursor None, якщо старіших замовлень немає.
+    """
+    seller_id = Sellers.objects.filter(auth_user_id=user_id).values_list('id', flat=True).first()
+    if seller_id is None:
+        return [], None
+
+    orders = SoldOrders.objects.filter(seller_id=seller_id)
+    if date_to is not None:
+        orders = orders.filter(created_time__lt=date_to)
+    if before is not None:
+        created_time, order_id = before
+        orders = orders.filter(Q(created_time__lt=created_time) | Q(created_time=created_time, id__lt=order_id))
+
+    # Вікно рахує суму по всіх старіших рядках, що лишилися після фільтрів: курсор та date_to
+    # відсікають лише новіші замовлення, тож баланс не змінюється від сторінки до сторінки
+    balance_before = 0
+    if date_from is not None:
+        balance_before = SoldOrders.objects.filter(
+            seller_id=seller_id, created_time__lt=date_from,
+        ).aggregate(total=Sum(_UNPAID_EARNED))['total'] or 0
+        orders = orders.filter(created_time__gte=date_from)
+
+    rows = list(
+        orders
+        .annotate(running_balance=Window(Sum(_UNPAID_EARNED), order_by=[F('created_time').asc(), F('id').asc()],
+                                         frame=RowRange(start=None, end=0)))
+        .order_by('-created_time', '-id')
+        .values(*HISTORY_FIELDS, 'running_balance')[:limit + 1]
+    )
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = (rows[-1]['created_time'], rows[-1]['id'])
+    for row in rows:
+        row['current_balance'] = (row.pop('running_balance') or 0) + balance_before
+    return rows, next_cursor
+
+
 def get_server_id(user_id):
     seller_id = Sellers.objects.get(auth_user_id=user_id)
     try:
@@ -310,19 +516,75 @@ def get_server_id(user_id):
     return server_id
 
 
-def create_video_filename(request, sold_order_number):
-    logger.info('inside')
-    sold_order = SoldOrders.objects.filter(sold_order_number=sold_order_number,).select_related('server').first()
-    sent_gold = request.POST.get('sent_gold')
-    seller = request.user
+def get_order_waiting_video(user_id, sold_order_number):
+    return (SoldOrders.objects
+            .filter(sold_order_number=sold_order_number, seller__auth_user_id=user_id, download_video_status=False)
+            .select_related('server', 'seller__auth_user')
+            .first())
+
+
+def start_video_upload(sold_order, size, sent_gold, checksum=''):
+    # Повторний запит на те саме замовлення продовжує незавершене завантаження, а не починає з нуля
+    upload = (VideoUpload.objects
+              .filter(sold_order=sold_order, seller_id=sold_order.seller_id, size=size, sent_gold=sent_gold,
+                      checksum=checksum, status=VideoUpload.STATUS_UPLOADING)
+              .order_by('-id')
+              .first())
+    if upload is None:
+        upload = VideoUpload(sold_order=sold_order, seller_id=sold_order.seller_id, size=size,
+                             sent_gold=sent_gold, checksum=checksum)
+        upload.path = create_part_file(upload.upload_id)
+        upload.save()
+        logger.info("Video upload %s started for order %s", upload.upload_id, sold_order.sold_order_number)
+    return upload
+
+
+def get_video_upload(user_id, upload_id):
+    return (VideoUpload.objects
+            .filter(upload_id=upload_id, seller__auth_user_id=user_id)
+            .select_related('sold_order__server', 'seller__auth_user')
+            .first())
+
+
+def advance_video_upload(upload, offset):
+    # Викликається під upload_lock; умова по offset - запобіжник, якщо блокування обійшли
+    return VideoUpload.objects.filter(id=upload.id, offset=upload.offset).update(
+        offset=offset, updated_time=timezone.now()
+    )
+
+
+def discard_video_upload(upload):
+    # Зіпсований файл не продовжуємо: наступна спроба почне завантаження заново
+    if os.path.exists(upload.path):
+        os.remove(upload.path)
+    remove_upload_lock(upload.path)
+    upload.delete()
+
+
+def get_order_video(order_id):
+    return (SoldOrders.objects.filter(id=order_id)
+            .select_related('seller')
+            .only('id', 'path_to_video', 'video_review_path', 'video_thumbnail', 'seller__auth_user_id')
+            .first())
+
+
+def get_stored_video(path):
+    return StoredVideo.objects.filter(path=path).first() if path else None
 
-    server = sold_order.server.server_name
-    game = sold_order.server.game_name
-    current_time = datetime.now().strftime("%Y-%m-%d___%H-%M")
 
-    filename = f"{seller}__{sent_gold}__{server}__{game}__{sold_order_number}__{current_time}.mp4"
-    logger.info(filename)
-    return filename
+def get_stale_video_uploads(days):
+    return list(VideoUpload.objects.filter(status=VideoUpload.STATUS_UPLOADING,
+                                           updated_time__lt=timezone.now() - timedelta(days=days)))
+
+
+def get_active_video_upload_paths():
+    return list(VideoUpload.objects.filter(status=VideoUpload.STATUS_UPLOADING).values_list('path', flat=True))
+
+
+def complete_video_upload(upload, path):
+    VideoUpload.objects.filter(id=upload.id).update(
+        status=VideoUpload.STATUS_COMPLETE, path=path, updated_time=timezone.now()
+    )
 
 
 def get_balance(user_id):
@@ -331,7 +593,7 @@ def get_balance(user_id):
     try:
         seller_id = Sellers.objects.get(auth_user_id=user_id)
     except Sellers.DoesNotExist:
-        logger.error(f"Seller with auth_user_id {user_id} does not exist.")
+        logger.error("Seller with auth_user_id %s does not exist.", user_id)
         return 0
 
     total_earned = SoldOrders.objects.filter(
@@ -351,7 +613,29 @@ def get_balance(user_id):
     return round(total_earned, 2)
 
 
+def get_cached_balance(user_id):
+    # Баланс з Sellers.balance, який підтримує main.ledger, замість суми по SoldOrders
+    seller_id = seller_ids_cache.get(
+        user_id, lambda: Sellers.objects.filter(auth_user_id=user_id).values_list('id', flat=True).first()
+    )
+    if seller_id is None:
+        return 0
+    # У записах власника та технічного адміністратора зберігаються їхні комісії, а не заробіток продавця
+    if seller_id in ledger.SERVICE_SELLER_IDS:
+        return get_balance(user_id)
+
+    def load_balance():
+        balance = Sellers.objects.filter(id=seller_id).values_list('balance', flat=True).first()
+        return round(float(balance or 0), 2)
+
+    return balance_cache.get(seller_id, load_balance)
+
+
 def get_exchange_commission():
+    return commission_cache.get('current', load_exchange_commission)
+
+
+def load_exchange_commission():
     # Отримання останнього запису з `Commission`
     try:
         rang_exchange = Commission.objects.latest('created_time').commission
@@ -361,21 +645,104 @@ def get_exchange_commission():
     return rang_exchange
 
 
+def get_seller_interest_rates(auth_user_id):
+    # Ставки продавця по всіх серверах: {server_id: interest_rate}
+    return interest_rates_cache.get(auth_user_id, lambda: load_seller_interest_rates(auth_user_id))
+
+
+def load_seller_interest_rates(auth_user_id):
+    return dict(
+        SellerServerInterestRate.objects.filter(seller__auth_user_id=auth_user_id)
+        .order_by('-id')
+        .values_list('server_id', 'interest_rate')
+    )
+
+
 def get_interest_rate_by_user_id(auth_user_id, server_id):
-    logger.info(f"auth_user_id__{auth_user_id}, server_id__{server_id}")
-    # Отримання `interest_rate` з `Sellers`
-    try:
-        seller_id = Sellers.objects.get(auth_user_id=auth_user_id)
-        logger.info(f"seller_id__{seller_id}")
-        seller_rate = SellerServerInterestRate.objects.filter(seller_id=seller_id, server_id=server_id).first()
-        if not seller_rate or seller_rate.interest_rate is None:
-            interest_rate = 0
-            logger.info(f"Ставка відсутня для seller_id={seller_id} та server_id={server_id}.")
-            return interest_rate
-    except ObjectDoesNotExist:
-        logger.error(f"Запис SellerServerInterestRate не знайдено для seller_id={seller_id} та server_id={server_id}.")
-        return None
-    return seller_rate.interest_rate
+    interest_rate = get_seller_interest_rates(auth_user_id).get(server_id)
+    if interest_rate is None:
+        logger.info("Ставка відсутня для auth_user_id=%s та server_id=%s.", auth_user_id, server_id)
+        return 0
+    return interest_rate
+
+
+def invalidate_interest_rates(seller_ids):
+    # Скидаємо кеш ставок для продавців, у яких змінились ставки
+    auth_user_ids = Sellers.objects.filter(id__in=seller_ids).values_list('auth_user_id', flat=True)
+    for auth_user_id in auth_user_ids:
+        interest_rates_cache.invalidate(auth_user_id)
+
+
+def get_interest_rate_matrix(game_name=None, username=None, max_sellers=50):
+    """
+    Дані редактора ставок продавці x сервери: (sellers, servers, rates, truncated),
+    rates - {(seller_id, server_id): interest_rate}. Усі ставки - одним запитом.
+    """
+    servers = ServerUrls.objects.order_by('game_name', 'server_name')
+    if game_name:
+        servers = servers.filter(game_name=game_name)
+    sellers = Sellers.objects.exclude(id__in=ledger.SERVICE_SELLER_IDS).order_by('auth_user__username')
+    if username:
+        sellers = sellers.filter(auth_user__username__icontains=username)
+
+    servers = list(servers.values('id', 'server_name', 'game_name'))
+    sellers = list(sellers.values('id', 'auth_user__username')[:max_sellers + 1])
+    truncated = len(sellers) > max_sellers
+    sellers = sellers[:max_sellers]
+
+    rates = {}
+    # Як і load_seller_interest_rates, при дублікатах пари діє найстаріший запис
+    for seller_id, server_id, interest_rate in (
+        SellerServerInterestRate.objects
+        .filter(seller_id__in=[seller['id'] for seller in sellers], server_id__in=[server['id'] for server in servers])
+        .order_by('-id')
+        .values_list('seller_id', 'server_id', 'interest_rate')
+    ):
+        rates[(seller_id, server_id)] = interest_rate
+    return sellers, servers, rates, truncated
+
+
+def save_interest_rate_matrix(cells):
+    """
+    Зберігає клітинки матриці ставок {(seller_id, server_id): interest_rate або None} однією транзакцією:
+    bulk_update змінених, bulk_create нових, видалення очищених. Повертає (updated, created, deleted).
+    """
+    seller_ids = {seller_id for seller_id, _ in cells}
+    server_ids = {server_id for _, server_id in cells}
+    with transaction.atomic():
+        existing = {}
+        for rate in SellerServerInterestRate.objects.filter(seller_id__in=seller_ids, server_id__in=server_ids):
+            if (rate.seller_id, rate.server_id) in cells:
+                existing.setdefault((rate.seller_id, rate.server_id), []).append(rate)
+
+        to_update, to_create, to_delete = [], [], []
+        changed_sellers = set()
+        for (seller_id, server_id), interest_rate in cells.items():
+            rows = existing.get((seller_id, server_id), [])
+            if interest_rate is None:
+                changed = [row.id for row in rows]
+                to_delete.extend(changed)
+            elif not rows:
+                changed = [SellerServerInterestRate(seller_id=seller_id, server_id=server_id,
+                                                    interest_rate=interest_rate)]
+                to_create.extend(changed)
+            else:
+                changed = [row for row in rows if row.interest_rate != interest_rate]
+                for row in changed:
+                    row.interest_rate = interest_rate
+                to_update.extend(changed)
+            if changed:
+                changed_sellers.add(seller_id)
+
+        SellerServerInterestRate.objects.bulk_update(to_update, ['interest_rate'], batch_size=500)
+        SellerServerInterestRate.objects.bulk_create(to_create, batch_size=500)
+        if to_delete:
+            SellerServerInterestRate.objects.filter(id__in=to_delete).delete()
+
+        # bulk-операції не надсилають post_save, тож кеш ставок скидаємо тут, після коміту
+        if changed_sellers:
+            transaction.on_commit(lambda: invalidate_interest_rates(changed_sellers))
+    return len(to_update), len(to_create), len(to_delete)
 
 
 def update_seller_balance(seller_id):
@@ -387,13 +754,14 @@ def update_seller_balance(seller_id):
         charged_to_payment=True,
         paid_in_salary=False,
     ).aggregate(total_earned=Sum(target_field))['total_earned']
-    logger.info(f"sum_total_earned__{total_earned}")
+    logger.info("sum_total_earned__%s", total_earned)
     # If no records are found, total_earned will be None. Set it to 0 in that case.
     if total_earned is None:
         total_earned = 0
 
     # Step 2: Update the seller's balance
     Sellers.objects.filter(id=seller_id).update(balance=total_earned)
+    ledger.invalidate_balance(seller_id)
 
     return 'Balance updated successfully.'
 
@@ -407,7 +775,7 @@ def update_owner_balance():
         charged_to_payment=True,
         paid_to_owner=False
     ).aggregate(total_earned=Sum(target_field, output_field=DecimalField()))['total_earned']
-    logger.info(f"owner_sum_total_earned__{total_earned}")
+    logger.info("owner_sum_total_earned__%s", total_earned)
     # If no records are found, total_earned will be None. Set it to 0 in that case.
     if total_earned is None:
         total_earned = 0
@@ -422,18 +790,12 @@ def update_technical_balance():
     target_field = 'technical_commission'
     technical_id = 2
 
-    check_coma = SoldOrders.objects.filter(
-        charged_to_payment=True,
-        paid_to_technical=False
-    )
-    for row in check_coma:
-        logger.info(f"row.technical_commission__{row.technical_commission}")
     # Step 1: Calculate the total earned_without_admins_commission for the specific seller
     total_earned = SoldOrders.objects.filter(
         charged_to_payment=True,
         paid_to_technical=False
     ).aggregate(total_earned=Sum(target_field, output_field=DecimalField()))['total_earned']
-    logger.info(f"technical_sum_total_earned__{total_earned}")
+    logger.info("technical_sum_total_earned__%s", total_earned)
 
     # If no records are found, total_earned will be None. Set it to 0 in that case.
     if total_earned is None:
@@ -445,15 +807,107 @@ def update_technical_balance():
     return 'Balance updated successfully.'
 
 
-def update_stock_table(row_id, description):
-    offer = OffersForPlacement.objects.get(id=row_id)
-    stock_row = ChangeStockHistory.objects.create(
-        seller_id=offer.sellers.id,
-        server_id=offer.server_urls.id,
-        stock=offer.stock,
-        active_rate_record=offer.active_rate,
-        description=description,
-        created_time=timezone.now()
+def enqueue_telegram_messages(messages):
+    # Незбережені TelegramOutbox одним INSERT
+    return TelegramOutbox.objects.bulk_create(messages)
+
+
+def claim_pending(model, limit, **claimed):
+    """
+    Забирає до `limit` готових до обробки рядків черги `model` у статусі pending і оновлює їх полями `claimed`.
+    Повертає лише рядки, які забрав саме цей виклик, тож паралельні диспетчери чи воркери не отримають
+    один рядок двічі.
+    """
+    pending = (model.objects.filter(status=model.STATUS_PENDING, next_attempt_time__lte=timezone.now())
+               .order_by('next_attempt_time', 'id'))
+    with transaction.atomic():
+        if connection.features.has_select_for_update_skip_locked:
+            rows = list(pending.select_for_update(skip_locked=True)[:limit])
+            model.objects.filter(id__in=[row.id for row in rows]).update(**claimed)
+            return rows
+        # SQLite не блокує окремі рядки: рядок забирає умовний UPDATE, який нічого не змінить,
+        # якщо інший процес уже встиг забрати цей рядок після SELECT
+        return [row for row in pending[:limit]
+                if model.objects.filter(id=row.id, status=model.STATUS_PENDING).update(**claimed)]
+
+
+def claim_telegram_messages(limit):
+    # Забирає повідомлення, готові до відправки, і позначає їх як такі, що надсилаються
+    return claim_pending(TelegramOutbox, limit, status=TelegramOutbox.STATUS_SENDING, claimed_time=timezone.now())
+
+
+def release_stale_telegram_messages(claim_timeout):
+    """
+    Повертає в чергу повідомлення, забрані понад `claim_timeout` секунд тому: їхній диспетчер зупинився.
+    Повідомлення, які зараз надсилає інший диспетчер, не чіпаються.
+    """
+    return TelegramOutbox.objects.filter(
+        Q(claimed_time__lt=timezone.now() - timedelta(seconds=claim_timeout)) | Q(claimed_time__isnull=True),
+        status=TelegramOutbox.STATUS_SENDING,
+    ).update(status=TelegramOutbox.STATUS_PENDING)
+
+
+def mark_telegram_message_sent(message):
+    # Одразу після відправки: якщо диспетчер зупиниться, надіслане вже не повториться
+    with transaction.atomic():
+        TelegramOutbox.objects.filter(id=message.id).update(
+            status=TelegramOutbox.STATUS_SENT, attempts=F('attempts') + 1, last_error='', sent_time=timezone.now()
+        )
+        if message.sold_order_id:
+            SoldOrders.objects.filter(id=message.sold_order_id).update(send_message=True)
+
+
+def mark_telegram_message_failed(message, error, retry_delay=None):
+    # Без `retry_delay` повідомлення більше не надсилається
+    fields = {'attempts': F('attempts') + 1, 'last_error': str(error)}
+    if retry_delay is None:
+        fields['status'] = TelegramOutbox.STATUS_FAILED
+    else:
+        fields['status'] = TelegramOutbox.STATUS_PENDING
+        fields['next_attempt_time'] = timezone.now() + timedelta(seconds=retry_delay)
+    TelegramOutbox.objects.filter(id=message.id).update(**fields)
+
+
+def claim_video_jobs(limit):
+    # Забирає відео, що очікують обробки, і позначає їх як такі, що обробляються
+    return claim_pending(VideoProcessingJob, limit, status=VideoProcessingJob.STATUS_PROCESSING,
+                         attempts=F('attempts') + 1, claimed_time=timezone.now())
+
+
+def renew_video_jobs(jobs):
+    # Продовжує оренду відео, які ще обробляються
+    return VideoProcessingJob.objects.filter(id__in=[job.id for job in jobs],
+                                             status=VideoProcessingJob.STATUS_PROCESSING).update(
+        claimed_time=timezone.now()
     )
-    stock_row.save()
-    logger.info("New record to stock table created.")
+
+
+def release_stale_video_jobs(lease_timeout):
+    """
+    Повертає в чергу відео, оренду яких не продовжували понад `lease_timeout` секунд: їхній воркер зупинився.
+    Відео, які зараз обробляє інший воркер, не чіпаються.
+    """
+    return VideoProcessingJob.objects.filter(
+        Q(claimed_time__lt=timezone.now() - timedelta(seconds=lease_timeout)) | Q(claimed_time__isnull=True),
+        status=VideoProcessingJob.STATUS_PROCESSING,
+    ).update(status=VideoProcessingJob.STATUS_PENDING)
+
+
+def finish_video_job(job, result):
+    with transaction.atomic():
+        # Замовлення могло отримати нове відео, поки оброблялось старе
+        SoldOrders.objects.filter(id=job.sold_order_id, path_to_video=job.path).update(**result)
+        VideoProcessingJob.objects.filter(id=job.id).update(
+            status=VideoProcessingJob.STATUS_DONE, last_error='', finished_time=timezone.now()
+        )
+
+
+def fail_video_job(job, error, retry_delay=None):
+    # Без `retry_delay` відео більше не обробляється
+    fields = {'last_error': str(error)}
+    if retry_delay is None:
+        fields.update(status=VideoProcessingJob.STATUS_FAILED, finished_time=timezone.now())
+    else:
+        fields.update(status=VideoProcessingJob.STATUS_PENDING,
+                      next_attempt_time=timezone.now() + timedelta(seconds=retry_delay))
+    VideoProcessingJob.objects.filter(id=job.id).update(**fields)
@@ -0,0 +1,117 @@
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F, Sum, DecimalField
+
+from .models import Sellers, SoldOrders
+from .utils.cache import balance_cache
+from .utils.logger_config import get_logger
+
+logger = get_logger(__name__)
+
+# Баланси власника та технічного адміністратора зберігаються в записах Sellers з цими id
+OWNER_SELLER_ID = 1
+TECHNICAL_SELLER_ID = 2
+SERVICE_SELLER_IDS = {OWNER_SELLER_ID, TECHNICAL_SELLER_ID}
+
+
+def add_to_balance(seller_id, delta):
+    # Атомарна зміна балансу на різницю замість повного перерахунку суми
+    if delta:
+        Sellers.objects.filter(id=seller_id).update(balance=F('balance') + delta)
+        invalidate_balance(seller_id)
+
+
+def invalidate_balance(seller_id):
+    # Скидаємо кеш після коміту, щоб паралельний запит не закешував старе значення
+    transaction.on_commit(lambda: balance_cache.invalidate(seller_id))
+
+
+def charge_order(order):
+    """
+    Додає суми щойно зарахованого до оплати замовлення до балансів продавця, власника
+    та технічного адміністратора. Викликається в тій самій транзакції, що й оновлення замовлення.
+    """
+    if not order.paid_in_salary and order.seller_id not in SERVICE_SELLER_IDS:
+        add_to_balance(order.seller_id, order.earned_without_admins_commission)
+    if not order.paid_to_owner:
+        add_to_balance(OWNER_SELLER_ID, order.owner_commission)
+    if not order.paid_to_technical:
+        add_to_balance(TECHNICAL_SELLER_ID, order.technical_commission)
+    logger.info("Order %s charged to balances of seller %s", order.sold_order_number, order.seller_id)
+
+
+def pay_sellers(queryset):
+    # Позначає замовлення виплаченими продавцям і віднімає виплачене з їхніх балансів
+    with transaction.atomic():
+        orders = SoldOrders.objects.filter(pk__in=queryset.values('pk'))
+        paid_by_seller = list(
+            orders.filter(charged_to_payment=True, paid_in_salary=False)
+            .order_by()
+            .values('seller_id')
+            .annotate(total=Sum('earned_without_admins_commission'))
+        )
+        updated_count = orders.update(paid_in_salary=True)
+        for row in paid_by_seller:
+            if row['seller_id'] not in SERVICE_SELLER_IDS:
+                add_to_balance(row['seller_id'], -row['total'])
+    return updated_count
+
+
+def pay_owner(queryset):
+    return _pay_service_commission(queryset, 'paid_to_owner', 'owner_commission', OWNER_SELLER_ID)
+
+
+def pay_technical(queryset):
+    return _pay_service_commission(queryset, 'paid_to_technical', 'technical_commission', TECHNICAL_SELLER_ID)
+
+
+def _pay_service_commission(queryset, paid_field, amount_field, balance_seller_id):
+    with transaction.atomic():
+        orders = SoldOrders.objects.filter(pk__in=queryset.values('pk'))
+        total = orders.filter(charged_to_payment=True, **{paid_field: False}).aggregate(
+            total=Sum(amount_field, output_field=DecimalField())
+        )['total']
+        updated_count = orders.update(**{paid_field: True})
+        if total:
+            add_to_balance(balance_seller_id, -total)
+    return updated_count
+
+
+def get_expected_balances():
+    # Баланси, перераховані з нуля по SoldOrders: {seller_id: сума}
+    expected = {
+        row['seller_id']: row['total']
+        for row in SoldOrders.objects.filter(charged_to_payment=True, paid_in_salary=False)
+        .exclude(seller_id__in=SERVICE_SELLER_IDS)
+        .order_by()
+        .values('seller_id')
+        .annotate(total=Sum('earned_without_admins_commission'))
+    }
+    expected[OWNER_SELLER_ID] = SoldOrders.objects.filter(charged_to_payment=True, paid_to_owner=False).aggregate(
+        total=Sum('owner_commission', output_field=DecimalField())
+    )['total']
+    expected[TECHNICAL_SELLER_ID] = SoldOrders.objects.filter(
+        charged_to_payment=True, paid_to_technical=False
+    ).aggregate(total=Sum('technical_commission', output_field=DecimalField()))['total']
+    return expected
+
+
+def reconcile_balances(fix=False):
+    """
+    Звіряє збережені баланси з перерахованими по SoldOrders.
+    Повертає {seller_id: (збережений, очікуваний)} для розбіжностей; з `fix=True` виправляє їх.
+    """
+    expected = get_expected_balances()
+    mismatches = {}
+    for seller_id, balance in Sellers.objects.values_list('id', 'balance'):
+        expected_balance = round(Decimal(expected.get(seller_id) or 0), 3)
+        if round(Decimal(balance), 3) != expected_balance:
+            mismatches[seller_id] = (balance, expected_balance)
+
+    for seller_id, (balance, expected_balance) in mismatches.items():
+        logger.warning("Balance mismatch for seller %s: stored %s, expected %s", seller_id, balance, expected_balance)
+        if fix:
+            Sellers.objects.filter(id=seller_id).update(balance=expected_balance)
+            invalidate_balance(seller_id)
+    return mismatches
@@ -0,0 +1,192 @@
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.db.models import Sum, DecimalField
+from django.test.utils import CaptureQueriesContext
+
+from main.models import Sellers, ServerUrls, SoldOrders
+
+BENCHMARK_ALIAS = 'sold_orders_benchmark'
+BATCH_SIZE = 50_000
+
+
+class Command(BaseCommand):
+    help = ("Порівнює плани та час гарячих запитів до SoldOrders без індексів і з індексами "
+            "на синтетичній базі SQLite (робоча база не змінюється)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=1_000_000)
+        parser.add_argument('--sellers', type=int, default=2_000)
+        parser.add_argument('--servers', type=int, default=200)
+        parser.add_argument('--unpaid-share', type=float, default=0.02,
+                            help="Частка замовлень, ще не виплачених продавцям")
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--database-file', help="Файл SQLite для синтетичних даних (за замовчуванням тимчасовий)")
+        parser.add_argument('--json', action='store_true', help="Вивести результат у форматі JSON")
+
+    def handle(self, *args, **options):
+        default = connections['default']
+        if default.vendor != 'sqlite':
+            raise CommandError("Бенчмарк планів запитів підтримує лише SQLite")
+
+        # Тимчасова тека видаляється разом із базою та її файлами -journal/-wal
+        temp_dir = None
+        if options['database_file']:
+            path = options['database_file']
+            if os.path.exists(path):
+                raise CommandError(f"Файл {path} вже існує")
+        else:
+            temp_dir = tempfile.TemporaryDirectory()
+            path = os.path.join(temp_dir.name, 'sold_orders_benchmark.sqlite3')
+
+        connections.settings[BENCHMARK_ALIAS] = {**default.settings_dict, 'NAME': path}
+        connection = connections[BENCHMARK_ALIAS]
+        rnd = random.Random(options['seed'])
+        try:
+            self.create_schema(connection)
+            started = time.perf_counter()
+            self.populate(connection, rnd, options)
+            self.stderr.write(f"Згенеровано {options['orders']} замовлень за {time.perf_counter() - started:.1f} с")
+
+            self.set_indexes(connection, enabled=False)
+            before = self.run_queries(connection, rnd, options)
+            self.set_indexes(connection, enabled=True)
+            after = self.run_queries(connection, rnd, options)
+        finally:
+            connection.close()
+            del connections[BENCHMARK_ALIAS]
+            if temp_dir is not None:
+                temp_dir.cleanup()
+
+        results = {
+            'orders': options['orders'],
+            'sellers': options['sellers'],
+            'queries': {name: {'before': before[name], 'after': after[name]} for name in before},
+        }
+        if options['json']:
+            self.stdout.write(json.dumps(results, ensure_ascii=False, indent=2))
+            return
+
+        for name, result in results['queries'].items():
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            self.stdout.write(f"  без індексів: {result['before']['median_ms']:.3f} мс")
+            for line in result['before']['plan']:
+                self.stdout.write(f"    {line}")
+            self.stdout.write(f"  з індексами:  {result['after']['median_ms']:.3f} мс")
+            for line in result['after']['plan']:
+                self.stdout.write(f"    {line}")
+
+    @staticmethod
+    def create_schema(connection):
+        with connection.schema_editor() as editor:
+            for model in (User, Sellers, ServerUrls, SoldOrders):
+                editor.create_model(model)
+
+    @staticmethod
+    def set_indexes(connection, enabled):
+        with connection.schema_editor() as editor:
+            for index in SoldOrders._meta.indexes:
+                if enabled:
+                    editor.add_index(SoldOrders, index)
+                else:
+                    editor.remove_index(SoldOrders, index)
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE sold_orders")
+
+    @staticmethod
+    def populate(connection, rnd, options):
+        sellers_count, servers_count, orders_count = options['sellers'], options['servers'], options['orders']
+        paid_until = int(orders_count * (1 - options['unpaid_share']))
+
+        with transaction.atomic(using=BENCHMARK_ALIAS), connection.cursor() as cursor:
+            cursor.executemany(
+                "INSERT INTO auth_user (password, is_superuser, username, first_name, last_name, email, is_staff,"
+                " is_active, date_joined) VALUES ('', 0, %s, '', '', '', 0, 1, '2025-01-01 00:00:00')",
+                [(f"seller_{i}",) for i in range(sellers_count)],
+            )
+            cursor.executemany(
+                "INSERT INTO sellers (id_telegram, auth_user_id, balance) VALUES (NULL, %s, 0)",
+                [(i + 1,) for i in range(sellers_count)],
+            )
+            cursor.executemany(
+                "INSERT INTO server_urls (server_name, game_name, server_url, region, fraction)"
+                " VALUES (%s, 'game', 'https://example.com', 'EU', 'Alliance')",
+                [(f"server_{i}",) for i in range(servers_count)],
+            )
+
+            insert_order = (
+                "INSERT INTO sold_orders (server_id, seller_id, status, bought_by, character_name, sold_order_number,"
+                " quantity, sent_gold, price_unit, total_amount, comission_fee, earned_without_admins_commission,"
+                " owner_commission, technical_commission, to_be_earned, trade_mode, created_time, send_message,"
+                " path_to_video, download_video_status, send_video_status, charged_to_payment, paid_in_salary,"
+                " paid_to_owner, paid_to_technical)"
+                " VALUES (%s, %s, 'DELIVERING', 'buyer', 'character', %s, 1000, 1000, '0.010', '10.000', '1.000',"
+                " '7.000', '1.500', '0.500', '9.000', 'Mail', %s, 1, '', %s, 0, %s, %s, %s, %s)"
+            )
+            batch = []
+            for number in range(orders_count):
+                paid = number < paid_until
+                charged = paid or rnd.random() < 0.8
+                batch.append((
+                    rnd.randint(1, servers_count),
+                    rnd.randint(1, sellers_count),
+                    10_000_000 + number,
+                    f"2025-01-01 00:00:{number % 60:02d}",
+                    charged,
+                    charged,
+                    paid,
+                    paid,
+                    paid,
+                ))
+                if len(batch) == BATCH_SIZE:
+                    cursor.executemany(insert_order, batch)
+                    batch = []
+            if batch:
+                cursor.executemany(insert_order, batch)
+
+    def run_queries(self, connection, rnd, options):
+        orders = SoldOrders.objects.using(BENCHMARK_ALIAS)
+        hot_queries = {
+            'get_balance / update_seller_balance': lambda seller_id, number: orders.filter(
+                seller_id=seller_id, charged_to_payment=True, paid_in_salary=False,
+            ).aggregate(total_earned=Sum('earned_without_admins_commission')),
+            'update_owner_balance': lambda seller_id, number: orders.filter(
+                charged_to_payment=True, paid_to_owner=False,
+            ).aggregate(total_earned=Sum('owner_commission', output_field=DecimalField())),
+            'update_technical_balance': lambda seller_id, number: orders.filter(
+                charged_to_payment=True, paid_to_technical=False,
+            ).aggregate(total_earned=Sum('technical_commission', output_field=DecimalField())),
+            'get_order_info': lambda seller_id, number: orders.filter(
+                seller_id=seller_id, download_video_status=False,
+            ).select_related('server').first(),
+            'sold_order_number': lambda seller_id, number: list(
+                orders.filter(sold_order_number=number).values_list('id', flat=True)
+            ),
+        }
+
+        results = {}
+        for name, query in hot_queries.items():
+            timings = []
+            for _ in range(options['repeat']):
+                seller_id = rnd.randint(1, options['sellers'])
+                number = 10_000_000 + rnd.randrange(options['orders'])
+                started = time.perf_counter()
+                query(seller_id, number)
+                timings.append((time.perf_counter() - started) * 1000)
+
+            with CaptureQueriesContext(connection) as captured:
+                query(1, 10_000_000)
+            with connection.cursor() as cursor:
+                cursor.execute(f"EXPLAIN QUERY PLAN {captured.captured_queries[-1]['sql']}")
+                plan = [row[-1] for row in cursor.fetchall()]
+
+            results[name] = {'median_ms': statistics.median(timings), 'plan': plan}
+        return results
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from main import stock_history
+
+
+class Command(BaseCommand):
+    help = ("Згортає рядки історії зміни стоку, старші за --days днів, у підсумки по днях "
+            "(продавець, сервер, день) і видаляє згорнуті рядки")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=stock_history.STOCK_HISTORY_RETENTION_DAYS,
+                            help="Скільки останніх днів історії зберігати без згортання")
+        parser.add_argument('--dry-run', action='store_true', help="Лише показати дні, які буде згорнуто")
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            days = stock_history.days_to_compact(options['days'])
+            if days:
+                self.stdout.write(f"Буде згорнуто днів: {len(days)}, з {days[0]} по {days[-1]}")
+            else:
+                self.stdout.write("Немає рядків для згортання")
+            return
+
+        summaries, deleted = stock_history.compact_stock_history(options['days'])
+        self.stdout.write(f"Згорнуто рядків: {deleted}, підсумків по днях: {summaries}")
@@ -0,0 +1,152 @@
+import json
+import multiprocessing
+import os
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+
+from web_resource_g2g.database import sqlite_busy_timeout, sqlite_pragmas
+
+# Профілі з'єднання: як було (налаштування sqlite3 за замовчуванням, як у Django без OPTIONS) і як стало
+PROFILES = {
+    'default': {'pragmas': (), 'timeout': 5.0, 'begin': 'BEGIN'},
+    'tuned': {'pragmas': sqlite_pragmas(), 'timeout': sqlite_busy_timeout(), 'begin': 'BEGIN IMMEDIATE'},
+}
+
+
+def connect(path, profile):
+    connection = sqlite3.connect(path, timeout=profile['timeout'], isolation_level=None)
+    for pragma in profile['pragmas']:
+        connection.execute(pragma)
+    return connection
+
+
+def writer(path, profile, operations, sellers, start, results):
+    # Як update_sold_order_when_video_download: читання замовлення, потім запис у тій самій транзакції
+    connection = connect(path, profile)
+    start.wait()
+    latencies, errors = [], 0
+    for number in range(operations):
+        seller_id = number % sellers + 1
+        started = time.perf_counter()
+        try:
+            connection.execute(profile['begin'])
+            connection.execute("SELECT balance FROM sellers WHERE id = ?", (seller_id,)).fetchone()
+            connection.execute("UPDATE sellers SET balance = balance + 1 WHERE id = ?", (seller_id,))
+            connection.execute("INSERT INTO orders (seller_id, amount) VALUES (?, 1)", (seller_id,))
+            connection.execute("COMMIT")
+            latencies.append((time.perf_counter() - started) * 1000)
+        except sqlite3.OperationalError:
+            errors += 1
+            if connection.in_transaction:
+                connection.execute("ROLLBACK")
+    connection.close()
+    results.put(('write', latencies, errors))
+
+
+def reader(path, profile, operations, sellers, start, results):
+    # Як сторінки продавця: агрегат по замовленнях
+    connection = connect(path, profile)
+    start.wait()
+    latencies, errors = [], 0
+    for number in range(operations):
+        started = time.perf_counter()
+        try:
+            connection.execute("SELECT SUM(amount) FROM orders WHERE seller_id = ?",
+                               (number % sellers + 1,)).fetchone()
+            latencies.append((time.perf_counter() - started) * 1000)
+        except sqlite3.OperationalError:
+            errors += 1
+    connection.close()
+    results.put(('read', latencies, errors))
+
+
+def summarize(latencies, errors):
+    if not latencies:
+        return {'count': 0, 'errors': errors}
+    latencies = sorted(latencies)
+    return {
+        'count': len(latencies),
+        'errors': errors,
+        'p50_ms': round(statistics.median(latencies), 3),
+        'p95_ms': round(latencies[int(len(latencies) * 0.95) - 1], 3),
+        'max_ms': round(latencies[-1], 3),
+    }
+
+
+class Command(BaseCommand):
+    help = ("Вимірює очікування блокувань SQLite при одночасних записувачах і читачах "
+            "для налаштувань з'єднання за замовчуванням та з database.py (робоча база не змінюється)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=4)
+        parser.add_argument('--readers', type=int, default=8)
+        parser.add_argument('--operations', type=int, default=500, help="Операцій на кожен процес")
+        parser.add_argument('--sellers', type=int, default=100)
+        parser.add_argument('--rows', type=int, default=200_000, help="Початкова кількість замовлень")
+        parser.add_argument('--json', action='store_true', help="Вивести результат у форматі JSON")
+
+    def handle(self, *args, **options):
+        results = {name: self.run_profile(name, profile, options) for name, profile in PROFILES.items()}
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for name, result in results.items():
+            self.stdout.write(self.style.MIGRATE_HEADING(f"{name}: {result['seconds']:.2f} с"))
+            for kind in ('write', 'read'):
+                stats = result[kind]
+                self.stdout.write(f"  {kind}: {stats['count']} ок, {stats['errors']} помилок"
+                                  + (f", p50 {stats['p50_ms']} мс, p95 {stats['p95_ms']} мс, max {stats['max_ms']} мс"
+                                     if stats['count'] else ''))
+
+    @staticmethod
+    def prepare_database(path, options):
+        connection = sqlite3.connect(path)
+        connection.executescript("""
+            CREATE TABLE sellers (id INTEGER PRIMARY KEY, balance INTEGER NOT NULL DEFAULT 0);
+            CREATE TABLE orders (id INTEGER PRIMARY KEY, seller_id INTEGER NOT NULL, amount INTEGER NOT NULL);
+            CREATE INDEX orders_seller_idx ON orders (seller_id);
+        """)
+        connection.executemany("INSERT INTO sellers (id) VALUES (?)",
+                               [(i + 1,) for i in range(options['sellers'])])
+        connection.executemany("INSERT INTO orders (seller_id, amount) VALUES (?, 1)",
+                               [(i % options['sellers'] + 1,) for i in range(options['rows'])])
+        connection.commit()
+        connection.close()
+
+    def run_profile(self, name, profile, options):
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, f'{name}.sqlite3')
+        self.prepare_database(path, options)
+
+        start = multiprocessing.Event()
+        results = multiprocessing.Queue()
+        workers = (
+            [multiprocessing.Process(target=writer, args=(path, profile, options['operations'],
+                                                          options['sellers'], start, results))
+             for _ in range(options['writers'])]
+            + [multiprocessing.Process(target=reader, args=(path, profile, options['operations'],
+                                                            options['sellers'], start, results))
+               for _ in range(options['readers'])]
+        )
+        for worker in workers:
+            worker.start()
+        started = time.perf_counter()
+        start.set()
+        collected = {'write': ([], 0), 'read': ([], 0)}
+        for _ in workers:
+            kind, latencies, errors = results.get()
+            collected[kind] = (collected[kind][0] + latencies, collected[kind][1] + errors)
+        elapsed = time.perf_counter() - started
+        for worker in workers:
+            worker.join()
+
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+        os.rmdir(directory)
+        return {'seconds': elapsed, **{kind: summarize(*values) for kind, values in collected.items()}}
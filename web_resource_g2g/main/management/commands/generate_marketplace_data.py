@@ -0,0 +1,259 @@
+import os
+import random
+import time
+from datetime import timedelta
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.utils import timezone
+
+from main.crud import TOP_PRICE_STRATEGIES
+from main.ledger import OWNER_SELLER_ID, TECHNICAL_SELLER_ID
+from main.models import (Commission, Sellers, ServerUrls, TopPrices, OffersForPlacement, SoldOrders,
+                         SellerServerInterestRate, ChangeStockHistory)
+from main.utils.db_triggers import PRICE_COLUMNS, install_top_prices_trigger, refresh_latest_top_prices
+
+GENERATOR_ALIAS = 'marketplace_data'
+BATCH_SIZE = 50_000
+FIRST_ORDER_NUMBER = 10_000_000
+EXCHANGE_COMMISSION = 10
+
+GAMES = ('World of Warcraft Classic', 'World of Warcraft', 'Lost Ark', 'New World')
+REGIONS = ('EU', 'US')
+FRACTIONS = ('Alliance', 'Horde')
+TRADE_MODES = ('Mail', 'Face to Face', 'Auction House')
+
+
+def insert_rows(cursor, model, fields, rows):
+    """executemany у таблицю моделі; колонки беруться з моделі, тож SQL не розходиться зі схемою."""
+    quote = cursor.db.ops.quote_name
+    columns = ', '.join(quote(model._meta.get_field(field).column) for field in fields)
+    sql = (f"INSERT INTO {quote(model._meta.db_table)} ({columns}) "
+           f"VALUES ({', '.join(['%s'] * len(fields))})")
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == BATCH_SIZE:
+            cursor.executemany(sql, batch)
+            batch = []
+    if batch:
+        cursor.executemany(sql, batch)
+
+
+def skewed_weights(rnd, count, alpha=1.2):
+    # Кілька великих продавців і популярних серверів та довгий хвіст, як на біржі
+    return [rnd.paretovariate(alpha) for _ in range(count)]
+
+
+def money(value):
+    return f"{value:.3f}"
+
+
+def db_datetime(value):
+    return value.strftime('%Y-%m-%d %H:%M:%S')
+
+
+class Command(BaseCommand):
+    help = ("Створює окрему базу SQLite із синтетичними даними біржі заданого масштабу "
+            "(сервери, продавці, лоти, замовлення, історія цін і стоку) для manage.py run_benchmarks")
+
+    def add_arguments(self, parser):
+        parser.add_argument('database_file', help="Новий файл SQLite, у який записуються дані")
+        parser.add_argument('--servers', type=int, default=200)
+        parser.add_argument('--sellers', type=int, default=2_000)
+        parser.add_argument('--offers-per-seller', type=int, default=10)
+        parser.add_argument('--orders', type=int, default=1_000_000)
+        parser.add_argument('--top-prices-per-server', type=int, default=1_000,
+                            help="Знімків цін на сервер (парсер пише їх кожні 10 хв)")
+        parser.add_argument('--stock-history', type=int, default=500_000, help="Рядків ChangeStockHistory")
+        parser.add_argument('--days', type=int, default=365, help="За скільки днів розподілені замовлення")
+        parser.add_argument('--unpaid-share', type=float, default=0.02,
+                            help="Частка найновіших замовлень, ще не виплачених продавцям")
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        path = os.path.abspath(options['database_file'])
+        if os.path.exists(path):
+            raise CommandError(f"Файл {path} вже існує")
+        if options['offers_per_seller'] > options['servers']:
+            raise CommandError("--offers-per-seller не може перевищувати --servers")
+
+        connections.settings[GENERATOR_ALIAS] = {**connections['default'].settings_dict,
+                                                 'ENGINE': 'django.db.backends.sqlite3', 'NAME': path}
+        connection = connections[GENERATOR_ALIAS]
+        rnd = random.Random(options['seed'])
+        try:
+            self.create_schema(connection)
+            with transaction.atomic(using=GENERATOR_ALIAS), connection.cursor() as cursor:
+                for step in (self.populate_users, self.populate_servers, self.populate_offers,
+                             self.populate_top_prices, self.populate_orders, self.populate_stock_history,
+                             self.update_balances):
+                    started = time.perf_counter()
+                    step(cursor, rnd, options)
+                    self.stderr.write(f"{step.__name__}: {time.perf_counter() - started:.1f} с")
+            install_top_prices_trigger(connection)
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE")
+        except BaseException:
+            connection.close()
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+            raise
+        finally:
+            connection.close()
+            del connections[GENERATOR_ALIAS]
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Створено {path}: {options['sellers']} продавців, {options['servers']} серверів, "
+            f"{options['orders']} замовлень. Запуск: manage.py run_benchmarks {path}"
+        ))
+
+    @staticmethod
+    def create_schema(connection):
+        # Усі таблиці проєкту, включно з auth, сесіями та адмінкою, без історії міграцій
+        with connection.schema_editor() as editor:
+            for model in apps.get_models():
+                if model._meta.managed and not model._meta.proxy:
+                    editor.create_model(model)
+
+    @staticmethod
+    def populate_users(cursor, rnd, options):
+        from django.contrib.auth.models import User
+
+        joined = db_datetime(timezone.now() - timedelta(days=options['days']))
+        # id 1 - адміністратор (він же власник), 2 - технічний адміністратор, далі продавці
+        users = [('owner', True), ('technical', True)] + [(f"seller_{i}", False) for i in range(options['sellers'])]
+        insert_rows(cursor, User,
+                    ('password', 'is_superuser', 'username', 'first_name', 'last_name', 'email', 'is_staff',
+                     'is_active', 'date_joined'),
+                    (('!', staff, username, '', '', f"{username}@example.com", staff, True, joined)
+                     for username, staff in users))
+        insert_rows(cursor, Sellers, ('id', 'id_telegram', 'auth_user', 'balance'),
+                    ((number, str(100_000 + number), number, '0') for number in range(1, len(users) + 1)))
+        insert_rows(cursor, Commission, ('commission', 'created_time'), [(EXCHANGE_COMMISSION, joined)])
+
+    @staticmethod
+    def populate_servers(cursor, rnd, options):
+        insert_rows(cursor, ServerUrls, ('server_name', 'game_name', 'server_url', 'region', 'fraction'),
+                    ((f"Server {number}", GAMES[number % len(GAMES)], f"https://www.g2g.com/offer/server-{number}",
+                      REGIONS[number % len(REGIONS)], FRACTIONS[number % len(FRACTIONS)])
+                     for number in range(options['servers'])))
+
+    @staticmethod
+    def seller_ids(options):
+        return range(TECHNICAL_SELLER_ID + 1, TECHNICAL_SELLER_ID + 1 + options['sellers'])
+
+    def populate_offers(self, cursor, rnd, options):
+        offers, rates = [], []
+        server_ids = range(1, options['servers'] + 1)
+        for seller_id in self.seller_ids(options):
+            servers = rnd.sample(server_ids, options['offers_per_seller'])
+            # Спільна ставка на сервері - у кожного п'ятого продавця на одному з його серверів
+            active_server = servers[0] if rnd.random() < 0.2 else None
+            for server_id in servers:
+                offers.append((
+                    seller_id, server_id, 'USD', 'Fast delivery, safe gold', rnd.choice(TOP_PRICE_STRATEGIES),
+                    rnd.randint(0, 500) * 1000, rnd.choice((0, 1000, 5000)), server_id == active_server,
+                    rnd.randint(-5, 5), rnd.choice((3, 7, 14)), True, True, rnd.random() < 0.5, 1, 6,
+                    rnd.random() < 0.9, 0, False,
+                ))
+                rates.append((seller_id, server_id, rnd.randint(70, 90)))
+        insert_rows(cursor, OffersForPlacement,
+                    ('sellers', 'server_urls', 'currency', 'description', 'price', 'stock', 'min_units_per_order',
+                     'active_rate', 'percent_offset', 'duration', 'face_to_face_trade', 'mail_delivery',
+                     'auction_house', 'delivery_online_hrs', 'delivery_offline_hrs', 'is_created_lot',
+                     'reserve_stock', 'order_status'),
+                    offers)
+        insert_rows(cursor, SellerServerInterestRate, ('seller', 'server', 'interest_rate'), rates)
+
+    @staticmethod
+    def populate_top_prices(cursor, rnd, options):
+        now = timezone.now()
+        count = options['top_prices_per_server']
+
+        def rows():
+            for snapshot in range(count):
+                created = now - timedelta(minutes=10 * (count - snapshot))
+                for server_id in range(1, options['servers'] + 1):
+                    # Ціна в тисячних долара за 1000 одиниць, з невеликим коливанням між знімками
+                    base = 1000 + server_id * 7 + rnd.randint(-50, 50)
+                    prices = (base, base + 20, base + 40, base + 80, base + 30, base + 60,
+                              base - 10, base + 35, base + 65, (base - 10) * 2)
+                    yield (server_id, *prices, created.strftime('%H:%M:%S'), db_datetime(created))
+
+        insert_rows(cursor, TopPrices, ('server_name',) + PRICE_COLUMNS + ('created_time', 'created_at'), rows())
+        refresh_latest_top_prices(cursor.db)
+
+    def populate_orders(self, cursor, rnd, options):
+        orders_count = options['orders']
+        seller_ids = list(self.seller_ids(options))
+        server_ids = list(range(1, options['servers'] + 1))
+        seller_weights = skewed_weights(rnd, len(seller_ids))
+        server_weights = skewed_weights(rnd, len(server_ids))
+        paid_until = int(orders_count * (1 - options['unpaid_share']))
+        started = timezone.now() - timedelta(days=options['days'])
+        step = timedelta(days=options['days']) / max(orders_count, 1)
+
+        def rows():
+            for first in range(0, orders_count, BATCH_SIZE):
+                size = min(BATCH_SIZE, orders_count - first)
+                sellers = rnd.choices(seller_ids, seller_weights, k=size)
+                servers = rnd.choices(server_ids, server_weights, k=size)
+                for offset in range(size):
+                    number = first + offset
+                    paid = number < paid_until
+                    # Замовлення зараховується до оплати, коли продавець завантажив відео
+                    charged = paid or rnd.random() < 0.8
+                    quantity = rnd.randint(1, 500) * 100
+                    price_unit = rnd.uniform(0.005, 0.05)
+                    total = quantity * price_unit
+                    to_be_earned = total * (100 - EXCHANGE_COMMISSION) / 100
+                    earned = to_be_earned * rnd.randint(70, 90) / 100
+                    commissions = to_be_earned - earned
+                    yield (
+                        servers[offset], sellers[offset], 'DELIVERED' if charged else 'DELIVERING',
+                        f"buyer_{rnd.randrange(100_000)}", f"Character{rnd.randrange(100_000)}",
+                        FIRST_ORDER_NUMBER + number, quantity, quantity if charged else 0,
+                        money(price_unit), money(total), money(total - to_be_earned), money(earned),
+                        money(commissions * 0.75), money(commissions * 0.25), money(to_be_earned),
+                        rnd.choice(TRADE_MODES), db_datetime(started + step * number), True,
+                        f"videos/{FIRST_ORDER_NUMBER + number}.mp4" if charged else '',
+                        charged, charged, charged, paid, paid, paid,
+                    )
+
+        insert_rows(cursor, SoldOrders,
+                    ('server', 'seller', 'status', 'bought_by', 'character_name', 'sold_order_number', 'quantity',
+                     'sent_gold', 'price_unit', 'total_amount', 'comission_fee', 'earned_without_admins_commission',
+                     'owner_commission', 'technical_commission', 'to_be_earned', 'trade_mode', 'created_time',
+                     'send_message', 'path_to_video', 'download_video_status', 'send_video_status',
+                     'charged_to_payment', 'paid_in_salary', 'paid_to_owner', 'paid_to_technical'),
+                    rows())
+
+    @staticmethod
+    def populate_stock_history(cursor, rnd, options):
+        cursor.execute("SELECT sellers_id, server_urls_id FROM offers_for_placement")
+        offers = cursor.fetchall()
+        started = timezone.now() - timedelta(days=options['days'])
+        step = timedelta(days=options['days']) / max(options['stock_history'], 1)
+        insert_rows(cursor, ChangeStockHistory,
+                    ('seller', 'server', 'stock', 'active_rate_record', 'created_time', 'description'),
+                    ((*rnd.choice(offers), rnd.randint(0, 500) * 1000, rnd.random() < 0.1,
+                      db_datetime(started + step * number), 'Зміна стоку продавцем')
+                     for number in range(options['stock_history'])))
+
+    @staticmethod
+    def update_balances(cursor, rnd, options):
+        # Sellers.balance - як після main.ledger: невиплачене продавцям, власнику та технічному адміністратору
+        cursor.execute(
+            "UPDATE sellers SET balance = COALESCE((SELECT SUM(earned_without_admins_commission) FROM sold_orders"
+            " WHERE sold_orders.seller_id = sellers.id AND charged_to_payment AND NOT paid_in_salary), 0)"
+        )
+        for seller_id, column, paid_column in ((OWNER_SELLER_ID, 'owner_commission', 'paid_to_owner'),
+                                               (TECHNICAL_SELLER_ID, 'technical_commission', 'paid_to_technical')):
+            cursor.execute(
+                f"UPDATE sellers SET balance = COALESCE((SELECT SUM({column}) FROM sold_orders"
+                f" WHERE charged_to_payment AND NOT {paid_column}), 0) WHERE id = %s",
+                [seller_id],
+            )
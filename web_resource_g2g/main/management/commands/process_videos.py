@@ -0,0 +1,81 @@
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from main import crud
+from main.utils.logger_config import get_logger
+from main.video_processing import process_video
+
+logger = get_logger(__name__)
+
+
+class Command(BaseCommand):
+    help = ("Обробляє завантажені відео в пулі процесів: тривалість і контейнер, постер "
+            "та копія з низьким бітрейтом для перегляду адміністраторами")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                            help="Скільки відео обробляється одночасно")
+        parser.add_argument('--batch-size', type=int, default=10)
+        parser.add_argument('--poll-interval', type=float, default=10.0, help="Як часто перевіряти чергу, с")
+        parser.add_argument('--max-attempts', type=int, default=3)
+        parser.add_argument('--retry-delay', type=int, default=60, help="Затримка перед першим повтором, с")
+        parser.add_argument('--no-review', action='store_true', help="Не створювати копію для перегляду")
+        parser.add_argument('--processor', help="Шлях до класу обробника замість VIDEO_PROCESSOR")
+        parser.add_argument('--lease-timeout', type=int, default=600,
+                            help="Через скільки секунд без продовження оренди відео іншого воркера "
+                                 "вважається покинутим і повертається в чергу")
+        parser.add_argument('--once', action='store_true', help="Обробити те, що є в черзі, і завершитись")
+
+    def handle(self, *args, **options):
+        # Дочірні процеси не працюють з базою, тож не повинні успадкувати відкриті з'єднання
+        connections.close_all()
+        released_at = None
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            while True:
+                # Не частіше ніж раз на --lease-timeout: раніше жодна оренда не встигне застаріти
+                if released_at is None or time.monotonic() - released_at >= options['lease_timeout']:
+                    released_at = time.monotonic()
+                    released = crud.release_stale_video_jobs(options['lease_timeout'])
+                    if released:
+                        logger.warning("Returned %s abandoned video jobs to the queue", released)
+                processed = self.process_batch(pool, options)
+                if not processed:
+                    if options['once']:
+                        return
+                    time.sleep(options['poll_interval'])
+
+    def process_batch(self, pool, options):
+        jobs = crud.claim_video_jobs(options['batch_size'])
+        futures = {
+            pool.submit(process_video, job.path, not options['no_review'], options['processor']): job
+            for job in jobs
+        }
+        running = set(futures)
+        while running:
+            done, running = wait(running, timeout=options['lease_timeout'] / 3, return_when=FIRST_COMPLETED)
+            # Оренда продовжується і для відео, що чекають вільного процесу в пулі
+            if running:
+                crud.renew_video_jobs([futures[future] for future in running])
+            for future in done:
+                self.finish_job(futures[future], future, options)
+        return len(jobs)
+
+    @staticmethod
+    def finish_job(job, future, options):
+        try:
+            result = future.result()
+        except Exception as e:
+            error = getattr(e, 'stderr', None) or e
+            # job.attempts прочитано до збільшення в claim_video_jobs
+            retry_delay = None
+            if job.attempts + 1 < options['max_attempts']:
+                retry_delay = options['retry_delay'] * 2 ** job.attempts
+            logger.error("Video job %s for order %s failed: %s", job.id, job.sold_order_id, error)
+            crud.fail_video_job(job, error, retry_delay)
+        else:
+            logger.info("Video job %s for order %s done: %s", job.id, job.sold_order_id, result)
+            crud.finish_video_job(job, result)
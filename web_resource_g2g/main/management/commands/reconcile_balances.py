@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from main.ledger import reconcile_balances
+
+
+class Command(BaseCommand):
+    help = "Звіряє баланси продавців, власника та технічного адміністратора з сумами по SoldOrders"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help="Записати перераховані баланси для розбіжностей")
+
+    def handle(self, *args, **options):
+        mismatches = reconcile_balances(fix=options['fix'])
+        if not mismatches:
+            self.stdout.write(self.style.SUCCESS("Розбіжностей не знайдено"))
+            return
+
+        for seller_id, (balance, expected_balance) in mismatches.items():
+            self.stdout.write(f"seller_id={seller_id}: збережено {balance}, очікується {expected_balance}")
+        if options['fix']:
+            self.stdout.write(self.style.SUCCESS(f"Виправлено балансів: {len(mismatches)}"))
+        else:
+            self.stdout.write(self.style.WARNING(f"Розбіжностей: {len(mismatches)} (запустіть з --fix для виправлення)"))
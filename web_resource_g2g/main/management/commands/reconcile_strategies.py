@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from main.crud import reconcile_server_strategies
+
+
+class Command(BaseCommand):
+    help = ("Переводить сервери зі спільною торгівлею на стратегію 'Баланс' (для змін, зроблених поза сайтом). "
+            "Сервер торгівлі змінює лоти поза Django, тож команду слід запускати з --interval поруч з ним "
+            "або регулярно з cron")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--server', type=int, action='append', dest='server_ids',
+                            help="ID сервера з ServerUrls (можна вказати кілька разів)")
+        parser.add_argument('--interval', type=float,
+                            help="Повторювати перевірку кожні N секунд, не завершуючись")
+
+    def handle(self, *args, **options):
+        while True:
+            updated_count = reconcile_server_strategies(options['server_ids'])
+            if options['interval'] is None:
+                self.stdout.write(self.style.SUCCESS(f"Оновлено лотів: {updated_count}"))
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,16 @@
+from django.contrib import admin
+from django.core.management.base import BaseCommand
+
+from main.utils.admin_changelist import estimated_count_models, refresh_row_estimates
+
+
+class Command(BaseCommand):
+    help = ("Оновлює статистику бази (ANALYZE) таблиць, для яких адмінка показує кількість рядків зі статистики "
+            "(EstimatedCountPaginator). Запускати регулярно з cron, наприклад раз на добу, щоб кількість "
+            "у списках не відставала від таблиць")
+
+    def handle(self, *args, **options):
+        models = estimated_count_models(admin.site)
+        refresh_row_estimates(models)
+        self.stdout.write(self.style.SUCCESS(
+            f"Оновлено статистику таблиць: {', '.join(model._meta.db_table for model in models)}"))
@@ -0,0 +1,200 @@
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import time
+
+import django
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from main import crud, ledger
+from main.models import Sellers, OffersForPlacement, SoldOrders, TopPrices, ChangeStockHistory
+from main.utils.cache import (commission_cache, interest_rates_cache, seller_ids_cache, balance_cache)
+
+CACHES_TO_RESET = (commission_cache, interest_rates_cache, seller_ids_cache, balance_cache)
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[max(0, int(len(values) * share + 0.5) - 1)]
+
+
+class Command(BaseCommand):
+    help = ("Вимірює час ключових шляхів (таблиця лотів, баланс, історія замовлень, перерахунок балансів, "
+            "списки адмінки) на базі з generate_marketplace_data і записує результат у JSON для порівняння")
+
+    def add_arguments(self, parser):
+        parser.add_argument('database_file', help="Файл SQLite, створений generate_marketplace_data")
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=2, help="Невраховані запуски перед вимірюванням")
+        parser.add_argument('--only', action='append', default=[],
+                            help="Запустити лише бенчмарки, назва яких містить цей рядок (можна кілька)")
+        parser.add_argument('--output', help="Файл для результатів у форматі JSON")
+        parser.add_argument('--compare', help="JSON попереднього запуску, з яким порівняти медіани")
+        parser.add_argument('--label', default='', help="Позначка запуску в результатах, напр. назва гілки")
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        path = os.path.abspath(options['database_file'])
+        if not os.path.exists(path):
+            raise CommandError(f"Файл {path} не знайдено, створіть його manage.py generate_marketplace_data")
+        self.use_database(path)
+
+        rnd = random.Random(options['seed'])
+        benchmarks = {name: benchmark for name, benchmark in self.benchmarks(rnd).items()
+                      if not options['only'] or any(part in name for part in options['only'])}
+
+        results = {}
+        for name, (prepare, run) in benchmarks.items():
+            results[name] = self.measure(prepare, run, options)
+            self.stderr.write(f"{name}: {results[name]['median_ms']:.3f} мс, {results[name]['queries']} запитів")
+
+        report = {
+            'label': options['label'],
+            'created': timezone.now().isoformat(),
+            'git_commit': self.git_commit(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': {'path': path, 'vendor': connection.vendor, 'rows': self.row_counts()},
+            'repeat': options['repeat'],
+            'results': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+
+        previous = None
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as file:
+                previous = json.load(file)['results']
+        self.print_report(results, previous)
+
+    @staticmethod
+    def use_database(path):
+        # Підміняємо базу default, бо crud, view та адмінка працюють саме з нею
+        connections['default'].close()
+        connections.settings['default'] = {**connections.settings['default'], 'NAME': path}
+        del connections['default']
+
+    @staticmethod
+    def git_commit():
+        try:
+            return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+                                  cwd=settings.BASE_DIR).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return ''
+
+    @staticmethod
+    def row_counts():
+        return {model._meta.db_table: model.objects.count()
+                for model in (Sellers, OffersForPlacement, SoldOrders, TopPrices, ChangeStockHistory)}
+
+    def benchmarks(self, rnd):
+        """Назва -> (prepare, run): prepare() обирає вхідні дані запуску і не вимірюється."""
+        sellers = list(Sellers.objects.exclude(id__in=ledger.SERVICE_SELLER_IDS)
+                       .values_list('id', 'auth_user_id'))
+        if not sellers:
+            raise CommandError("У базі немає продавців")
+        admin_user = User.objects.filter(is_superuser=True).first()
+
+        def random_seller():
+            return rnd.choice(sellers)
+
+        seller_client = Client(HTTP_HOST='localhost')
+
+        def login_random_seller():
+            seller_client.force_login(User.objects.get(id=random_seller()[1]))
+            return seller_client
+
+        admin_client = Client(HTTP_HOST='localhost')
+        if admin_user is not None:
+            admin_client.force_login(admin_user)
+
+        benchmarks = {
+            'crud.get_main_data_from_table': (random_seller, lambda seller: crud.get_main_data_from_table(seller[1])),
+            'crud.get_balance': (random_seller, lambda seller: crud.get_balance(seller[1])),
+            'crud.get_cached_balance': (random_seller, lambda seller: crud.get_cached_balance(seller[1])),
+            'crud.get_orders_history': (random_seller, lambda seller: list(crud.get_orders_history(seller[1]))),
+            'crud.get_orders_history_page': (random_seller, lambda seller: crud.get_orders_history_page(seller[1])),
+            'balance.update_seller_balance': (random_seller, lambda seller: crud.update_seller_balance(seller[0])),
+            'balance.update_owner_balance': (lambda: None, lambda _: crud.update_owner_balance()),
+            'balance.update_technical_balance': (lambda: None, lambda _: crud.update_technical_balance()),
+            'balance.get_expected_balances': (lambda: None, lambda _: ledger.get_expected_balances()),
+            'view.start_page': (login_random_seller, lambda client: self.get(client, reverse('main:start_page'))),
+            'view.history_orders': (login_random_seller,
+                                    lambda client: self.get(client, reverse('main:history_orders'))),
+            'view.balance': (login_random_seller, lambda client: self.get(client, reverse('main:balance'))),
+            'view.offers_table': (login_random_seller,
+                                  lambda client: self.get(client, reverse('main:offers_table'))),
+            'view.server_catalog': (login_random_seller,
+                                    lambda client: self.get(client, reverse('main:server_catalog'))),
+        }
+        if admin_user is not None:
+            for model, model_admin in admin.site._registry.items():
+                if model._meta.app_label != 'main':
+                    continue
+                url = reverse(f'admin:{model._meta.app_label}_{model._meta.model_name}_changelist')
+                benchmarks[f'admin.{model._meta.model_name}_changelist'] = (
+                    lambda: admin_client, lambda client, url=url: self.get(client, url))
+        return benchmarks
+
+    @staticmethod
+    def get(client, url):
+        response = client.get(url)
+        if response.status_code != 200:
+            raise CommandError(f"GET {url} повернув {response.status_code}")
+        return response
+
+    @staticmethod
+    def run_isolated(run, argument):
+        # Кожен запуск у транзакції з відкатом: перерахунки балансів не змінюють базу між запусками
+        with transaction.atomic():
+            run(argument)
+            transaction.set_rollback(True)
+
+    def measure(self, prepare, run, options):
+        for _ in range(options['warmup']):
+            self.run_isolated(run, prepare())
+
+        timings = []
+        for _ in range(options['repeat']):
+            argument = prepare()
+            for cache in CACHES_TO_RESET:
+                cache.clear()
+            started = time.perf_counter()
+            self.run_isolated(run, argument)
+            timings.append((time.perf_counter() - started) * 1000)
+
+        with CaptureQueriesContext(connection) as captured:
+            self.run_isolated(run, prepare())
+        # BEGIN/SAVEPOINT самого вимірювання не рахуються
+        queries = [query for query in captured.captured_queries
+                   if not query['sql'].upper().startswith(('SAVEPOINT', 'RELEASE', 'ROLLBACK', 'BEGIN'))]
+        return {
+            'median_ms': round(statistics.median(timings), 3),
+            'p95_ms': round(percentile(timings, 0.95), 3),
+            'min_ms': round(min(timings), 3),
+            'max_ms': round(max(timings), 3),
+            'queries': len(queries),
+        }
+
+    def print_report(self, results, previous):
+        for name, result in results.items():
+            line = (f"{name:<45} {result['median_ms']:>10.3f} мс  p95 {result['p95_ms']:>10.3f} мс  "
+                    f"{result['queries']:>4} запитів")
+            if previous and name in previous:
+                before = previous[name]['median_ms']
+                change = (result['median_ms'] - before) / before * 100 if before else 0
+                style = self.style.SUCCESS if change <= -5 else self.style.ERROR if change >= 5 else str
+                line += style(f"  було {before:.3f} мс ({change:+.1f}%), запитів {previous[name]['queries']}")
+            self.stdout.write(line)
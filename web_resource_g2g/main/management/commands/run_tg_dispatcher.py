@@ -0,0 +1,38 @@
+import asyncio
+
+from django.core.management.base import BaseCommand
+
+from main.tg_bot_run import TelegramDispatcher, create_bot
+
+
+class Command(BaseCommand):
+    help = "Запускає диспетчер, який надсилає повідомлення з черги Telegram"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=5, help="Скільки повідомлень надсилається одночасно")
+        parser.add_argument('--per-chat-interval', type=float, default=1.0,
+                            help="Мінімальний інтервал між повідомленнями одному чату, с")
+        parser.add_argument('--poll-interval', type=float, default=2.0, help="Як часто перевіряти чергу, с")
+        parser.add_argument('--max-attempts', type=int, default=5)
+        parser.add_argument('--claim-timeout', type=int, default=900,
+                            help="Через скільки секунд забране й не надіслане повідомлення повертається в чергу")
+        parser.add_argument('--once', action='store_true', help="Надіслати те, що є в черзі, і завершитись")
+
+    def handle(self, *args, **options):
+        asyncio.run(self.dispatch(options))
+
+    @staticmethod
+    async def dispatch(options):
+        bot = create_bot()
+        dispatcher = TelegramDispatcher(
+            bot,
+            concurrency=options['concurrency'],
+            per_chat_interval=options['per_chat_interval'],
+            poll_interval=options['poll_interval'],
+            max_attempts=options['max_attempts'],
+            claim_timeout=options['claim_timeout'],
+        )
+        try:
+            await dispatcher.run(once=options['once'])
+        finally:
+            await bot.session.close()
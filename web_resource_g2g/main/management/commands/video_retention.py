@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand
+
+from main import crud, video_storage
+from main.utils.logger_config import get_logger
+from main.utils.video_upload import remove_stale_part_files
+
+logger = get_logger(__name__)
+
+
+class Command(BaseCommand):
+    help = ("Обслуговує сховище відео: переносить в архів відео виплачених замовлень, "
+            "старших за --days днів, видаляє файли без посилань, покинуті завантаження та файли .part, "
+            "що лишились від обірваних запитів")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=video_storage.VIDEO_ARCHIVE_AFTER_DAYS,
+                            help="Через скільки днів відео виплаченого замовлення йде в архів")
+        parser.add_argument('--stale-upload-days', type=int, default=7,
+                            help="Через скільки днів без змін незавершене завантаження видаляється")
+        parser.add_argument('--stale-part-hours', type=int, default=24,
+                            help="Через скільки годин без змін видаляється файл .part без завантаження")
+        parser.add_argument('--import-legacy', action='store_true',
+                            help="Спочатку перенести у сховище відео, збережені під старими іменами")
+        parser.add_argument('--dry-run', action='store_true', help="Лише показати, що буде заархівовано")
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            for stored in video_storage.videos_to_archive(options['days']):
+                self.stdout.write(f"{stored.path} ({stored.size} B, посилань: {stored.ref_count})")
+            return
+
+        if options['import_legacy']:
+            self.stdout.write(f"Перенесено у сховище: {video_storage.import_legacy_videos()}")
+
+        unpacked = video_storage.unpack_compressed_archives()
+        if unpacked:
+            logger.warning("Unpacked %s gzip-compressed archived videos", unpacked)
+
+        fixed = video_storage.recount_references()
+        if fixed:
+            logger.warning("Fixed reference counts of %s stored videos", fixed)
+
+        archived = 0
+        for stored in video_storage.videos_to_archive(options['days']):
+            try:
+                video_storage.archive_video(stored)
+                archived += 1
+            except OSError as e:
+                logger.error("Failed to archive %s: %s", stored.path, e)
+
+        stale_uploads = crud.get_stale_video_uploads(options['stale_upload_days'])
+        for upload in stale_uploads:
+            crud.discard_video_upload(upload)
+
+        parts = remove_stale_part_files(options['stale_part_hours'] * 3600, crud.get_active_video_upload_paths())
+
+        deleted = video_storage.delete_orphans()
+        self.stdout.write(f"Заархівовано: {archived}, видалено без посилань: {deleted}, "
+                          f"покинутих завантажень: {len(stale_uploads)}, файлів .part: {parts}")
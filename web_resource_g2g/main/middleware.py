@@ -0,0 +1,56 @@
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from .utils.logger_config import get_logger
+from .utils.query_stats import QueryRecorder, RequestStats, request_stats_log
+
+logger = get_logger(__name__)
+
+QUERY_INSTRUMENTATION = getattr(settings, 'QUERY_INSTRUMENTATION', settings.DEBUG)
+# Після скількох запитів до бази за один HTTP-запит писати попередження в лог
+QUERY_COUNT_WARNING = getattr(settings, 'QUERY_COUNT_WARNING', 50)
+
+
+class QueryInstrumentationMiddleware:
+    """
+    Рахує SQL-запити та час у базі для кожного запиту і додає підсумок у request_stats_log.
+    Персоналу відповідь приходить із заголовками X-DB-Queries, X-DB-Time-ms, X-DB-Duplicate-Queries
+    та Server-Timing (видно на вкладці Network браузера). Має стояти після AuthenticationMiddleware.
+    """
+
+    def __init__(self, get_response):
+        if not QUERY_INSTRUMENTATION:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorders = [QueryRecorder(connection.alias) for connection in connections.all()]
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection, recorder in zip(connections.all(), recorders):
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        total_time = time.perf_counter() - started
+
+        match = request.resolver_match
+        view = match.view_name if match else request.path
+        stats = RequestStats(view, request.path, request.method, response.status_code, recorders, total_time)
+        request_stats_log.add(stats)
+
+        if stats.queries >= QUERY_COUNT_WARNING:
+            logger.warning("%s %s made %s queries (%s duplicates) in %s ms",
+                           request.method, request.path, stats.queries, stats.duplicate_queries, stats.db_ms,
+                           extra={'view': view, 'duplicates': stats.as_dict()['duplicates']})
+
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_staff:
+            response['X-DB-Queries'] = stats.queries
+            response['X-DB-Time-ms'] = stats.db_ms
+            response['X-DB-Duplicate-Queries'] = stats.duplicate_queries
+            response['Server-Timing'] = (f'db;dur={stats.db_ms};desc="{stats.queries} queries", '
+                                         f'total;dur={stats.total_ms}')
+        return response
@@ -0,0 +1,63 @@
+import django.db.models.deletion
+import django.db.models.functions.datetime
+from django.db import migrations, models
+
+from main.utils.db_triggers import install_top_prices_trigger, drop_top_prices_trigger, refresh_latest_top_prices
+
+
+def create_trigger(apps, schema_editor):
+    # Без тригера (база не SQLite і не PostgreSQL) таблиця не заповнюється: застарілі ціни гірші за відсутні
+    if install_top_prices_trigger(schema_editor.connection):
+        refresh_latest_top_prices(schema_editor.connection)
+
+
+def remove_trigger(apps, schema_editor):
+    drop_top_prices_trigger(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("main", "0035_changestockhistory_active_rate_record"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="topprices",
+            name="created_at",
+            field=models.DateTimeField(db_default=django.db.models.functions.datetime.Now()),
+        ),
+        migrations.AddIndex(
+            model_name="topprices",
+            index=models.Index(fields=["server_name", "-created_at"], name="top_prices_server_created_idx"),
+        ),
+        migrations.CreateModel(
+            name="LatestTopPrices",
+            fields=[
+                (
+                    "server",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        serialize=False,
+                        to="main.serverurls",
+                    ),
+                ),
+                ("top_price_id", models.BigIntegerField()),
+                ("top1", models.IntegerField()),
+                ("top5", models.IntegerField()),
+                ("top10", models.IntegerField()),
+                ("top20", models.IntegerField()),
+                ("mean10", models.IntegerField()),
+                ("mean20", models.IntegerField()),
+                ("minimal", models.IntegerField()),
+                ("mean10_lot", models.IntegerField()),
+                ("mean20_lot", models.IntegerField()),
+                ("double_minimal", models.IntegerField()),
+                ("created_at", models.DateTimeField()),
+            ],
+            options={
+                "db_table": "latest_top_prices",
+            },
+        ),
+        migrations.RunPython(create_trigger, remove_trigger),
+    ]
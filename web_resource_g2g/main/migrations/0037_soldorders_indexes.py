@@ -0,0 +1,40 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("main", "0036_topprices_created_at_latesttopprices"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="soldorders",
+            index=models.Index(condition=models.Q(("charged_to_payment", True), ("paid_in_salary", False)),
+                               fields=["seller", "earned_without_admins_commission"],
+                               name="sold_seller_unpaid_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="soldorders",
+            index=models.Index(condition=models.Q(("charged_to_payment", True), ("paid_to_owner", False)),
+                               fields=["owner_commission"],
+                               name="sold_owner_unpaid_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="soldorders",
+            index=models.Index(condition=models.Q(("charged_to_payment", True), ("paid_to_technical", False)),
+                               fields=["technical_commission"],
+                               name="sold_technical_unpaid_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="soldorders",
+            index=models.Index(condition=models.Q(("download_video_status", False)),
+                               fields=["seller"],
+                               name="sold_seller_video_pending_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="soldorders",
+            index=models.Index(fields=["sold_order_number"], name="sold_order_number_idx"),
+        ),
+        # Без статистики SQLite обирає індекс по seller_id замість часткового
+        migrations.RunSQL("ANALYZE sold_orders", migrations.RunSQL.noop),
+    ]
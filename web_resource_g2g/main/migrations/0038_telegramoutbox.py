@@ -0,0 +1,59 @@
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("main", "0037_soldorders_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TelegramOutbox",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("chat_id", models.CharField(max_length=255)),
+                ("text", models.TextField()),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Очікує"),
+                            ("sending", "Надсилається"),
+                            ("sent", "Надіслано"),
+                            ("failed", "Помилка"),
+                        ],
+                        default="pending",
+                        max_length=16,
+                    ),
+                ),
+                ("attempts", models.IntegerField(default=0)),
+                ("next_attempt_time", models.DateTimeField(default=django.utils.timezone.now)),
+                ("last_error", models.TextField(blank=True)),
+                ("created_time", models.DateTimeField(default=django.utils.timezone.now)),
+                ("sent_time", models.DateTimeField(blank=True, null=True)),
+                (
+                    "sold_order",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to="main.soldorders",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Повідомлення Telegram",
+                "verbose_name_plural": "Черга повідомлень Telegram",
+                "db_table": "telegram_outbox",
+                "indexes": [
+                    models.Index(
+                        condition=models.Q(("status", "pending")),
+                        fields=["next_attempt_time"],
+                        name="telegram_outbox_pending_idx",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,49 @@
+import uuid
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("main", "0038_telegramoutbox"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="VideoUpload",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("upload_id", models.UUIDField(default=uuid.uuid4, editable=False, unique=True)),
+                ("sent_gold", models.IntegerField()),
+                ("size", models.BigIntegerField()),
+                ("offset", models.BigIntegerField(default=0)),
+                ("checksum", models.CharField(blank=True, max_length=64)),
+                ("path", models.CharField(max_length=255)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[("uploading", "Завантажується"), ("complete", "Завершено")],
+                        default="uploading",
+                        max_length=16,
+                    ),
+                ),
+                ("created_time", models.DateTimeField(default=django.utils.timezone.now)),
+                ("updated_time", models.DateTimeField(default=django.utils.timezone.now)),
+                (
+                    "seller",
+                    models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to="main.sellers"),
+                ),
+                (
+                    "sold_order",
+                    models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to="main.soldorders"),
+                ),
+            ],
+            options={
+                "verbose_name": "Завантаження відео",
+                "verbose_name_plural": "Завантаження відео",
+                "db_table": "video_uploads",
+            },
+        ),
+    ]
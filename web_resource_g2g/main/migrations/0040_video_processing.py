@@ -0,0 +1,73 @@
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("main", "0039_videoupload"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="soldorders",
+            name="video_container",
+            field=models.CharField(blank=True, db_default="", max_length=64),
+        ),
+        migrations.AddField(
+            model_name="soldorders",
+            name="video_duration",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="soldorders",
+            name="video_thumbnail",
+            field=models.CharField(blank=True, db_default="", max_length=255),
+        ),
+        migrations.AddField(
+            model_name="soldorders",
+            name="video_review_path",
+            field=models.CharField(blank=True, db_default="", max_length=255),
+        ),
+        migrations.CreateModel(
+            name="VideoProcessingJob",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("path", models.CharField(max_length=255)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Очікує"),
+                            ("processing", "Обробляється"),
+                            ("done", "Готово"),
+                            ("failed", "Помилка"),
+                        ],
+                        default="pending",
+                        max_length=16,
+                    ),
+                ),
+                ("attempts", models.IntegerField(default=0)),
+                ("next_attempt_time", models.DateTimeField(default=django.utils.timezone.now)),
+                ("last_error", models.TextField(blank=True)),
+                ("created_time", models.DateTimeField(default=django.utils.timezone.now)),
+                ("finished_time", models.DateTimeField(blank=True, null=True)),
+                (
+                    "sold_order",
+                    models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to="main.soldorders"),
+                ),
+            ],
+            options={
+                "verbose_name": "Обробка відео",
+                "verbose_name_plural": "Черга обробки відео",
+                "db_table": "video_processing_jobs",
+                "indexes": [
+                    models.Index(
+                        condition=models.Q(("status", "pending")),
+                        fields=["next_attempt_time"],
+                        name="video_jobs_pending_idx",
+                    )
+                ],
+            },
+        ),
+    ]
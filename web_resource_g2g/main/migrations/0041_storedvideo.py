@@ -0,0 +1,36 @@
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("main", "0040_video_processing"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StoredVideo",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("sha256", models.CharField(max_length=64, unique=True)),
+                ("path", models.CharField(max_length=255, unique=True)),
+                ("size", models.BigIntegerField()),
+                ("ref_count", models.IntegerField(default=0)),
+                (
+                    "tier",
+                    models.CharField(
+                        choices=[("hot", "Робоче сховище"), ("archive", "Архів")],
+                        default="hot",
+                        max_length=16,
+                    ),
+                ),
+                ("created_time", models.DateTimeField(default=django.utils.timezone.now)),
+                ("archived_time", models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                "verbose_name": "Збережене відео",
+                "verbose_name_plural": "Сховище відео",
+                "db_table": "stored_videos",
+            },
+        ),
+    ]
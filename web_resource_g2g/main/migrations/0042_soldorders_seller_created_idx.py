@@ -0,0 +1,15 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("main", "0041_storedvideo"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="soldorders",
+            index=models.Index(fields=["seller", "created_time"], name="sold_seller_created_idx"),
+        ),
+        migrations.RunSQL("ANALYZE sold_orders", migrations.RunSQL.noop),
+    ]
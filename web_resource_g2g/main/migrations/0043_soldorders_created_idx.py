@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("main", "0042_soldorders_seller_created_idx"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="soldorders",
+            index=models.Index(fields=["created_time"], name="sold_created_idx"),
+        ),
+        # Після ANALYZE з'являється sqlite_stat1, з якої EstimatedCountPaginator бере кількість рядків
+        migrations.RunSQL("ANALYZE sold_orders", migrations.RunSQL.noop),
+    ]
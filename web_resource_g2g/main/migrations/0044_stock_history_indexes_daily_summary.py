@@ -0,0 +1,44 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("main", "0043_soldorders_created_idx"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="changestockhistory",
+            index=models.Index(fields=["created_time"], name="stock_hist_created_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="changestockhistory",
+            index=models.Index(fields=["seller", "created_time"], name="stock_hist_seller_created_idx"),
+        ),
+        migrations.CreateModel(
+            name="ChangeStockDailySummary",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("day", models.DateField()),
+                ("events", models.IntegerField()),
+                ("first_stock", models.IntegerField()),
+                ("last_stock", models.IntegerField()),
+                ("min_stock", models.IntegerField()),
+                ("max_stock", models.IntegerField()),
+                ("last_active_rate", models.BooleanField()),
+                ("seller", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to="main.sellers")),
+                ("server", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to="main.serverurls")),
+            ],
+            options={
+                "verbose_name": "Підсумок дня",
+                "verbose_name_plural": "Історія зміни стоку по днях",
+                "indexes": [models.Index(fields=["day"], name="stock_summary_day_idx")],
+                "constraints": [
+                    models.UniqueConstraint(fields=("seller", "server", "day"), name="stock_summary_seller_server_day"),
+                ],
+            },
+        ),
+        # Статистика для EstimatedCountPaginator у списку адмінки
+        migrations.RunSQL("ANALYZE main_changestockhistory", migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("main", "0044_stock_history_indexes_daily_summary"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="telegramoutbox",
+            name="claimed_time",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="telegramoutbox",
+            index=models.Index(
+                condition=models.Q(("status", "sending")), fields=["claimed_time"], name="telegram_outbox_sending_idx"
+            ),
+        ),
+    ]
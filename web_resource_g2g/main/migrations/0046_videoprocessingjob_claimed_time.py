@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("main", "0045_telegramoutbox_claimed_time"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="videoprocessingjob",
+            name="claimed_time",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="videoprocessingjob",
+            index=models.Index(
+                condition=models.Q(("status", "processing")), fields=["claimed_time"], name="video_jobs_processing_idx"
+            ),
+        ),
+    ]
@@ -1,7 +1,10 @@
 # models.py
+import uuid
+
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.db import models
 from django.contrib.auth.models import User
+from django.db.models.functions import Now
 
 
 from django.utils import timezone
@@ -53,9 +56,35 @@ class TopPrices(models.Model):
     mean20_lot = models.IntegerField()
     double_minimal = models.IntegerField()
     created_time = models.TimeField(default=timezone.now)
+    # Повна дата запису; заповнюється базою, тому працює і для вставок парсера поза Django
+    created_at = models.DateTimeField(db_default=Now())
 
     class Meta:
         db_table = 'top_prices'
+        indexes = [
+            models.Index(fields=['server_name', '-created_at'], name='top_prices_server_created_idx'),
+        ]
+
+
+class LatestTopPrices(models.Model):
+    # Останній знімок `TopPrices` для кожного сервера.
+    # Таблицю оновлює тригер бази на вставку в `top_prices` (див. main/utils/db_triggers.py)
+    server = models.OneToOneField(ServerUrls, on_delete=models.CASCADE, primary_key=True)
+    top_price_id = models.BigIntegerField()
+    top1 = models.IntegerField()
+    top5 = models.IntegerField()
+    top10 = models.IntegerField()
+    top20 = models.IntegerField()
+    mean10 = models.IntegerField()
+    mean20 = models.IntegerField()
+    minimal = models.IntegerField()
+    mean10_lot = models.IntegerField()
+    mean20_lot = models.IntegerField()
+    double_minimal = models.IntegerField()
+    created_at = models.DateTimeField()
+
+    class Meta:
+        db_table = 'latest_top_prices'
 
 
 class OffersForPlacement(models.Model):
@@ -110,11 +139,36 @@ class SoldOrders(models.Model):
     paid_in_salary = models.BooleanField(default=False)
     paid_to_owner = models.BooleanField(default=False)
     paid_to_technical = models.BooleanField(default=False)
+    # Результати обробки відео (process_videos); db_default - замовлення додає і сервер поза Django
+    video_container = models.CharField(max_length=64, blank=True, db_default='')
+    video_duration = models.FloatField(null=True, blank=True)  # Тривалість, с
+    video_thumbnail = models.CharField(max_length=255, blank=True, db_default='')
+    video_review_path = models.CharField(max_length=255, blank=True, db_default='')
 
     class Meta:
         db_table = 'sold_orders'
         verbose_name = "Список замовлень для виплати"
         verbose_name_plural = "Список замовлень для виплати"  # Множина
+        # Часткові індекси містять лише "живі" замовлення, тому не ростуть разом з історією.
+        # Умови мають збігатися з фільтрами в crud.py, інакше планувальник їх не використає.
+        indexes = [
+            models.Index(fields=['seller', 'earned_without_admins_commission'],
+                         condition=models.Q(charged_to_payment=True, paid_in_salary=False),
+                         name='sold_seller_unpaid_idx'),
+            models.Index(fields=['owner_commission'],
+                         condition=models.Q(charged_to_payment=True, paid_to_owner=False),
+                         name='sold_owner_unpaid_idx'),
+            models.Index(fields=['technical_commission'],
+                         condition=models.Q(charged_to_payment=True, paid_to_technical=False),
+                         name='sold_technical_unpaid_idx'),
+            models.Index(fields=['seller'], condition=models.Q(download_video_status=False),
+                         name='sold_seller_video_pending_idx'),
+            models.Index(fields=['sold_order_number'], name='sold_order_number_idx'),
+            # Історія замовлень продавця: сортування та пагінація за (created_time, id)
+            models.Index(fields=['seller', 'created_time'], name='sold_seller_created_idx'),
+            # Сортування та date_hierarchy списків замовлень в адмінці
+            models.Index(fields=['created_time'], name='sold_created_idx'),
+        ]
 
 
 
@@ -148,3 +202,150 @@ class ChangeStockHistory(models.Model):
 
         verbose_name = "Рядок"
         verbose_name_plural = "Історія зміни стоку та статусу лотів"
+        indexes = [
+            # Список адмінки сортується за часом, фільтри - за продавцем і датою
+            models.Index(fields=['created_time'], name='stock_hist_created_idx'),
+            models.Index(fields=['seller', 'created_time'], name='stock_hist_seller_created_idx'),
+        ]
+
+
+class ChangeStockDailySummary(models.Model):
+    # Підсумок за день замість окремих рядків ChangeStockHistory, старших за STOCK_HISTORY_RETENTION_DAYS
+    seller = models.ForeignKey(Sellers, on_delete=models.CASCADE)
+    server = models.ForeignKey(ServerUrls, on_delete=models.CASCADE)
+    day = models.DateField()
+    events = models.IntegerField()
+    first_stock = models.IntegerField()
+    last_stock = models.IntegerField()
+    min_stock = models.IntegerField()
+    max_stock = models.IntegerField()
+    last_active_rate = models.BooleanField()
+
+    class Meta:
+        verbose_name = "Підсумок дня"
+        verbose_name_plural = "Історія зміни стоку по днях"
+        constraints = [
+            models.UniqueConstraint(fields=['seller', 'server', 'day'], name='stock_summary_seller_server_day'),
+        ]
+        indexes = [
+            models.Index(fields=['day'], name='stock_summary_day_idx'),
+        ]
+
+
+class TelegramOutbox(models.Model):
+    STATUS_PENDING = 'pending'
+    STATUS_SENDING = 'sending'
+    STATUS_SENT = 'sent'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Очікує'),
+        (STATUS_SENDING, 'Надсилається'),
+        (STATUS_SENT, 'Надіслано'),
+        (STATUS_FAILED, 'Помилка'),
+    ]
+
+    chat_id = models.CharField(max_length=255)
+    text = models.TextField()
+    sold_order = models.ForeignKey(SoldOrders, on_delete=models.SET_NULL, null=True, blank=True)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.IntegerField(default=0)
+    next_attempt_time = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_time = models.DateTimeField(default=timezone.now)
+    sent_time = models.DateTimeField(null=True, blank=True)
+    # Коли диспетчер забрав повідомлення; за ним знаходяться "завислі" після зупинки диспетчера
+    claimed_time = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'telegram_outbox'
+        verbose_name = "Повідомлення Telegram"
+        verbose_name_plural = "Черга повідомлень Telegram"
+        indexes = [
+            models.Index(fields=['next_attempt_time'], condition=models.Q(status='pending'),
+                         name='telegram_outbox_pending_idx'),
+            models.Index(fields=['claimed_time'], condition=models.Q(status='sending'),
+                         name='telegram_outbox_sending_idx'),
+        ]
+
+
+class VideoUpload(models.Model):
+    STATUS_UPLOADING = 'uploading'
+    STATUS_COMPLETE = 'complete'
+    STATUS_CHOICES = [
+        (STATUS_UPLOADING, 'Завантажується'),
+        (STATUS_COMPLETE, 'Завершено'),
+    ]
+
+    upload_id = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    sold_order = models.ForeignKey(SoldOrders, on_delete=models.CASCADE)
+    seller = models.ForeignKey(Sellers, on_delete=models.CASCADE)
+    sent_gold = models.IntegerField()
+    size = models.BigIntegerField()  # Очікуваний розмір файлу в байтах
+    offset = models.BigIntegerField(default=0)  # Скільки байтів вже записано
+    checksum = models.CharField(max_length=64, blank=True)  # sha256 від клієнта, hex
+    path = models.CharField(max_length=255)  # Тимчасовий файл .part у теці videos
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_UPLOADING)
+    created_time = models.DateTimeField(default=timezone.now)
+    updated_time = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = 'video_uploads'
+        verbose_name = "Завантаження відео"
+        verbose_name_plural = "Завантаження відео"
+
+
+class VideoProcessingJob(models.Model):
+    STATUS_PENDING = 'pending'
+    STATUS_PROCESSING = 'processing'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Очікує'),
+        (STATUS_PROCESSING, 'Обробляється'),
+        (STATUS_DONE, 'Готово'),
+        (STATUS_FAILED, 'Помилка'),
+    ]
+
+    sold_order = models.ForeignKey(SoldOrders, on_delete=models.CASCADE)
+    path = models.CharField(max_length=255)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.IntegerField(default=0)
+    next_attempt_time = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_time = models.DateTimeField(default=timezone.now)
+    finished_time = models.DateTimeField(null=True, blank=True)
+    # Оренда воркера: оновлюється, поки відео обробляється, тож давня оренда означає зупинений воркер
+    claimed_time = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'video_processing_jobs'
+        verbose_name = "Обробка відео"
+        verbose_name_plural = "Черга обробки відео"
+        indexes = [
+            models.Index(fields=['next_attempt_time'], condition=models.Q(status='pending'),
+                         name='video_jobs_pending_idx'),
+            models.Index(fields=['claimed_time'], condition=models.Q(status='processing'),
+                         name='video_jobs_processing_idx'),
+        ]
+
+
+class StoredVideo(models.Model):
+    TIER_HOT = 'hot'
+    TIER_ARCHIVE = 'archive'
+    TIER_CHOICES = [
+        (TIER_HOT, 'Робоче сховище'),
+        (TIER_ARCHIVE, 'Архів'),
+    ]
+
+    sha256 = models.CharField(max_length=64, unique=True)
+    path = models.CharField(max_length=255, unique=True)  # Те саме значення, що в SoldOrders.path_to_video
+    size = models.BigIntegerField()
+    ref_count = models.IntegerField(default=0)  # Скільки замовлень посилаються на відео
+    tier = models.CharField(max_length=16, choices=TIER_CHOICES, default=TIER_HOT)
+    created_time = models.DateTimeField(default=timezone.now)
+    archived_time = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'stored_videos'
+        verbose_name = "Збережене відео"
+        verbose_name_plural = "Сховище відео"
@@ -0,0 +1,169 @@
+"""
+Push-оновлення продавцям через Django Channels: ціни таблиці лотів, нові замовлення та баланс.
+
+Ціни, замовлення й баланси змінює і сервер торгівлі поза Django, тож сигнали моделей їх не бачать.
+Натомість SellerUpdatesWatcher кожного процесу раз на REALTIME_POLL_INTERVAL секунд перевіряє базу
+лише для продавців, підключених до цього процесу, і надсилає зміни прямо в канали їхніх з'єднань.
+Тому кожне оновлення йде тільки з того процесу, де відкрита вкладка, і шар каналів у пам'яті процесу достатній.
+Таблиця лотів перераховується тільки тоді, коли змінились TopPrices, комісія або в продавця нове замовлення.
+"""
+import asyncio
+import json
+
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Max
+
+from . import crud, ledger
+from .models import Commission, LatestTopPrices, Sellers, SoldOrders
+from .utils.cache import commission_cache
+from .utils.logger_config import get_logger
+
+logger = get_logger(__name__)
+
+REALTIME_POLL_INTERVAL = getattr(settings, 'REALTIME_POLL_INTERVAL', 5)
+
+# Поля рядка таблиці лотів, зміни яких надсилаються продавцю
+OFFER_UPDATE_FIELDS = ('id', 'price', 'full_cost', 'interest_rate', 'strategy_price', 'exists_strategy',
+                       'active_rate', 'order_status')
+ORDER_UPDATE_FIELDS = ('id', 'sold_order_number', 'server__server_name', 'server__game_name', 'quantity',
+                       'earned_without_admins_commission', 'created_time')
+
+
+class ConnectionState:
+    def __init__(self):
+        # Останнє надіслане в це з'єднання: None - таблицю ще не надсилали після підключення
+        self.offers = None
+        self.balance = None
+
+
+class SellerUpdatesWatcher:
+    """Опитування бази для підключених до процесу продавців. Працює, поки є хоча б одне з'єднання."""
+
+    def __init__(self, interval=REALTIME_POLL_INTERVAL):
+        self.interval = interval
+        # auth_user_id -> {channel_name: ConnectionState}
+        self._sellers = {}
+        self._task = None
+        self._prices_marker = None
+        self._last_order_id = None
+
+    def subscribe(self, auth_user_id, channel_name):
+        self._sellers.setdefault(auth_user_id, {})[channel_name] = ConnectionState()
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def unsubscribe(self, auth_user_id, channel_name):
+        connections = self._sellers.get(auth_user_id)
+        if connections is None:
+            return
+        connections.pop(channel_name, None)
+        if not connections:
+            del self._sellers[auth_user_id]
+        if not self._sellers and self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        channel_layer = get_channel_layer()
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                sellers = {auth_user_id: dict(connections) for auth_user_id, connections in self._sellers.items()}
+                updates = await database_sync_to_async(self.collect_updates)(sellers)
+                for auth_user_id, channel_name, payload in updates:
+                    if channel_name not in self._sellers.get(auth_user_id, ()):
+                        continue
+                    # Уже як JSON: Decimal і datetime не пройдуть через серіалізацію шару каналів
+                    await channel_layer.send(channel_name, {
+                        'type': 'seller.update', 'text': json.dumps(payload, cls=DjangoJSONEncoder)})
+            except Exception:
+                logger.exception("Seller updates poll failed")
+
+    def collect_updates(self, sellers):
+        """
+        [(auth_user_id, channel_name, payload)] з моменту минулого виклику для `sellers`
+        ({auth_user_id: {channel_name: ConnectionState}}). Кожне з'єднання отримує рівно одну копію.
+        """
+        if not sellers:
+            return []
+        updates = []
+
+        new_orders = self._collect_new_orders(sellers)
+        for auth_user_id, orders in new_orders.items():
+            for channel_name in sellers[auth_user_id]:
+                updates.extend((auth_user_id, channel_name, {'type': 'order', 'order': order}) for order in orders)
+
+        prices_changed = self._prices_changed()
+        for auth_user_id, connections in sellers.items():
+            if (prices_changed or auth_user_id in new_orders
+                    or any(state.offers is None for state in connections.values())):
+                rows = self._offers_rows(auth_user_id)
+                for channel_name, state in connections.items():
+                    payload = self._offers_delta(rows, state)
+                    if payload is not None:
+                        updates.append((auth_user_id, channel_name, payload))
+
+        updates.extend(self._collect_balances(sellers))
+        return updates
+
+    def _prices_changed(self):
+        marker = (
+            LatestTopPrices.objects.aggregate(top_price_id=Max('top_price_id'))['top_price_id'],
+            Commission.objects.order_by('-created_time').values_list('id', 'commission').first(),
+        )
+        changed = self._prices_marker is not None and marker != self._prices_marker
+        if changed and marker[1] != self._prices_marker[1]:
+            # Комісію могли змінити в іншому процесі, сигнал якого сюди не дійде
+            commission_cache.invalidate('current')
+        self._prices_marker = marker
+        return changed
+
+    def _collect_new_orders(self, sellers):
+        if self._last_order_id is None:
+            self._last_order_id = SoldOrders.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+            return {}
+        orders = list(SoldOrders.objects.filter(id__gt=self._last_order_id)
+                      .order_by('id')
+                      .values('seller__auth_user_id', *ORDER_UPDATE_FIELDS))
+        new_orders = {}
+        for order in orders:
+            self._last_order_id = order['id']
+            auth_user_id = order.pop('seller__auth_user_id')
+            if auth_user_id in sellers:
+                new_orders.setdefault(auth_user_id, []).append(order)
+        return new_orders
+
+    @staticmethod
+    def _offers_rows(auth_user_id):
+        return {row['id']: {field: row.get(field) for field in OFFER_UPDATE_FIELDS}
+                for row in crud.get_main_data_from_table(auth_user_id)}
+
+    @staticmethod
+    def _offers_delta(rows, state):
+        previous = state.offers or {}
+        changed = [row for offer_id, row in rows.items() if previous.get(offer_id) != row]
+        removed = [offer_id for offer_id in previous if offer_id not in rows]
+        first = state.offers is None
+        state.offers = rows
+        if not (changed or removed or first):
+            return None
+        return {'type': 'prices', 'offers': changed, 'removed': removed}
+
+    @staticmethod
+    def _collect_balances(sellers):
+        updates = []
+        # Баланси власника та технічного адміністратора рахуються інакше, див. crud.get_cached_balance
+        for auth_user_id, balance in (Sellers.objects.filter(auth_user_id__in=list(sellers))
+                                      .exclude(id__in=ledger.SERVICE_SELLER_IDS)
+                                      .values_list('auth_user_id', 'balance')):
+            for channel_name, state in sellers[auth_user_id].items():
+                if balance != state.balance:
+                    state.balance = balance
+                    updates.append((auth_user_id, channel_name, {'type': 'balance', 'balance': balance}))
+        return updates
+
+
+seller_updates_watcher = SellerUpdatesWatcher()
@@ -0,0 +1,57 @@
+from django.db import connections, transaction
+from django.db.models.signals import post_save, post_delete, post_migrate
+from django.dispatch import receiver
+
+from .crud import invalidate_interest_rates
+from .models import Commission, SellerServerInterestRate, Sellers, SoldOrders, ServerUrls
+from .utils.cache import (commission_cache, interest_rates_cache, seller_ids_cache, balance_cache,
+                          seller_choices_cache, server_catalog_cache)
+from .utils.db_triggers import install_top_prices_trigger
+from .video_storage import change_video_reference
+
+
+@receiver([post_save, post_delete], sender=Commission)
+def reset_commission_cache(sender, **kwargs):
+    transaction.on_commit(lambda: commission_cache.invalidate('current'))
+
+
+@receiver([post_save, post_delete], sender=SellerServerInterestRate)
+def reset_interest_rates_cache(sender, instance, **kwargs):
+    if instance.seller_id is None:
+        transaction.on_commit(interest_rates_cache.clear)
+        return
+    seller_id = instance.seller_id
+    transaction.on_commit(lambda: invalidate_interest_rates([seller_id]))
+
+
+@receiver([post_save, post_delete], sender=Sellers)
+def reset_seller_balance_cache(sender, instance, **kwargs):
+    # Скидаємо після коміту, інакше паралельний запит встигне закешувати ще не збережені дані
+    auth_user_id, seller_id = instance.auth_user_id, instance.id
+
+    def reset():
+        seller_ids_cache.invalidate(auth_user_id)
+        balance_cache.invalidate(seller_id)
+        seller_choices_cache.invalidate('all')
+
+    transaction.on_commit(reset)
+
+
+@receiver([post_save, post_delete], sender=ServerUrls)
+def reset_server_catalog_cache(sender, **kwargs):
+    transaction.on_commit(lambda: server_catalog_cache.invalidate('current'))
+
+
+@receiver(post_delete, sender=SoldOrders)
+def release_order_video(sender, instance, **kwargs):
+    change_video_reference(instance.path_to_video, '')
+
+
+@receiver(post_migrate)
+def ensure_top_prices_trigger(sender, using, **kwargs):
+    # SQLite видаляє тригери разом зі старою таблицею, коли міграція перебудовує `top_prices`
+    if sender.name != 'main':
+        return
+    connection = connections[using]
+    if 'latest_top_prices' in connection.introspection.table_names():
+        install_top_prices_trigger(connection)
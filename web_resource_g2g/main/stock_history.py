@@ -0,0 +1,142 @@
+"""
+Історія зміни запасу та статусу лотів (ChangeStockHistory).
+
+Записи додаються лише з даних лота, що вже є в пам'яті, без повторного читання з бази.
+Усередині `buffered()` записи накопичуються і пишуться одним bulk_create на виході з блоку.
+Рядки, старші за STOCK_HISTORY_RETENTION_DAYS, compact_stock_history згортає в ChangeStockDailySummary.
+"""
+import threading
+from contextlib import contextmanager
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max, Min
+from django.utils import timezone
+
+from .models import ChangeStockHistory, ChangeStockDailySummary
+from .utils.logger_config import get_logger
+
+logger = get_logger(__name__)
+
+STOCK_HISTORY_RETENTION_DAYS = getattr(settings, 'STOCK_HISTORY_RETENTION_DAYS', 90)
+# Після скількох накопичених записів буфер пишеться, не чекаючи кінця блоку
+STOCK_HISTORY_BATCH_SIZE = 500
+
+# Описи подій, які пише веб-частина
+STOCK_CHANGED = 'change stock'
+STATUS_CHANGED = 'Change status'
+
+_local = threading.local()
+
+
+def record(seller_id, server_id, stock, active_rate, description, created_time=None):
+    entry = ChangeStockHistory(seller_id=seller_id, server_id=server_id, stock=stock,
+                               active_rate_record=active_rate, description=description,
+                               created_time=created_time or timezone.now())
+    buffer = getattr(_local, 'buffer', None)
+    if buffer is None:
+        entry.save(force_insert=True)
+        return
+    buffer.append(entry)
+    if len(buffer) >= STOCK_HISTORY_BATCH_SIZE:
+        flush()
+
+
+def record_offer(offer, description, created_time=None):
+    # Лише *_id та поля самого лота: без запитів за offer.sellers і offer.server_urls
+    record(offer.sellers_id, offer.server_urls_id, offer.stock, offer.active_rate, description, created_time)
+
+
+def flush():
+    buffer = getattr(_local, 'buffer', None)
+    if buffer:
+        ChangeStockHistory.objects.bulk_create(buffer, batch_size=STOCK_HISTORY_BATCH_SIZE)
+        logger.debug("Stock history: %s records written", len(buffer))
+        buffer.clear()
+
+
+@contextmanager
+def buffered():
+    """Записи всередині блоку пишуться пакетами; у вкладеному блоці діє зовнішній буфер."""
+    if getattr(_local, 'buffer', None) is not None:
+        yield
+        return
+    _local.buffer = []
+    try:
+        yield
+        flush()
+    finally:
+        _local.buffer = None
+
+
+def _day_bounds(day):
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    return start, timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min))
+
+
+def compact_day(day):
+    """
+    Згортає рядки ChangeStockHistory за `day` (у часовому поясі проєкту) в підсумки по продавцю та серверу
+    і видаляє їх. Повертає (summaries, deleted).
+    """
+    start, end = _day_bounds(day)
+    rows = ChangeStockHistory.objects.filter(created_time__gte=start, created_time__lt=end)
+    with transaction.atomic():
+        groups = list(rows.values('seller_id', 'server_id').annotate(
+            events=Count('id'), min_stock=Min('stock'), max_stock=Max('stock'),
+            first_id=Min('id'), last_id=Max('id')).order_by())
+        if not groups:
+            return 0, 0
+        # Рядки дня пишуться в порядку часу, тож перший і останній id - перший і останній стан
+        edges = ChangeStockHistory.objects.in_bulk(
+            [group['first_id'] for group in groups] + [group['last_id'] for group in groups])
+        existing = {(summary.seller_id, summary.server_id): summary
+                    for summary in ChangeStockDailySummary.objects.filter(day=day)}
+
+        to_create, to_update = [], []
+        for group in groups:
+            first, last = edges[group['first_id']], edges[group['last_id']]
+            summary = existing.get((group['seller_id'], group['server_id']))
+            if summary is None:
+                to_create.append(ChangeStockDailySummary(
+                    seller_id=group['seller_id'], server_id=group['server_id'], day=day, events=group['events'],
+                    first_stock=first.stock, last_stock=last.stock, min_stock=group['min_stock'],
+                    max_stock=group['max_stock'], last_active_rate=last.active_rate_record))
+            else:
+                # День уже згортали: дописуємо рядки, що з'явились після цього
+                summary.events += group['events']
+                summary.min_stock = min(summary.min_stock, group['min_stock'])
+                summary.max_stock = max(summary.max_stock, group['max_stock'])
+                summary.last_stock = last.stock
+                summary.last_active_rate = last.active_rate_record
+                to_update.append(summary)
+
+        ChangeStockDailySummary.objects.bulk_create(to_create, batch_size=STOCK_HISTORY_BATCH_SIZE)
+        ChangeStockDailySummary.objects.bulk_update(
+            to_update, ['events', 'min_stock', 'max_stock', 'last_stock', 'last_active_rate'],
+            batch_size=STOCK_HISTORY_BATCH_SIZE)
+        deleted, _ = rows.delete()
+    return len(groups), deleted
+
+
+def days_to_compact(retention_days=STOCK_HISTORY_RETENTION_DAYS):
+    """Дні з рядками ChangeStockHistory, старшими за `retention_days`, від найстарішого."""
+    cutoff = timezone.localdate() - timedelta(days=retention_days)
+    oldest = ChangeStockHistory.objects.filter(created_time__lt=_day_bounds(cutoff)[0]).aggregate(
+        oldest=Min('created_time'))['oldest']
+    if oldest is None:
+        return []
+    day = timezone.localdate(oldest)
+    return [day + timedelta(days=offset) for offset in range((cutoff - day).days)]
+
+
+def compact_stock_history(retention_days=STOCK_HISTORY_RETENTION_DAYS):
+    # По дню за транзакцію: блокування бази короткі, перерваний запуск продовжиться з того ж місця
+    summaries = deleted = 0
+    for day in days_to_compact(retention_days):
+        day_summaries, day_deleted = compact_day(day)
+        summaries += day_summaries
+        deleted += day_deleted
+    logger.info("Stock history compacted: %s rows into %s daily summaries", deleted, summaries)
+    return summaries, deleted
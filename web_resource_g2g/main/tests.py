@@ -0,0 +1,607 @@
+import gzip
+import hashlib
+import io
+import json
+import os
+import tempfile
+import time
+from datetime import timedelta
+from unittest import mock
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.testing import WebsocketCommunicator
+from django.contrib.admin import site as admin_site
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import crud, video_storage
+from .consumers import SellerUpdatesConsumer
+from .models import (LatestTopPrices, OffersForPlacement, Sellers, ServerUrls, SoldOrders, StoredVideo,
+                     TelegramOutbox, TopPrices, VideoProcessingJob)
+from .realtime import seller_updates_watcher
+from .tg_bot_run import TelegramDispatcher, create_bot
+from .utils.admin_changelist import estimated_count_models, estimated_row_count, refresh_row_estimates
+from .utils.cache import TTLCache, balance_cache
+from .utils.db_triggers import install_top_prices_trigger
+from .utils.video_upload import remove_stale_part_files
+from .video_processing import NullVideoProcessor, preview_paths
+
+
+def create_seller(username):
+    user = User.objects.create_user(username=username, password='password')
+    return user, Sellers.objects.create(auth_user=user)
+
+
+def create_server(server_name='Firemaw'):
+    return ServerUrls.objects.create(server_name=server_name, game_name='WoW Classic', region='EU',
+                                     server_url='https://example.com/firemaw', fraction='Horde')
+
+
+def create_offer(seller, server, **fields):
+    values = dict(currency='Gold', description='', price='', stock=1000, min_units_per_order=100,
+                  percent_offset=0, duration=3, delivery_online_hrs=1, delivery_offline_hrs=8)
+    values.update(fields)
+    return OffersForPlacement.objects.create(sellers=seller, server_urls=server, **values)
+
+
+def create_sold_order(seller, server, **fields):
+    values = dict(status='Delivered', bought_by='buyer', character_name='Character', sold_order_number=1,
+                  quantity=1000, trade_mode='Face to face', download_video_status=True)
+    values.update(fields)
+    return SoldOrders.objects.create(seller=seller, server=server, **values)
+
+
+class OffersTableTests(TestCase):
+    def setUp(self):
+        self.user, self.seller = create_seller('seller')
+        self.offer = create_offer(self.seller, create_server())
+        self.client.force_login(self.user)
+
+    def test_not_modified_for_fields_restricted_request(self):
+        url = reverse('main:offers_table')
+        response = self.client.get(url, {'fields': 'id,stock'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'offers': [{'id': self.offer.id, 'stock': 1000}]})
+        self.assertNotIn(',', response['ETag'])
+
+        response = self.client.get(url, {'fields': 'stock,id'}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_etag_depends_on_fields_and_data(self):
+        url = reverse('main:offers_table')
+        full = self.client.get(url)
+        restricted = self.client.get(url, {'fields': 'id,stock'})
+        self.assertNotEqual(full['ETag'], restricted['ETag'])
+
+        self.offer.stock = 500
+        self.offer.save()
+        response = self.client.get(url, {'fields': 'id,stock'}, HTTP_IF_NONE_MATCH=restricted['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['offers'][0]['stock'], 500)
+
+
+class OffersBatchTests(TestCase):
+    def setUp(self):
+        self.user, self.seller = create_seller('seller')
+        self.server = create_server()
+        self.offer = create_offer(self.seller, self.server, price='mean10')
+
+    def edit_price(self, strategy):
+        crud.update_offers_batch([{'row_id': self.offer.id, 'field_name': 'price', 'new_value': strategy}],
+                                 self.user.id)
+        self.offer.refresh_from_db()
+
+    def test_strategy_is_saved_on_own_server(self):
+        self.edit_price('mean20')
+        self.assertEqual(self.offer.price, 'mean20')
+
+    def test_shared_server_keeps_shared_strategy(self):
+        # Активний лот іншого продавця робить сервер спільним, поки сторінка продавця вже відкрита
+        _, other_seller = create_seller('other')
+        create_offer(other_seller, self.server, price='mean10', active_rate=True)
+        self.edit_price('mean20')
+        self.assertEqual(self.offer.price, crud.BALANCE_STRATEGY)
+
+    def test_reconcile_command_applies_changes_made_outside_django(self):
+        # Сервер торгівлі активує лот іншого продавця напряму в базі
+        _, other_seller = create_seller('other')
+        other_offer = create_offer(other_seller, self.server, price='mean10')
+        OffersForPlacement.objects.filter(id=other_offer.id).update(active_rate=True)
+
+        call_command('reconcile_strategies', stdout=io.StringIO())
+        self.offer.refresh_from_db()
+        self.assertEqual(self.offer.price, crud.BALANCE_STRATEGY)
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class SellerUpdatesConsumerTests(TransactionTestCase):
+    # TransactionTestCase: database_sync_to_async читає базу з іншого потоку, поза транзакцією тесту
+
+    def setUp(self):
+        # Записи власника та технічного адміністратора: їхні баланси не надсилаються
+        for username in ('owner', 'technical'):
+            create_seller(username)
+        self.user, self.seller = create_seller('seller')
+        self.offer = create_offer(self.seller, create_server())
+
+    def communicator(self, user):
+        communicator = WebsocketCommunicator(SellerUpdatesConsumer.as_asgi(), '/ws/seller/')
+        communicator.scope['user'] = user
+        return communicator
+
+    def test_anonymous_user_is_rejected(self):
+        async def run():
+            communicator = self.communicator(AnonymousUser())
+            connected, _ = await communicator.connect()
+            self.assertFalse(connected)
+            self.assertIsNone(seller_updates_watcher._task)
+
+        async_to_sync(run)()
+
+    @mock.patch.object(seller_updates_watcher, 'interval', 0.05)
+    def test_each_connection_gets_one_copy(self):
+        async def run():
+            first, second = self.communicator(self.user), self.communicator(self.user)
+            for communicator in (first, second):
+                connected, _ = await communicator.connect()
+                self.assertTrue(connected)
+            self.assertEqual(len(seller_updates_watcher._sellers[self.user.id]), 2)
+
+            for communicator in (first, second):
+                received = []
+                for _ in range(2):
+                    received.append(json.loads(await communicator.receive_from(timeout=3))['type'])
+                self.assertEqual(sorted(received), ['balance', 'prices'])
+                self.assertTrue(await communicator.receive_nothing(timeout=0.3))
+
+            await first.disconnect()
+            self.assertEqual(len(seller_updates_watcher._sellers[self.user.id]), 1)
+            await second.disconnect()
+            self.assertIsNone(seller_updates_watcher._task)
+
+        async_to_sync(run)()
+
+    @mock.patch.object(seller_updates_watcher, 'interval', 0.05)
+    def test_watcher_pushes_offers_and_balance(self):
+        async def run():
+            communicator = self.communicator(self.user)
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            messages = {}
+            for _ in range(2):
+                message = json.loads(await communicator.receive_from(timeout=3))
+                messages[message['type']] = message
+            self.assertEqual([offer['id'] for offer in messages['prices']['offers']], [self.offer.id])
+            self.assertEqual(messages['balance']['balance'], '0.000')
+
+            await database_sync_to_async(Sellers.objects.filter(id=self.seller.id).update)(balance=25)
+            message = json.loads(await communicator.receive_from(timeout=3))
+            self.assertEqual(message, {'type': 'balance', 'balance': '25.000'})
+            await communicator.disconnect()
+
+        async_to_sync(run)()
+
+
+class AdminChangelistTests(TestCase):
+    def setUp(self):
+        _, self.seller = create_seller('seller')
+        server = create_server()
+        for number in range(5):
+            # Лише одне замовлення потрапляє в частковий індекс sold_seller_video_pending_idx
+            create_sold_order(self.seller, server, sold_order_number=number, download_video_status=number > 0)
+
+    def test_estimated_row_count_ignores_partial_indexes(self):
+        refresh_row_estimates([SoldOrders])
+        self.assertEqual(estimated_row_count(SoldOrders), 5)
+
+    def test_refresh_row_estimates_command_covers_large_changelists(self):
+        call_command('refresh_row_estimates', stdout=io.StringIO())
+        self.assertEqual(estimated_row_count(SoldOrders), 5)
+        self.assertEqual(estimated_count_models(admin_site).count(SoldOrders), 1)
+
+    def test_seller_filter_ignores_invalid_value(self):
+        admin = User.objects.create_superuser(username='admin', password='password')
+        self.client.force_login(admin)
+        url = reverse('admin:main_soldorders_changelist')
+        self.assertEqual(self.client.get(url, {'seller': 'abc'}).status_code, 200)
+        response = self.client.get(url, {'seller': self.seller.id})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['cl'].result_list), 5)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+                            'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                       'LOCATION': 'ttl-cache-tests'}})
+class TTLCacheTests(TestCase):
+    def test_shared_backend_sees_invalidation_from_another_process(self):
+        first = TTLCache('tests', backend_alias='shared')
+        second = TTLCache('tests', backend_alias='shared')
+        self.assertEqual(first.get('key', lambda: 'old'), 'old')
+        self.assertEqual(second.get('key', lambda: 'unused'), 'old')
+
+        second.invalidate('key')
+        self.assertEqual(first.get('key', lambda: 'new'), 'new')
+
+    def test_seller_change_resets_cache_after_commit(self):
+        _, seller = create_seller('seller')
+        balance_cache.get(seller.id, lambda: 'cached')
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            Sellers.objects.get(id=seller.id).save()
+            self.assertEqual(balance_cache.get(seller.id, lambda: 'reloaded'), 'cached')
+        self.assertTrue(callbacks)
+        self.assertEqual(balance_cache.get(seller.id, lambda: 'reloaded'), 'reloaded')
+
+
+class FakeTelegramServer:
+    """Bot API sendMessage: чат 403 заблокував бота, чат 429 отримує Too Many Requests на першу спробу."""
+
+    def __init__(self, calls):
+        # Спільний між запусками список chat_id усіх запитів
+        self.calls = calls
+        app = web.Application()
+        app.router.add_post('/bot{token}/sendMessage', self.send_message)
+        self.server = TestServer(app)
+
+    async def send_message(self, request):
+        data = await request.post()
+        chat_id = data['chat_id']
+        self.calls.append(chat_id)
+        if chat_id == '403':
+            return web.json_response({'ok': False, 'error_code': 403,
+                                      'description': 'Forbidden: bot was blocked by the user'})
+        if chat_id == '429' and self.calls.count(chat_id) == 1:
+            return web.json_response({'ok': False, 'error_code': 429, 'description': 'Too Many Requests',
+                                      'parameters': {'retry_after': 60}})
+        return web.json_response({'ok': True, 'result': {
+            'message_id': len(self.calls), 'date': 0, 'chat': {'id': int(chat_id), 'type': 'private'},
+            'text': data['text']}})
+
+    async def __aenter__(self):
+        await self.server.start_server()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.server.close()
+
+    @property
+    def url(self):
+        return str(self.server.make_url('')).rstrip('/')
+
+
+class TelegramDispatcherTests(TestCase):
+    def setUp(self):
+        _, seller = create_seller('seller')
+        self.order = create_sold_order(seller, create_server())
+        self.telegram_calls = []
+
+    def dispatch(self):
+        # chat_id запитів до Bot API за цей запуск диспетчера
+        async def run():
+            async with FakeTelegramServer(self.telegram_calls) as server:
+                bot = create_bot(token='123456:TEST', api_url=server.url)
+                try:
+                    await TelegramDispatcher(bot, per_chat_interval=0).run(once=True)
+                finally:
+                    await bot.session.close()
+
+        sent_before = len(self.telegram_calls)
+        async_to_sync(run)()
+        return self.telegram_calls[sent_before:]
+
+    def test_messages_are_sent_failed_or_retried(self):
+        crud.enqueue_telegram_messages([
+            TelegramOutbox(chat_id='100', text='Нове замовлення', sold_order=self.order),
+            TelegramOutbox(chat_id='403', text='Нове замовлення'),
+            TelegramOutbox(chat_id='429', text='Нове замовлення'),
+        ])
+        self.assertCountEqual(self.dispatch(), ['100', '403', '429'])
+
+        messages = {message.chat_id: message for message in TelegramOutbox.objects.all()}
+        self.assertEqual(messages['100'].status, TelegramOutbox.STATUS_SENT)
+        self.assertTrue(SoldOrders.objects.get(id=self.order.id).send_message)
+        self.assertEqual(messages['403'].status, TelegramOutbox.STATUS_FAILED)
+        self.assertEqual(messages['429'].status, TelegramOutbox.STATUS_PENDING)
+        self.assertEqual(messages['429'].attempts, 1)
+        self.assertGreater(messages['429'].next_attempt_time, timezone.now() + timedelta(seconds=50))
+
+        # Повтор настає після retry_after
+        TelegramOutbox.objects.filter(chat_id='429').update(next_attempt_time=timezone.now())
+        self.assertEqual(self.dispatch(), ['429'])
+        self.assertEqual(TelegramOutbox.objects.get(chat_id='429').status, TelegramOutbox.STATUS_SENT)
+
+    def test_only_abandoned_messages_are_released(self):
+        crud.enqueue_telegram_messages([TelegramOutbox(chat_id=str(chat_id), text='text') for chat_id in range(2)])
+        abandoned, in_flight = crud.claim_telegram_messages(2)
+        TelegramOutbox.objects.filter(id=abandoned.id).update(claimed_time=timezone.now() - timedelta(hours=1))
+
+        self.assertEqual(crud.release_stale_telegram_messages(claim_timeout=900), 1)
+        self.assertEqual(TelegramOutbox.objects.get(id=abandoned.id).status, TelegramOutbox.STATUS_PENDING)
+        self.assertEqual(TelegramOutbox.objects.get(id=in_flight.id).status, TelegramOutbox.STATUS_SENDING)
+
+    def test_message_is_marked_sent_when_delivered(self):
+        # Не чекаючи решти пакета: зупинка диспетчера не повторить уже надіслане
+        crud.enqueue_telegram_messages([TelegramOutbox(chat_id='100', text='text', sold_order=self.order)])
+        message, = crud.claim_telegram_messages(1)
+
+        async def run():
+            async with FakeTelegramServer(self.telegram_calls) as server:
+                bot = create_bot(token='123456:TEST', api_url=server.url)
+                try:
+                    return await TelegramDispatcher(bot).deliver(message)
+                finally:
+                    await bot.session.close()
+
+        self.assertTrue(async_to_sync(run)())
+        self.assertEqual(TelegramOutbox.objects.get(id=message.id).status, TelegramOutbox.STATUS_SENT)
+        self.assertTrue(SoldOrders.objects.get(id=self.order.id).send_message)
+
+    def test_retry_action_skips_messages_being_sent(self):
+        crud.enqueue_telegram_messages([TelegramOutbox(chat_id=str(chat_id), text='text') for chat_id in range(2)])
+        sending, failed = TelegramOutbox.objects.order_by('id')
+        TelegramOutbox.objects.filter(id=sending.id).update(status=TelegramOutbox.STATUS_SENDING)
+        TelegramOutbox.objects.filter(id=failed.id).update(status=TelegramOutbox.STATUS_FAILED)
+        self.client.force_login(User.objects.create_superuser(username='admin', password='password'))
+
+        self.client.post(reverse('admin:main_telegramoutbox_changelist'),
+                         {'action': 'retry_messages', '_selected_action': [sending.id, failed.id]})
+        self.assertEqual(TelegramOutbox.objects.get(id=sending.id).status, TelegramOutbox.STATUS_SENDING)
+        self.assertEqual(TelegramOutbox.objects.get(id=failed.id).status, TelegramOutbox.STATUS_PENDING)
+
+    def test_message_is_claimed_once(self):
+        crud.enqueue_telegram_messages([TelegramOutbox(chat_id=str(chat_id), text='text') for chat_id in range(3)])
+        first = crud.claim_telegram_messages(2)
+        second = crud.claim_telegram_messages(2)
+        self.assertEqual(len(first), 2)
+        self.assertEqual(len(second), 1)
+        self.assertFalse({message.id for message in first} & {message.id for message in second})
+        self.assertEqual(crud.claim_telegram_messages(2), [])
+
+
+class FailingVideoProcessor(NullVideoProcessor):
+    def probe(self, path):
+        raise RuntimeError('moov atom not found')
+
+
+class ThumbnailVideoProcessor(NullVideoProcessor):
+    def thumbnail(self, path, destination, duration=None):
+        with open(destination, 'wb') as file:
+            file.write(b'jpeg')
+        return destination
+
+
+class ProcessVideosTests(TestCase):
+    def setUp(self):
+        _, seller = create_seller('seller')
+        self.order = create_sold_order(seller, create_server(), path_to_video='videos/order.mp4')
+        previews_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(previews_dir.cleanup)
+        patcher = mock.patch('main.video_processing.VIDEO_PREVIEWS_DIR', previews_dir.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def process_videos(self, processor='main.video_processing.NullVideoProcessor', **options):
+        call_command('process_videos', once=True, workers=1, processor=processor, **options)
+
+    def test_ready_jobs_are_claimed_once(self):
+        ready = VideoProcessingJob.objects.create(sold_order=self.order, path=self.order.path_to_video)
+        VideoProcessingJob.objects.create(sold_order=self.order, path=self.order.path_to_video,
+                                          next_attempt_time=timezone.now() + timedelta(minutes=5))
+        VideoProcessingJob.objects.create(sold_order=self.order, path=self.order.path_to_video,
+                                          status=VideoProcessingJob.STATUS_PROCESSING)
+
+        self.assertEqual([job.id for job in crud.claim_video_jobs(10)], [ready.id])
+        self.assertEqual(crud.claim_video_jobs(10), [])
+        ready.refresh_from_db()
+        self.assertEqual((ready.status, ready.attempts), (VideoProcessingJob.STATUS_PROCESSING, 1))
+
+    def test_only_abandoned_jobs_are_released(self):
+        abandoned = VideoProcessingJob.objects.create(sold_order=self.order, path=self.order.path_to_video)
+        in_progress = VideoProcessingJob.objects.create(sold_order=self.order, path=self.order.path_to_video)
+        crud.claim_video_jobs(2)
+        VideoProcessingJob.objects.filter(id=abandoned.id).update(claimed_time=timezone.now() - timedelta(hours=1))
+
+        self.assertEqual(crud.release_stale_video_jobs(lease_timeout=600), 1)
+        self.assertEqual(VideoProcessingJob.objects.get(id=abandoned.id).status, VideoProcessingJob.STATUS_PENDING)
+        self.assertEqual(VideoProcessingJob.objects.get(id=in_progress.id).status,
+                         VideoProcessingJob.STATUS_PROCESSING)
+
+        # Продовжена оренда не застаріває
+        VideoProcessingJob.objects.filter(id=in_progress.id).update(claimed_time=timezone.now() - timedelta(hours=1))
+        crud.renew_video_jobs([in_progress])
+        self.assertEqual(crud.release_stale_video_jobs(lease_timeout=600), 0)
+
+    def test_thumbnail_is_shown_in_admin(self):
+        VideoProcessingJob.objects.create(sold_order=self.order, path=self.order.path_to_video)
+        self.process_videos('main.tests.ThumbnailVideoProcessor')
+        self.client.force_login(User.objects.create_superuser(username='admin', password='password'))
+
+        video_url = reverse('main:order_video', args=[self.order.id])
+        changelist = self.client.get(reverse('admin:main_soldorders_changelist'))
+        self.assertContains(changelist, f'{video_url}?version=thumbnail')
+        response = self.client.get(video_url, {'version': 'thumbnail'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(b''.join(response.streaming_content), b'jpeg')
+
+    def test_results_are_saved_to_order(self):
+        job = VideoProcessingJob.objects.create(sold_order=self.order, path=self.order.path_to_video)
+        self.process_videos()
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, VideoProcessingJob.STATUS_DONE)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.video_container, 'mp4')
+
+    def test_results_for_replaced_video_are_discarded(self):
+        job = VideoProcessingJob.objects.create(sold_order=self.order, path=self.order.path_to_video)
+        # Поки відео чекало обробки, продавець завантажив нове
+        SoldOrders.objects.filter(id=self.order.id).update(path_to_video='videos/order_new.mp4')
+        self.process_videos()
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, VideoProcessingJob.STATUS_DONE)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.video_container, '')
+
+    def test_failed_job_is_retried_then_failed(self):
+        job = VideoProcessingJob.objects.create(sold_order=self.order, path=self.order.path_to_video)
+        self.process_videos('main.tests.FailingVideoProcessor', max_attempts=2, retry_delay=60)
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (VideoProcessingJob.STATUS_PENDING, 1))
+        self.assertIn('moov atom not found', job.last_error)
+        self.assertGreater(job.next_attempt_time, timezone.now() + timedelta(seconds=50))
+
+        VideoProcessingJob.objects.filter(id=job.id).update(next_attempt_time=timezone.now())
+        self.process_videos('main.tests.FailingVideoProcessor', max_attempts=2, retry_delay=60)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (VideoProcessingJob.STATUS_FAILED, 2))
+        self.assertIsNotNone(job.finished_time)
+
+
+class VideoStorageTests(TestCase):
+    def setUp(self):
+        storage_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(storage_dir.cleanup)
+        self.storage_dir = storage_dir.name
+        for patcher in (mock.patch('main.video_storage.VIDEO_STORAGE_ROOT', os.path.join(self.storage_dir, 'videos')),
+                        mock.patch('main.video_storage.VIDEO_ARCHIVE_ROOT', os.path.join(self.storage_dir, 'archive')),
+                        mock.patch('main.utils.video_upload.VIDEO_UPLOAD_DIR',
+                                   os.path.join(self.storage_dir, 'uploads')),
+                        mock.patch('main.video_processing.VIDEO_PREVIEWS_DIR',
+                                   os.path.join(self.storage_dir, 'previews'))):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        os.makedirs(os.path.join(self.storage_dir, 'previews'))
+
+    def write_upload(self, content=b'video'):
+        path = os.path.join(self.storage_dir, f'upload_{hashlib.sha256(content).hexdigest()[:8]}.part')
+        with open(path, 'wb') as file:
+            file.write(content)
+        return path
+
+    def store_orphan(self, content=b'video'):
+        # Відео без посилань, старше за ORPHAN_GRACE_PERIOD, з постером і копією для перегляду
+        stored = video_storage.store_video(self.write_upload(content))
+        StoredVideo.objects.filter(id=stored.id).update(
+            created_time=timezone.now() - video_storage.ORPHAN_GRACE_PERIOD - timedelta(hours=1))
+        for path in preview_paths(stored.path):
+            open(path, 'wb').close()
+        return stored
+
+    def test_orphan_is_deleted_with_previews(self):
+        stored = self.store_orphan()
+        referenced = self.store_orphan(b'other video')
+        StoredVideo.objects.filter(id=referenced.id).update(ref_count=1)
+
+        self.assertEqual(video_storage.delete_orphans(), 1)
+        self.assertFalse(StoredVideo.objects.filter(id=stored.id).exists())
+        for path in (stored.path, *preview_paths(stored.path)):
+            self.assertFalse(os.path.exists(path), path)
+        self.assertTrue(os.path.exists(referenced.path))
+        self.assertTrue(all(os.path.exists(path) for path in preview_paths(referenced.path)))
+
+    def test_orphan_handed_out_as_duplicate_is_kept(self):
+        stored = self.store_orphan()
+        upload_path = self.write_upload()
+        self.assertEqual(video_storage.store_video(upload_path).id, stored.id)
+        self.assertFalse(os.path.exists(upload_path))
+
+        # Замовлення ще не послалось на файл, але відлік ORPHAN_GRACE_PERIOD почався заново
+        self.assertEqual(video_storage.delete_orphans(), 0)
+        self.assertTrue(os.path.exists(stored.path))
+
+
+    def create_order_with_video(self, content):
+        stored = video_storage.store_video(self.write_upload(content))
+        user, seller = create_seller('seller')
+        order = create_sold_order(seller, create_server(), path_to_video=stored.path)
+        StoredVideo.objects.filter(id=stored.id).update(ref_count=1)
+        return user, order, stored
+
+    def test_archived_video_is_moved_and_served_with_range(self):
+        user, order, stored = self.create_order_with_video(b'0123456789')
+        archive_path = video_storage.archive_video(stored)
+
+        self.assertFalse(os.path.exists(stored.path))
+        self.assertTrue(archive_path.startswith(os.path.join(self.storage_dir, 'archive')))
+        order.refresh_from_db()
+        self.assertEqual(order.path_to_video, archive_path)
+        self.assertEqual(StoredVideo.objects.get(id=stored.id).tier, StoredVideo.TIER_ARCHIVE)
+
+        self.client.force_login(user)
+        response = self.client.get(reverse('main:order_video', args=[order.id]), HTTP_RANGE='bytes=2-4')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 2-4/10')
+        self.assertEqual(b''.join(response.streaming_content), b'234')
+
+    def test_compressed_archive_is_unpacked(self):
+        _, order, stored = self.create_order_with_video(b'0123456789')
+        compressed_path = f"{stored.path}.gz"
+        with open(stored.path, 'rb') as source, gzip.open(compressed_path, 'wb') as destination:
+            destination.write(source.read())
+        os.remove(stored.path)
+        StoredVideo.objects.filter(id=stored.id).update(path=compressed_path)
+        SoldOrders.objects.filter(id=order.id).update(path_to_video=compressed_path)
+
+        self.assertEqual(video_storage.unpack_compressed_archives(), 1)
+        self.assertFalse(os.path.exists(compressed_path))
+        order.refresh_from_db()
+        self.assertEqual(order.path_to_video, stored.path)
+        with open(stored.path, 'rb') as file:
+            self.assertEqual(file.read(), b'0123456789')
+
+    def upload_part_files(self):
+        upload_dir = os.path.join(self.storage_dir, 'uploads')
+        return [name for name in os.listdir(upload_dir) if name.endswith('.part')] if os.path.isdir(upload_dir) else []
+
+    def test_form_upload_leaves_no_part_files(self):
+        url = reverse('main:upload_video', args=[12345])
+        response = self.client.post(url, {'video': io.BytesIO(b'video'), 'sent_gold': '1'})
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.upload_part_files(), [])
+
+        user, _ = create_seller('seller')
+        self.client.force_login(user)
+        response = self.client.post(url, {'video': io.BytesIO(b'video'), 'sent_gold': '1'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.upload_part_files(), [])
+
+    def test_stale_part_files_are_swept(self):
+        upload_dir = os.path.join(self.storage_dir, 'uploads')
+        os.makedirs(upload_dir)
+        stale, active, fresh = (os.path.join(upload_dir, f'{name}.part') for name in ('stale', 'active', 'fresh'))
+        for path in (stale, active, fresh):
+            open(path, 'wb').close()
+        day_ago = time.time() - 24 * 3600
+        for path in (stale, active):
+            os.utime(path, (day_ago, day_ago))
+
+        self.assertEqual(remove_stale_part_files(3600, keep=[active]), 1)
+        self.assertEqual(sorted(self.upload_part_files()), ['active.part', 'fresh.part'])
+
+class TopPricesTriggerTests(TestCase):
+    def create_top_prices(self, server, value):
+        return TopPrices.objects.create(server_name=server, top1=value, top5=value, top10=value, top20=value,
+                                        mean10=value, mean20=value, minimal=value, mean10_lot=value,
+                                        mean20_lot=value, double_minimal=value)
+
+    def test_latest_top_prices_follow_inserts(self):
+        # Тригер встановлює post_migrate під час створення тестової бази
+        server = create_server()
+        self.create_top_prices(server, 100)
+        latest = self.create_top_prices(server, 120)
+        self.assertEqual(LatestTopPrices.objects.get(server=server).top_price_id, latest.id)
+
+    def test_unsupported_database_is_skipped(self):
+        connection = mock.Mock(vendor='mysql')
+        with self.assertLogs('main.utils.db_triggers', 'WARNING'):
+            self.assertFalse(install_top_prices_trigger(connection))
+        connection.cursor.assert_not_called()
@@ -1,44 +1,126 @@
 import asyncio
 import os
+import time
+
 from aiogram import Bot
-from aiogram.exceptions import TelegramNetworkError
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+from asgiref.sync import sync_to_async
 from dotenv import load_dotenv
 
-from .utils.logger_config import logger
+from . import crud
+from .models import TelegramOutbox
+from .utils.logger_config import get_logger
+
+logger = get_logger(__name__)
 
 load_dotenv()
 BOT_TOKEN = os.getenv('TG_TOKEN')
+# Адреса Bot API; для тестів можна вказати локальний фейковий сервер, напр. http://127.0.0.1:8081
+TG_API_URL = os.getenv('TG_API_URL')
+# Хто отримує копії повідомлень про замовлення, через кому
+ADMIN_CHAT_IDS = [chat_id.strip() for chat_id in os.getenv('TG_ADMIN_CHAT_IDS', '190861163').split(',')
+                  if chat_id.strip()]
+
+
+def create_bot(token=BOT_TOKEN, api_url=TG_API_URL):
+    session = AiohttpSession(api=TelegramAPIServer.from_base(api_url)) if api_url else AiohttpSession()
+    return Bot(token=token, session=session)
+
+
+def order_notification_messages(order, chat_id, message):
+    # Повідомлення продавцю, пов'язане із замовленням, та копії адміністраторам.
+    # Надсилає їх диспетчер (manage.py run_tg_dispatcher)
+    return ([TelegramOutbox(chat_id=str(chat_id), text=message, sold_order=order)]
+            + [TelegramOutbox(chat_id=admin_chat_id, text=message) for admin_chat_id in ADMIN_CHAT_IDS])
+
+
+class TelegramDispatcher:
+    """
+    Надсилає повідомлення з черги telegram_outbox одним довгоживучим ботом.
+    Різним чатам повідомлення йдуть паралельно, одному чату - не частіше ніж раз на `per_chat_interval` секунд.
+    Невдалі спроби повторюються з експоненційною затримкою до `max_attempts` разів.
+    Повідомлення, забране понад `claim_timeout` секунд тому і досі не надіслане, вважається покинутим
+    зупиненим диспетчером і повертається в чергу; тайм-аут має бути довшим за обробку одного пакета.
+    """
+
+    def __init__(self, bot, concurrency=5, per_chat_interval=1.0, batch_size=50, poll_interval=2.0,
+                 max_attempts=5, retry_base_delay=5, retry_max_delay=3600, claim_timeout=900):
+        self.bot = bot
+        self.per_chat_interval = per_chat_interval
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.claim_timeout = claim_timeout
+        self._released_at = None
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._chat_locks = {}
+        self._chat_last_sent = {}
 
+    async def run(self, once=False):
+        while True:
+            await self.release_stale_messages()
+            processed = await self.process_batch()
+            if not processed:
+                if once:
+                    return
+                await asyncio.sleep(self.poll_interval)
 
-async def send_messages_to_users(seller_id, seller_name, message):
-    bot = Bot(token=BOT_TOKEN)
+    async def release_stale_messages(self):
+        # Не частіше ніж раз на claim_timeout: раніше жодне забране повідомлення не стане покинутим
+        now = time.monotonic()
+        if self._released_at is not None and now - self._released_at < self.claim_timeout:
+            return
+        self._released_at = now
+        released = await sync_to_async(crud.release_stale_telegram_messages)(self.claim_timeout)
+        if released:
+            logger.warning("Returned %s abandoned Telegram messages to the queue", released)
 
-    # ID отримувачів
-    recipients = {seller_id: seller_name, 190861163: 'Vlad'}   # 822070279: 'Vitaliy'
+    async def process_batch(self):
+        messages = await sync_to_async(crud.claim_telegram_messages)(self.batch_size)
+        results = await asyncio.gather(*(self.deliver(message) for message in messages))
+        if messages:
+            logger.info("Telegram batch: sent %s of %s", sum(results), len(messages))
+        return len(messages)
 
-    try:
-        for tg_id, name in recipients.items():
-            await bot.send_message(chat_id=tg_id, text=message)
-            logger.info(f'send_message for tg_id__{tg_id} - name__{name}, message__{message}')
-            print(f"✅ Повідомлення надіслано до {name}")
-            await asyncio.sleep(2)  # Затримка між відправками (не обов’язково)
-        return True
-    except TelegramNetworkError as e:
-        print(f"❌ Помилка мережі: {e}")
-    except Exception as e:
-        print(f"❌ Помилка надсилання повідомлення: {e}")
-    finally:
-        await bot.session.close()
+    async def deliver(self, message):
+        chat_lock = self._chat_locks.setdefault(message.chat_id, asyncio.Lock())
+        async with chat_lock:
+            await self._wait_for_chat(message.chat_id)
+            async with self._semaphore:
+                error, retry_delay = await self._send(message)
+            self._chat_last_sent[message.chat_id] = time.monotonic()
 
+        if error is None:
+            logger.info("send_message for tg_id__%s, outbox_id__%s", message.chat_id, message.id)
+            await sync_to_async(crud.mark_telegram_message_sent)(message)
+            return True
 
-def send_messages_sync(seller_id, seller_name, message):
-    """ Виклик асинхронної функції з синхронного коду """
-    response = asyncio.run(send_messages_to_users(seller_id, seller_name, message))
-    return True if response else False
+        if message.attempts + 1 >= self.max_attempts:
+            retry_delay = None
+        logger.error("Telegram message %s to %s failed: %s, retry in %s s",
+                     message.id, message.chat_id, error, retry_delay)
+        await sync_to_async(crud.mark_telegram_message_failed)(message, error, retry_delay)
+        return False
 
+    async def _send(self, message):
+        # Повертає (помилка, затримка до повтору); затримка None - повідомлення не повторюється
+        try:
+            await self.bot.send_message(chat_id=message.chat_id, text=message.text)
+        except TelegramRetryAfter as e:
+            return e, e.retry_after
+        except (TelegramNetworkError, TelegramServerError) as e:
+            return e, min(self.retry_base_delay * 2 ** message.attempts, self.retry_max_delay)
+        except Exception as e:
+            return e, None
+        return None, None
 
-# 🔹 Використання:
-if __name__ == "__main__":
-    test_message = "Тестове повідомлення"
-    test_seller_id = 123456789  # Замініть на справжній ID продавця
-    send_messages_sync(test_seller_id, test_message)
+    async def _wait_for_chat(self, chat_id):
+        last_sent = self._chat_last_sent.get(chat_id)
+        if last_sent is not None:
+            delay = self.per_chat_interval - (time.monotonic() - last_sent)
+            if delay > 0:
+                await asyncio.sleep(delay)
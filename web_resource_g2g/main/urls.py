@@ -5,12 +5,20 @@ app_name = 'main'
 
 urlpatterns = [
     path('', views.start_page, name='start_page'),
+    path('offers/', views.offers_table, name='offers_table'),
+    path('server_catalog/', views.server_catalog, name='server_catalog'),
     path('update_table_data/', views.update_table_data, name='update_table_data'),
+    path('update_table_data/batch/', views.update_offers_batch, name='update_offers_batch'),
     path('add_server/', views.add_server, name='add_server'),
     path('handle_option_change/', views.handle_option_change, name='handle_option_change'),
     path('show_order_info/', views.show_order_info, name='show_order_info'),
     path('upload_video/<int:sold_order_number>/', views.upload_video, name='upload_video'),
+    path('upload_video/<int:sold_order_number>/resumable/', views.create_video_upload, name='create_video_upload'),
+    path('video_uploads/<uuid:upload_id>/', views.video_upload_chunks, name='video_upload_chunks'),
+    path('video_uploads/<uuid:upload_id>/finalize/', views.finalize_video_upload, name='finalize_video_upload'),
+    path('orders/<int:order_id>/video/', views.stream_order_video, name='order_video'),
     path('history_orders/', views.show_history_orders, name='history_orders'),
     path('balance/', views.show_balance, name='balance'),
     path("delete_server/", views.delete_server, name="delete_server"),
+    path('query_stats/', views.query_stats, name='query_stats'),
 ]
@@ -0,0 +1,159 @@
+"""
+Списки адмінки для таблиць на мільйони рядків (SoldOrders): кількість без COUNT(*) по всій таблиці
+та date_hierarchy, що працює через індекс по полю дати.
+"""
+from datetime import datetime
+
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections
+from django.db.models import DateTimeField, F, Max, Min, QuerySet
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+# Якщо проміжків для перевірки більше, date_hierarchy рахується звичайним DISTINCT
+MAX_PROBED_PERIODS = 400
+
+
+def estimated_row_count(model, using='default'):
+    """
+    Кількість рядків таблиці зі статистики планувальника (ANALYZE) без COUNT(*).
+    None, якщо статистики немає.
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(%s)", [table])
+            elif connection.vendor == 'sqlite':
+                # Перше число в stat - кількість рядків у індексі на момент ANALYZE. Частковий індекс
+                # містить лише частину рядків, тож береться рядок без індексу (таблиця без індексів)
+                # або повного індексу
+                cursor.execute(
+                    "SELECT MAX(CAST(stat AS INTEGER)) FROM sqlite_stat1 WHERE tbl = %s AND (idx IS NULL OR "
+                    "idx NOT IN (SELECT name FROM pragma_index_list(%s) WHERE partial))", [table, table])
+            else:
+                return None
+            row = cursor.fetchone()
+    except DatabaseError:
+        # sqlite_stat1 з'являється лише після першого ANALYZE
+        return None
+    if row is None or row[0] is None:
+        return None
+    estimate = int(row[0])
+    return estimate if estimate >= 0 else None
+
+
+def refresh_row_estimates(models, using='default'):
+    """ANALYZE таблиць `models`, щоб оцінка estimated_row_count не відставала від дійсної кількості рядків."""
+    connection = connections[using]
+    if connection.vendor not in ('sqlite', 'postgresql'):
+        return
+    with connection.cursor() as cursor:
+        for model in models:
+            cursor.execute(f"ANALYZE {connection.ops.quote_name(model._meta.db_table)}")
+
+
+def estimated_count_models(site):
+    """
+    Моделі, списки яких в адмінці `site` беруть кількість рядків зі статистики (EstimatedCountPaginator).
+    Проксі-моделі тієї ж таблиці повертаються один раз.
+    """
+    models = {}
+    for model, model_admin in site._registry.items():
+        if issubclass(model_admin.paginator, EstimatedCountPaginator):
+            models.setdefault(model._meta.db_table, model)
+    return list(models.values())
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Пагінатор адмінки для великих таблиць.
+    Без фільтрів кількість береться зі статистики бази, з фільтрами - COUNT, обмежений `count_limit`
+    рядками: далі сторінки недоступні, зате запит не сканує всю таблицю.
+    """
+    # Нижче цього порогу оцінці не довіряємо і рахуємо точно
+    exact_count_threshold = 10_000
+    count_limit = 100_000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not isinstance(queryset, QuerySet):
+            return super().count
+        if not queryset.query.where:
+            estimate = estimated_row_count(queryset.model, queryset.db)
+            if estimate is not None and estimate > self.exact_count_threshold:
+                return estimate
+        return queryset[:self.count_limit].count()
+
+
+def _next_period(moment, kind):
+    if kind == 'year':
+        return moment.replace(year=moment.year + 1)
+    if kind == 'month':
+        return moment.replace(year=moment.year + moment.month // 12, month=moment.month % 12 + 1)
+    return datetime.fromordinal(moment.toordinal() + 1)
+
+
+def _period_start(moment, kind):
+    return datetime(moment.year, 1 if kind == 'year' else moment.month, moment.day if kind == 'day' else 1)
+
+
+class IndexedDatesQuerySet(QuerySet):
+    """
+    QuerySet для ChangeList з date_hierarchy.
+    Стандартний datetimes() - це DISTINCT по обрізаній даті кожного рядка; тут для кожного року/місяця/дня
+    між першим і останнім записом виконується EXISTS по діапазону, який бере індекс.
+    Min і Max одного поля рахуються окремими запитами: SQLite бере їх з індексу, лише коли агрегат один.
+    """
+
+    def aggregate(self, *args, **kwargs):
+        if not args and kwargs and all(self._is_bound_aggregate(aggregate) for aggregate in kwargs.values()):
+            return {name: self._bound(aggregate) for name, aggregate in kwargs.items()}
+        return super().aggregate(*args, **kwargs)
+
+    @staticmethod
+    def _is_bound_aggregate(aggregate):
+        expressions = aggregate.source_expressions
+        return (type(aggregate) in (Min, Max) and aggregate.filter is None
+                and len(expressions) == 1 and isinstance(expressions[0], F))
+
+    def _bound(self, aggregate):
+        field = aggregate.source_expressions[0].name
+        ordering = field if isinstance(aggregate, Min) else f'-{field}'
+        return (self.filter(**{f'{field}__isnull': False}).order_by(ordering)
+                .values_list(field, flat=True).first())
+
+    def datetimes(self, field_name, kind, order='ASC', tzinfo=None):
+        field = self.model._meta.get_field(field_name)
+        if kind not in ('year', 'month', 'day') or not isinstance(field, DateTimeField) or tzinfo is not None:
+            return super().datetimes(field_name, kind, order, tzinfo)
+
+        bounds = self.aggregate(first=Min(field_name), last=Max(field_name))
+        if bounds['first'] is None:
+            return []
+        current_timezone = timezone.get_current_timezone()
+        first = _period_start(timezone.localtime(bounds['first']).replace(tzinfo=None), kind)
+        last = timezone.localtime(bounds['last']).replace(tzinfo=None)
+
+        periods = []
+        start = first
+        while start <= last:
+            periods.append((start, _next_period(start, kind)))
+            if len(periods) > MAX_PROBED_PERIODS:
+                return super().datetimes(field_name, kind, order, tzinfo)
+            start = periods[-1][1]
+
+        result = []
+        for start, end in periods:
+            start = timezone.make_aware(start, current_timezone)
+            if self.filter(**{f'{field_name}__gte': start,
+                              f'{field_name}__lt': timezone.make_aware(end, current_timezone)}).exists():
+                result.append(start)
+        return result if order == 'ASC' else result[::-1]
+
+
+def indexed_dates(queryset):
+    return IndexedDatesQuerySet(model=queryset.model, query=queryset.query.chain(), using=queryset._db,
+                                hints=queryset._hints)
@@ -0,0 +1,103 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    LRU-кеш у пам'яті процесу з часом життя записів.
+    Якщо вказано `backend_alias`, значення зберігаються лише в кеші Django: він спільний для всіх процесів,
+    тож скидання в одному процесі одразу видно в інших. Локальна копія тоді не ведеться.
+    """
+
+    def __init__(self, prefix, maxsize=1024, ttl=300, backend_alias=None):
+        self.prefix = prefix
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.backend_alias = backend_alias
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def backend(self):
+        return caches[self.backend_alias] if self.backend_alias else None
+
+    def _backend_key(self, key):
+        return f"{self.prefix}:{key}"
+
+    def get(self, key, loader):
+        backend = self.backend
+        if backend is not None:
+            value = backend.get(self._backend_key(key), _MISSING)
+            if value is _MISSING:
+                value = loader()
+                backend.set(self._backend_key(key), value, self.ttl)
+            self._remember(key, None, 0)
+            return value
+
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[1] > now:
+                self._data.move_to_end(key)
+                return item[0]
+
+        value = loader()
+        self._remember(key, value, now + self.ttl)
+        return value
+
+    def _remember(self, key, value, expires):
+        # Зі спільним кешем тут лишаються тільки ключі для `clear`, без значень
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+        if self.backend is not None:
+            self.backend.delete(self._backend_key(key))
+
+    def clear(self):
+        # У спільному кеші видаляються лише ключі, відомі цьому процесу; решта застаріє за `ttl`
+        with self._lock:
+            keys = list(self._data)
+            self._data.clear()
+        if self.backend is not None:
+            self.backend.delete_many([self._backend_key(key) for key in keys])
+
+
+PRICE_CACHE_TTL = getattr(settings, 'PRICE_CACHE_TTL', 300)
+PRICE_CACHE_BACKEND = getattr(settings, 'PRICE_CACHE_BACKEND', None)
+
+# Поточна комісія біржі
+commission_cache = TTLCache('commission', maxsize=1, ttl=PRICE_CACHE_TTL, backend_alias=PRICE_CACHE_BACKEND)
+
+# auth_user_id -> {server_id: interest_rate}
+interest_rates_cache = TTLCache('interest_rates', maxsize=2048, ttl=PRICE_CACHE_TTL,
+                                backend_alias=PRICE_CACHE_BACKEND)
+
+BALANCE_CACHE_TTL = getattr(settings, 'BALANCE_CACHE_TTL', 60)
+
+# auth_user_id -> seller_id
+seller_ids_cache = TTLCache('seller_ids', maxsize=4096, ttl=PRICE_CACHE_TTL, backend_alias=PRICE_CACHE_BACKEND)
+
+# seller_id -> Sellers.balance
+balance_cache = TTLCache('seller_balance', maxsize=4096, ttl=BALANCE_CACHE_TTL, backend_alias=PRICE_CACHE_BACKEND)
+
+# Варіанти фільтра "Продавець" у списках замовлень адмінки: [(seller_id, username)]
+seller_choices_cache = TTLCache('seller_choices', maxsize=1, ttl=PRICE_CACHE_TTL, backend_alias=PRICE_CACHE_BACKEND)
+
+SERVER_CATALOG_CACHE_TTL = getattr(settings, 'SERVER_CATALOG_CACHE_TTL', 3600)
+
+# Каталог серверів для форми додавання: гра -> регіон -> відсортовані назви, з версією вмісту.
+# Скидається сигналом ServerUrls; `ttl` - запас на зміни, зроблені в базі сервером торгівлі
+server_catalog_cache = TTLCache('server_catalog', maxsize=1, ttl=SERVER_CATALOG_CACHE_TTL,
+                                backend_alias=PRICE_CACHE_BACKEND)
@@ -0,0 +1,91 @@
+"""
+Тригери бази даних, які підтримують таблицю `latest_top_prices`.
+`top_prices` наповнює парсер поза Django, тому сигнали моделей тут не спрацюють.
+"""
+from .logger_config import get_logger
+
+logger = get_logger(__name__)
+
+PRICE_COLUMNS = ('top1', 'top5', 'top10', 'top20', 'mean10', 'mean20', 'minimal',
+                 'mean10_lot', 'mean20_lot', 'double_minimal')
+
+_COLUMNS = ', '.join(('server_id', 'top_price_id') + PRICE_COLUMNS + ('created_at',))
+_NEW_VALUES = ', '.join(('NEW.server_name_id', 'NEW.id')
+                        + tuple(f'NEW.{column}' for column in PRICE_COLUMNS) + ('NEW.created_at',))
+_UPSERT_SET = ', '.join(f'{column} = excluded.{column}'
+                        for column in ('top_price_id',) + PRICE_COLUMNS + ('created_at',))
+
+_UPSERT = f"""
+    INSERT INTO latest_top_prices ({_COLUMNS})
+    VALUES ({_NEW_VALUES})
+    ON CONFLICT (server_id) DO UPDATE SET {_UPSERT_SET}
+    WHERE excluded.top_price_id > latest_top_prices.top_price_id;
+"""
+
+SQLITE_TRIGGER = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS top_prices_latest_insert
+    AFTER INSERT ON top_prices
+    BEGIN
+    {_UPSERT}
+    END;
+    """,
+]
+
+POSTGRESQL_TRIGGER = [
+    f"""
+    CREATE OR REPLACE FUNCTION top_prices_latest_insert() RETURNS trigger AS $$
+    BEGIN
+    {_UPSERT}
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql;
+    """,
+    "DROP TRIGGER IF EXISTS top_prices_latest_insert ON top_prices;",
+    """
+    CREATE TRIGGER top_prices_latest_insert
+    AFTER INSERT ON top_prices
+    FOR EACH ROW EXECUTE FUNCTION top_prices_latest_insert();
+    """,
+]
+
+DROP_TRIGGER = {
+    'sqlite': ["DROP TRIGGER IF EXISTS top_prices_latest_insert;"],
+    'postgresql': [
+        "DROP TRIGGER IF EXISTS top_prices_latest_insert ON top_prices;",
+        "DROP FUNCTION IF EXISTS top_prices_latest_insert();",
+    ],
+}
+
+REFRESH_LATEST_TOP_PRICES = f"""
+    INSERT INTO latest_top_prices ({_COLUMNS})
+    SELECT {', '.join(('server_name_id', 'id') + PRICE_COLUMNS + ('created_at',))}
+    FROM top_prices
+    WHERE id IN (SELECT MAX(id) FROM top_prices GROUP BY server_name_id)
+"""
+
+
+def install_top_prices_trigger(connection):
+    # Повертає False, якщо для цієї бази тригера немає: міграції та post_migrate не мають на цьому падати
+    statements = {'sqlite': SQLITE_TRIGGER, 'postgresql': POSTGRESQL_TRIGGER}.get(connection.vendor)
+    if statements is None:
+        logger.warning("latest_top_prices trigger is not available for %s, the table will not be updated",
+                       connection.vendor)
+        return False
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+    return True
+
+
+def drop_top_prices_trigger(connection):
+    with connection.cursor() as cursor:
+        for statement in DROP_TRIGGER.get(connection.vendor, []):
+            cursor.execute(statement)
+
+
+def refresh_latest_top_prices(connection):
+    # Повністю перебудовує `latest_top_prices` з історії цін
+    with connection.cursor() as cursor:
+        cursor.execute("DELETE FROM latest_top_prices")
+        cursor.execute(REFRESH_LATEST_TOP_PRICES)
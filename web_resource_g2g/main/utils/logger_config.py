@@ -1,55 +1,142 @@
-import logging.handlers
+"""
+Логування застосунку main.
+
+Потоки запитів лише кладуть запис у чергу (QueueHandler); у файл (JSON-рядки) та консоль пише
+окремий потік QueueListener, тож повільний диск не затримує відповіді.
+Повідомлення форматуються ліниво: пишіть logger.info("order %s", number), а не f-рядки,
+тоді вимкнені рівні та відкинуті семплюванням записи взагалі не форматуються.
+
+Оточення:
+    LOG_LEVEL=INFO                                   рівень для всього main
+    LOG_LEVELS=main.views=WARNING,main.crud=DEBUG    рівні окремих модулів
+    LOG_DEBUG_SAMPLE_RATE=0.1                        частка DEBUG-записів, що потрапляють у лог
+    LOG_FILE=/path/front_server.log
+"""
+import atexit
+import copy
+import itertools
+import json
 import logging
+import logging.handlers
 import os
+import queue
 import sys
+from datetime import datetime, timezone
+
 import coloredlogs
 
+BASE_LOGGER_NAME = 'main'
 max_bytes = 1024 * 1024 * 1024  # 1 GB
 backup_count = 1
 
-# Create a logger instance
-logger = logging.getLogger(__name__)
-
-# Set the logging level to DEBUG to capture all messages
-logger.setLevel(logging.INFO)
-
-# Get the path to the executable file
-executable_path = os.path.abspath(sys.executable)
-
-# Create a log file in the same directory as the executable
-log_file = os.path.join(os.path.dirname(executable_path), "front_server.ans")
-
-# Create a file handler using the `logging.handlers` module
-file_handler = logging.handlers.RotatingFileHandler(
-    log_file,
-    maxBytes=max_bytes,
-    backupCount=backup_count,
-    encoding='utf-8'
-)
-
-# Formatter for the file
-file_formatter = logging.Formatter(
-    '\033[1;32m%(asctime)s - %(levelname)s -'
-    ' \033[1;33m%(module)s\033[1;32m.\033[1;34m%(funcName)s\033[1;32m:%(lineno)d - %(message)s\033[0m'
-)
-file_handler.setFormatter(file_formatter)
-
-# Add the file handler to the logger
-logger.addHandler(file_handler)
-
-# Налаштування StreamHandler для виводу в консоль з UTF-8
-console_handler = logging.StreamHandler(stream=sys.stdout)  # Використовуємо sys.stdout
-console_handler.setFormatter(file_formatter)  # Використовуємо той самий formatter, що й для файлу
-logger.addHandler(console_handler)
-
-# Console colored output configuration
-coloredlogs.install(level='INFO',
-                    fmt='\033[1;32m%(asctime)s - %(levelname)s -'
-                        ' \033[1;33m%(module)s\033[1;32m.\033[1;34m%(funcName)s\033[1;32m:%(lineno)d - %(message)s\033[0m',
-                    datefmt='%H:%M:%S',
-                    logger=logger)
-
-
+# Файл поруч із виконуваним файлом Python, як і раніше
+log_file = os.getenv('LOG_FILE') or os.path.join(os.path.dirname(os.path.abspath(sys.executable)), "front_server.log")
+
+console_format = '%(asctime)s - %(levelname)s - %(module)s.%(funcName)s:%(lineno)d - %(message)s'
+
+# Атрибути, які є в кожному LogRecord; решта - це поля, передані через extra=
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'func': record.funcName,
+            'line': record.lineno,
+            'message': record.getMessage(),
+            'process': record.process,
+            'thread': record.threadName,
+        }
+        entry.update({key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES})
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускає кожен N-й запис рівня DEBUG і нижче з кожного місця виклику; решту відкидає."""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.every = max(1, round(1 / rate)) if rate > 0 else 0
+        self._counters = {}
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or self.every == 1:
+            return True
+        if not self.every:
+            return False
+        counter = self._counters.setdefault((record.pathname, record.lineno), itertools.count())
+        return next(counter) % self.every == 0
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    # Стандартний prepare() форматує запис ще в потоці запиту; тут лише підставляються аргументи,
+    # а час, JSON та кольори форматує потік QueueListener
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def parse_levels(value):
+    levels = {}
+    for item in filter(None, (part.strip() for part in value.split(','))):
+        name, _, level = item.partition('=')
+        levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def configure_logging():
+    base_logger = logging.getLogger(BASE_LOGGER_NAME)
+    base_logger.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
+    base_logger.propagate = False
+    for name, level in parse_levels(os.getenv('LOG_LEVELS', '')).items():
+        logging.getLogger(name).setLevel(level)
+
+    file_handler = logging.handlers.RotatingFileHandler(
+        log_file,
+        maxBytes=max_bytes,
+        backupCount=backup_count,
+        encoding='utf-8'
+    )
+    file_handler.setFormatter(JsonFormatter())
+
+    console_handler = logging.StreamHandler(stream=sys.stdout)
+    if sys.stdout.isatty():
+        console_handler.setFormatter(coloredlogs.ColoredFormatter(fmt=console_format, datefmt='%H:%M:%S'))
+    else:
+        console_handler.setFormatter(logging.Formatter(console_format))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = LazyQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(float(os.getenv('LOG_DEBUG_SAMPLE_RATE', 1))))
+    base_logger.addHandler(queue_handler)
+
+    listener = logging.handlers.QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+    listener.start()
+    # Дописати чергу у файл під час зупинки процесу
+    atexit.register(listener.stop)
+    return base_logger
+
+
+def get_logger(name):
+    """Логер модуля (get_logger(__name__)); його рівень можна змінити через LOG_LEVELS."""
+    if not name.startswith(BASE_LOGGER_NAME + '.') and name != BASE_LOGGER_NAME:
+        name = f"{BASE_LOGGER_NAME}.{name}"
+    return logging.getLogger(name)
+
+
+logger = configure_logging()
 
 
 # Logging uncaught exceptions
@@ -63,4 +150,3 @@ def handle_exception(exc_type, exc_value, exc_traceback):
 
 # Override default exception hook
 sys.excepthook = handle_exception
-
@@ -0,0 +1,162 @@
+"""
+Облік SQL-запитів кожного HTTP-запиту: кількість, час у базі, найповільніші запити з місцем виклику
+та повтори одного й того самого SQL (типова ознака N+1 у crud.py).
+Підсумки останніх запитів зберігаються в пам'яті процесу (RequestStatsLog) для сторінки query_stats.
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict, deque
+
+from django.conf import settings
+
+# Скільки найповільніших запитів запам'ятовується для кожного HTTP-запиту
+SLOWEST_QUERIES = 5
+# Скільки останніх HTTP-запитів тримати для сторінки зі зведенням
+QUERY_STATS_HISTORY = getattr(settings, 'QUERY_STATS_HISTORY', 1000)
+
+_PROJECT_ROOT = str(settings.BASE_DIR) + os.sep
+_PACKAGES_DIR = os.sep + 'site-packages' + os.sep
+# Кадри обліку самих запитів, а не коду, що їх робить
+_SKIPPED_FILES = {os.path.abspath(__file__),
+                  os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'middleware.py')}
+_DJANGO_DB_DIR = os.path.join('django', 'db') + os.sep
+
+
+def call_site():
+    """
+    Перший кадр стеку з коду проєкту, напр. 'main/crud.py:120 in get_orders_history'.
+    Якщо запит зроблено лише кодом бібліотек (шаблони адмінки), - перший кадр поза django.db.
+    """
+    fallback = ''
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename not in _SKIPPED_FILES:
+            if filename.startswith(_PROJECT_ROOT) and _PACKAGES_DIR not in filename:
+                return f"{os.path.relpath(filename, _PROJECT_ROOT)}:{frame.f_lineno} in {frame.f_code.co_name}"
+            if not fallback and _DJANGO_DB_DIR not in filename:
+                fallback = f"{filename.rpartition(_PACKAGES_DIR)[2]}:{frame.f_lineno} in {frame.f_code.co_name}"
+        frame = frame.f_back
+    return fallback
+
+
+class QueryRecorder:
+    """execute_wrapper для connection.execute_wrapper(): вимірює кожен запит з'єднання."""
+
+    def __init__(self, alias='default'):
+        self.alias = alias
+        self.count = 0
+        self.duration = 0.0
+        self.slowest = []
+        self._statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            self.count += 1
+            self.duration += duration
+            # SQL з плейсхолдерами однаковий для всіх рядків циклу, тож повтори видно без параметрів
+            self._statements[sql] += 1
+            if len(self.slowest) < SLOWEST_QUERIES or duration > self.slowest[-1]['ms'] / 1000:
+                self.slowest.append({'ms': round(duration * 1000, 3), 'sql': sql, 'site': call_site(),
+                                     'alias': self.alias})
+                self.slowest.sort(key=lambda query: query['ms'], reverse=True)
+                del self.slowest[SLOWEST_QUERIES:]
+
+    @property
+    def duplicates(self):
+        return {sql: count for sql, count in self._statements.items() if count > 1}
+
+
+class RequestStats:
+    def __init__(self, view, path, method, status, recorders, total_time):
+        self.view = view
+        self.path = path
+        self.method = method
+        self.status = status
+        self.time = time.time()
+        self.total_ms = round(total_time * 1000, 3)
+        self.queries = sum(recorder.count for recorder in recorders)
+        self.db_ms = round(sum(recorder.duration for recorder in recorders) * 1000, 3)
+        self.slowest = sorted((query for recorder in recorders for query in recorder.slowest),
+                              key=lambda query: query['ms'], reverse=True)[:SLOWEST_QUERIES]
+        self.duplicates = Counter()
+        for recorder in recorders:
+            self.duplicates.update(recorder.duplicates)
+
+    @property
+    def duplicate_queries(self):
+        # Зайві виконання: без першого запуску кожного SQL
+        return sum(count - 1 for count in self.duplicates.values())
+
+    def as_dict(self):
+        return {
+            'view': self.view,
+            'path': self.path,
+            'method': self.method,
+            'status': self.status,
+            'time': self.time,
+            'total_ms': self.total_ms,
+            'queries': self.queries,
+            'db_ms': self.db_ms,
+            'duplicate_queries': self.duplicate_queries,
+            'duplicates': [{'sql': sql, 'count': count} for sql, count in self.duplicates.most_common(SLOWEST_QUERIES)],
+            'slowest': self.slowest,
+        }
+
+
+def _percentile(values, share):
+    values = sorted(values)
+    return values[max(0, int(len(values) * share + 0.5) - 1)] if values else 0
+
+
+class RequestStatsLog:
+    """Кільцевий буфер останніх RequestStats процесу зі зведенням за view."""
+
+    def __init__(self, maxlen=QUERY_STATS_HISTORY):
+        self._items = deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+
+    def add(self, stats):
+        with self._lock:
+            self._items.append(stats)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def recent(self):
+        with self._lock:
+            return list(self._items)
+
+    def summary(self):
+        by_view = defaultdict(list)
+        for stats in self.recent():
+            by_view[stats.view].append(stats)
+
+        rows = []
+        for view, items in by_view.items():
+            queries = [stats.queries for stats in items]
+            db_times = [stats.db_ms for stats in items]
+            worst = max(items, key=lambda stats: (stats.queries, stats.db_ms))
+            rows.append({
+                'view': view,
+                'requests': len(items),
+                'avg_queries': round(sum(queries) / len(items), 1),
+                'max_queries': max(queries),
+                'avg_db_ms': round(sum(db_times) / len(items), 3),
+                'p95_db_ms': _percentile(db_times, 0.95),
+                'p95_total_ms': _percentile([stats.total_ms for stats in items], 0.95),
+                'duplicate_queries': max(stats.duplicate_queries for stats in items),
+                'worst': worst.as_dict(),
+            })
+        rows.sort(key=lambda row: row['max_queries'], reverse=True)
+        return rows
+
+
+request_stats_log = RequestStatsLog()
@@ -0,0 +1,138 @@
+"""
+Віддача відео з підтримкою Range та умовних запитів.
+За проксі віддачу можна делегувати nginx (X-Accel-Redirect) або Apache/lighttpd (X-Sendfile),
+тоді процес Django лише перевіряє права і не читає файл.
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+
+# '' - віддає Django, 'x-accel-redirect' - nginx, 'x-sendfile' - Apache mod_xsendfile / lighttpd
+VIDEO_SERVE_BACKEND = getattr(settings, 'VIDEO_SERVE_BACKEND', '')
+# internal-location nginx, яка відповідає MEDIA_ROOT
+VIDEO_ACCEL_REDIRECT_LOCATION = getattr(settings, 'VIDEO_ACCEL_REDIRECT_LOCATION', '/protected-media/')
+VIDEO_STREAM_BLOCK_SIZE = 512 * 1024
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class VideoFileResponse(FileResponse):
+    block_size = VIDEO_STREAM_BLOCK_SIZE
+
+
+class RangeFile:
+    """Обмежує читання файлу діапазоном, щоб FileResponse не віддав більше ніж Content-Length."""
+
+    def __init__(self, file, start, length):
+        self.file = file
+        self.file.seek(start)
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        size = self.remaining if size < 0 else min(size, self.remaining)
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def parse_range(header, size):
+    """
+    Повертає (start, end) включно для одного діапазону, None - якщо заголовка немає або він
+    не підтримується (віддається весь файл), та ValueError - якщо діапазон поза файлом.
+    """
+    match = RANGE_RE.match(header.replace(' ', '')) if header else None
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # bytes=-N - останні N байтів
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError(f"Range {header} is not satisfiable for {size} bytes")
+    return start, end
+
+
+def _if_range_matches(request, etag, last_modified):
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def serve_video(request, path, etag_value):
+    """
+    Віддає файл відео. `etag_value` - стабільний ідентифікатор вмісту (sha256 для сховища).
+    """
+    stat = os.stat(path)
+    size = stat.st_size
+    last_modified = int(stat.st_mtime)
+    etag = quote_etag(etag_value)
+
+    conditional = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if conditional is not None:
+        return conditional
+
+    content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    if VIDEO_SERVE_BACKEND:
+        response = _delegated_response(path)
+    else:
+        response = _file_response(request, path, size, etag, last_modified)
+
+    response['Content-Type'] = content_type
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = 'private, max-age=3600'
+    return response
+
+
+def _file_response(request, path, size, etag, last_modified):
+    try:
+        byte_range = parse_range(request.headers.get('Range'), size)
+    except ValueError:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    if byte_range is not None and not _if_range_matches(request, etag, last_modified):
+        byte_range = None
+
+    if byte_range is None:
+        # Весь файл: WSGI-сервер віддає його через sendfile (wsgi.file_wrapper)
+        response = VideoFileResponse(open(path, 'rb'))
+        response['Content-Length'] = size
+    else:
+        start, end = byte_range
+        response = VideoFileResponse(RangeFile(open(path, 'rb'), start, end - start + 1), status=206)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = end - start + 1
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def _delegated_response(path):
+    # Range, If-Range та sendfile обробляє проксі
+    response = HttpResponse()
+    if VIDEO_SERVE_BACKEND == 'x-accel-redirect':
+        relative_path = os.path.relpath(path, settings.MEDIA_ROOT)
+        response['X-Accel-Redirect'] = VIDEO_ACCEL_REDIRECT_LOCATION.rstrip('/') + '/' + quote(relative_path)
+    else:
+        response['X-Sendfile'] = path
+    return response
@@ -0,0 +1,197 @@
+"""
+Запис відео продавців на диск без проміжних копій.
+Файли пишуться відразу в теку videos як `.part` і після перевірки перейменовуються
+у сховище (main.video_storage) без копіювання.
+"""
+import hashlib
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload
+
+from .logger_config import get_logger
+
+logger = get_logger(__name__)
+
+VIDEO_UPLOAD_DIR = getattr(settings, 'VIDEO_UPLOAD_DIR', os.path.join(settings.MEDIA_ROOT, 'videos'))
+VIDEO_UPLOAD_MAX_SIZE = getattr(settings, 'VIDEO_UPLOAD_MAX_SIZE', 4 * 1024 ** 3)
+# Розмір шматка, яким тіло запиту читається та пишеться у файл
+VIDEO_WRITE_BUFFER = 1024 * 1024
+
+
+class ChecksumMismatch(Exception):
+    pass
+
+
+class UploadBusy(Exception):
+    pass
+
+
+def create_part_file(name):
+    os.makedirs(VIDEO_UPLOAD_DIR, exist_ok=True)
+    path = os.path.join(VIDEO_UPLOAD_DIR, f"{name}.part")
+    open(path, 'ab').close()
+    return path
+
+
+@contextmanager
+def upload_lock(path):
+    """
+    Виключний доступ до файлу одного завантаження для всіх запитів і процесів: перевірка зсуву,
+    запис шматка та зарахування зсуву мають іти під ним. Якщо файл уже зайнятий - UploadBusy.
+    """
+    with open(f"{path}.lock", 'a+b') as lock_file:
+        try:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            raise UploadBusy(path)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def remove_upload_lock(path):
+    try:
+        os.remove(f"{path}.lock")
+    except FileNotFoundError:
+        pass
+
+
+def remove_stale_part_files(max_age, keep=()):
+    """
+    Видаляє з теки videos файли `.part` (разом із `.lock`), які не змінювались `max_age` секунд
+    і не належать незавершеним завантаженням із `keep`. Так прибираються файли форм, обірваних
+    до виклику view, та залишки завантажень, запис про які вже видалено. Повертає кількість файлів.
+    """
+    if not os.path.isdir(VIDEO_UPLOAD_DIR):
+        return 0
+    keep = {os.path.abspath(path) for path in keep}
+    cutoff = time.time() - max_age
+    removed = 0
+    for name in os.listdir(VIDEO_UPLOAD_DIR):
+        path = os.path.abspath(os.path.join(VIDEO_UPLOAD_DIR, name))
+        if not name.endswith('.part') or path in keep:
+            continue
+        try:
+            if os.path.getmtime(path) >= cutoff:
+                continue
+            os.remove(path)
+        except FileNotFoundError:
+            continue
+        remove_upload_lock(path)
+        removed += 1
+    return removed
+
+
+def write_chunk(path, offset, stream, length, expected_sha256=None):
+    """
+    Дописує `length` байтів із `stream` у файл з позиції `offset`, рахуючи sha256 шматка.
+    Якщо хеш не збігся з `expected_sha256` (bytes), шматок відкидається і піднімається ChecksumMismatch.
+    Повертає кількість записаних байтів. Викликається під upload_lock з `offset`, рівним зарахованому
+    зсуву завантаження, тож обрізання файлу ніколи не зачіпає вже зарахованих байтів.
+    """
+    digest = hashlib.sha256()
+    written = 0
+    with open(path, 'r+b') as destination:
+        destination.seek(offset)
+        while written < length:
+            data = stream.read(min(VIDEO_WRITE_BUFFER, length - written))
+            if not data:
+                break
+            destination.write(data)
+            digest.update(data)
+            written += len(data)
+
+        if expected_sha256 is not None and digest.digest() != expected_sha256:
+            destination.truncate(offset)
+            raise ChecksumMismatch(f"chunk at offset {offset} does not match Upload-Checksum")
+        # Обірване з'єднання лишає недописаний шматок: зберігаємо тільки те, що реально отримали
+        destination.truncate(offset + written)
+    return written
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as source:
+        for data in iter(lambda: source.read(VIDEO_WRITE_BUFFER), b''):
+            digest.update(data)
+    return digest.hexdigest()
+
+
+class StreamedVideoFile(UploadedFile):
+    def __init__(self, file, name, content_type, size, charset, sha256):
+        super().__init__(file, name, content_type, size, charset)
+        self.sha256 = sha256
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+class StreamingVideoUploadHandler(FileUploadHandler):
+    """
+    Пише файли з multipart-форми відразу в теку videos замість пам'яті або системного /tmp,
+    тож після розбору запиту файл лишається тільки перейменувати. Після відповіді view викликає
+    discard_files, щоб не лишилось файлів, які так і не потрапили у сховище.
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.paths = []
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        os.makedirs(VIDEO_UPLOAD_DIR, exist_ok=True)
+        descriptor, path = tempfile.mkstemp(suffix='.part', dir=VIDEO_UPLOAD_DIR)
+        os.close(descriptor)
+        self.paths.append(path)
+        self.file = open(path, 'wb')
+        self.digest = hashlib.sha256()
+        self.size = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.size += len(raw_data)
+        if self.size > VIDEO_UPLOAD_MAX_SIZE:
+            self.upload_interrupted()
+            logger.warning("Video upload %s is larger than %s bytes", self.file_name, VIDEO_UPLOAD_MAX_SIZE)
+            raise StopUpload(connection_reset=True)
+        self.file.write(raw_data)
+        self.digest.update(raw_data)
+
+    def file_complete(self, file_size):
+        self.file.close()
+        return StreamedVideoFile(self.file, self.file_name, self.content_type, file_size, self.charset,
+                                 self.digest.hexdigest())
+
+    def upload_interrupted(self):
+        # Недокачаний файл видаляємо; MultiPartParser потім ще раз закриє self.file
+        file = getattr(self, 'file', None)
+        if file is not None:
+            file.close()
+            if os.path.exists(file.name):
+                os.remove(file.name)
+
+    def discard_files(self):
+        # Збережений файл уже перейменовано у сховище, тож видаляються лише відкинуті
+        for path in self.paths:
+            if os.path.exists(path):
+                os.remove(path)
+        self.paths = []
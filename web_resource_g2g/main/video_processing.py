@@ -0,0 +1,98 @@
+"""
+Обробка завантажених відео поза запитом: тривалість і контейнер, постер та легка копія для перегляду.
+Інструмент підключається налаштуванням VIDEO_PROCESSOR (шлях до класу);
+NullVideoProcessor нічого не кодує і підходить для тестів та машин без ffmpeg.
+"""
+import json
+import os
+import subprocess
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+VIDEO_PROCESSOR = getattr(settings, 'VIDEO_PROCESSOR', 'main.video_processing.FFmpegVideoProcessor')
+VIDEO_PREVIEWS_DIR = getattr(settings, 'VIDEO_PREVIEWS_DIR', os.path.join(settings.MEDIA_ROOT, 'video_previews'))
+
+
+class NullVideoProcessor:
+    def probe(self, path):
+        return {'container': os.path.splitext(path)[1].lstrip('.').lower(), 'duration': None}
+
+    def thumbnail(self, path, destination, duration=None):
+        return None
+
+    def review_rendition(self, path, destination):
+        return None
+
+
+class FFmpegVideoProcessor:
+    def __init__(self, ffmpeg='ffmpeg', ffprobe='ffprobe', thumbnail_width=480,
+                 review_height=480, review_video_bitrate='600k', review_audio_bitrate='64k', timeout=1800):
+        self.ffmpeg = ffmpeg
+        self.ffprobe = ffprobe
+        self.thumbnail_width = thumbnail_width
+        self.review_height = review_height
+        self.review_video_bitrate = review_video_bitrate
+        self.review_audio_bitrate = review_audio_bitrate
+        self.timeout = timeout
+
+    def _run(self, command):
+        return subprocess.run(command, capture_output=True, check=True, timeout=self.timeout, text=True).stdout
+
+    def probe(self, path):
+        output = self._run([self.ffprobe, '-v', 'error', '-show_entries', 'format=format_name,duration',
+                            '-of', 'json', path])
+        video_format = json.loads(output).get('format', {})
+        duration = video_format.get('duration')
+        return {
+            'container': video_format.get('format_name', ''),
+            'duration': float(duration) if duration not in (None, 'N/A') else None,
+        }
+
+    def thumbnail(self, path, destination, duration=None):
+        # Кадр з 10% тривалості: перші секунди зазвичай чорні
+        position = f"{duration * 0.1:.2f}" if duration else '0'
+        self._run([self.ffmpeg, '-v', 'error', '-y', '-ss', position, '-i', path, '-frames:v', '1',
+                   '-vf', f'scale={self.thumbnail_width}:-2', destination])
+        return destination
+
+    def review_rendition(self, path, destination):
+        self._run([self.ffmpeg, '-v', 'error', '-y', '-i', path,
+                   '-vf', f'scale=-2:min({self.review_height}\\,ih)',
+                   '-c:v', 'libx264', '-preset', 'veryfast', '-b:v', self.review_video_bitrate,
+                   '-c:a', 'aac', '-b:a', self.review_audio_bitrate,
+                   '-movflags', '+faststart', destination])
+        return destination
+
+
+def get_video_processor(path=None):
+    return import_string(path or VIDEO_PROCESSOR)()
+
+
+def preview_paths(path):
+    # Постер і копія для перегляду, які process_video створює для відео `path`
+    name = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(VIDEO_PREVIEWS_DIR, f"{name}.jpg"), os.path.join(VIDEO_PREVIEWS_DIR, f"{name}__review.mp4")
+
+
+def process_video(path, make_review=True, processor_path=None):
+    """
+    Обробляє один файл і повертає результати для SoldOrders.
+    Виконується в окремому процесі, тому не звертається до бази.
+    """
+    processor = get_video_processor(processor_path)
+    os.makedirs(VIDEO_PREVIEWS_DIR, exist_ok=True)
+    thumbnail_path, review_rendition_path = preview_paths(path)
+
+    info = processor.probe(path)
+    thumbnail = processor.thumbnail(path, thumbnail_path, info['duration'])
+    review_path = None
+    if make_review:
+        review_path = processor.review_rendition(path, review_rendition_path)
+
+    return {
+        'video_container': info['container'] or '',
+        'video_duration': info['duration'],
+        'video_thumbnail': thumbnail or '',
+        'video_review_path': review_path or '',
+    }
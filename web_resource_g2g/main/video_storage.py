@@ -0,0 +1,195 @@
+"""
+Сховище відео за вмістом: файл зберігається один раз під своїм sha256 у теці виду `ab/cd/<sha256>.mp4`,
+а SoldOrders.path_to_video посилаються на нього. Відео виплачених старих замовлень
+переносяться в архів (VIDEO_ARCHIVE_ROOT, напр. дешевший холодний том) без перекодування: mp4 вже стиснене,
+тож архівні файли віддаються з Range так само, як робочі. Файли без посилань видаляються (manage.py video_retention).
+"""
+import gzip
+import os
+import shutil
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from .models import SoldOrders, StoredVideo
+from .utils.logger_config import get_logger
+from .video_processing import preview_paths
+from .utils.video_upload import VIDEO_UPLOAD_DIR, VIDEO_WRITE_BUFFER, file_sha256
+
+logger = get_logger(__name__)
+
+# Робоче сховище на тій самій файловій системі, що й завантаження, тож збереження - це перейменування
+VIDEO_STORAGE_ROOT = getattr(settings, 'VIDEO_STORAGE_ROOT', VIDEO_UPLOAD_DIR)
+VIDEO_ARCHIVE_ROOT = getattr(settings, 'VIDEO_ARCHIVE_ROOT', os.path.join(settings.MEDIA_ROOT, 'videos_archive'))
+VIDEO_ARCHIVE_AFTER_DAYS = getattr(settings, 'VIDEO_ARCHIVE_AFTER_DAYS', 30)
+# Щойно збережене відео ще може не мати посилань: замовлення оновлюється після store_video.
+# Відлік іде від created_time, який store_video оновлює, коли знову видає файл без посилань
+ORPHAN_GRACE_PERIOD = timedelta(days=1)
+
+
+def sharded_path(root, sha256, suffix):
+    return os.path.join(root, sha256[:2], sha256[2:4], f"{sha256}{suffix}")
+
+
+def store_video(source_path, sha256=None, extension='.mp4'):
+    """
+    Переносить файл у сховище та повертає його StoredVideo.
+    Якщо таке саме відео вже збережене, новий файл видаляється, а повертається наявний запис.
+    """
+    sha256 = sha256 or file_sha256(source_path)
+    with transaction.atomic():
+        # Блокування рядка: delete_orphans не видалить файл, поки його видають як дублікат
+        stored = StoredVideo.objects.select_for_update().filter(sha256=sha256).first()
+        if stored is not None and stored.ref_count <= 0:
+            stored.created_time = timezone.now()
+            stored.save(update_fields=['created_time'])
+    if stored is not None:
+        os.remove(source_path)
+        logger.info("Video %s is a duplicate of %s", source_path, stored.path)
+        return stored
+
+    path = sharded_path(VIDEO_STORAGE_ROOT, sha256, extension)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    size = os.path.getsize(source_path)
+    shutil.move(source_path, path)
+    try:
+        with transaction.atomic():
+            stored = StoredVideo.objects.create(sha256=sha256, path=path, size=size)
+    except IntegrityError:
+        # Те саме відео паралельно зберіг інший запит; вміст файлу однаковий
+        stored = StoredVideo.objects.get(sha256=sha256)
+    logger.info("Video stored as %s", stored.path)
+    return stored
+
+
+def change_video_reference(old_path, new_path):
+    # Викликається в транзакції, що змінює SoldOrders.path_to_video
+    if old_path == new_path:
+        return
+    if new_path:
+        StoredVideo.objects.filter(path=new_path).update(ref_count=F('ref_count') + 1)
+    if old_path:
+        StoredVideo.objects.filter(path=old_path).update(ref_count=F('ref_count') - 1)
+
+
+def recount_references():
+    """Звіряє ref_count з фактичною кількістю замовлень і повертає кількість виправлених записів."""
+    counts = dict(
+        SoldOrders.objects.exclude(path_to_video='')
+        .order_by()
+        .values('path_to_video')
+        .annotate(total=Count('id'))
+        .values_list('path_to_video', 'total')
+    )
+    fixed = []
+    for stored in StoredVideo.objects.only('id', 'path', 'ref_count'):
+        expected = counts.get(stored.path, 0)
+        if stored.ref_count != expected:
+            stored.ref_count = expected
+            fixed.append(stored)
+    StoredVideo.objects.bulk_update(fixed, ['ref_count'], batch_size=500)
+    return len(fixed)
+
+
+def videos_to_archive(days=VIDEO_ARCHIVE_AFTER_DAYS):
+    # Відео, всі замовлення якого виплачені продавцю і старші за `days` днів
+    cutoff = timezone.now() - timedelta(days=days)
+    still_needed = SoldOrders.objects.filter(Q(paid_in_salary=False) | Q(created_time__gte=cutoff)).values(
+        'path_to_video'
+    )
+    return (StoredVideo.objects.filter(tier=StoredVideo.TIER_HOT, ref_count__gt=0)
+            .exclude(path__in=still_needed)
+            .order_by('id'))
+
+
+def _place_copy(source_path, destination_path):
+    # На тому ж томі - жорстке посилання без копіювання, на інший том - копія через тимчасовий файл.
+    # Джерело не видаляється: шлях у базі ще веде на нього
+    os.makedirs(os.path.dirname(destination_path), exist_ok=True)
+    if os.path.exists(destination_path):
+        # Залишок перерваного запуску
+        os.remove(destination_path)
+    try:
+        os.link(source_path, destination_path)
+    except OSError:
+        temporary_path = f"{destination_path}.tmp"
+        shutil.copyfile(source_path, temporary_path)
+        os.replace(temporary_path, destination_path)
+
+
+def _move_stored_video(stored, new_path, **fields):
+    old_path = stored.path
+    with transaction.atomic():
+        SoldOrders.objects.filter(path_to_video=old_path).update(path_to_video=new_path)
+        StoredVideo.objects.filter(id=stored.id).update(path=new_path, **fields)
+    os.remove(old_path)
+
+
+def archive_video(stored):
+    archive_path = sharded_path(VIDEO_ARCHIVE_ROOT, stored.sha256, os.path.splitext(stored.path)[1])
+    _place_copy(stored.path, archive_path)
+    hot_path = stored.path
+    _move_stored_video(stored, archive_path, tier=StoredVideo.TIER_ARCHIVE, archived_time=timezone.now())
+    logger.info("Video %s archived to %s", hot_path, archive_path)
+    return archive_path
+
+
+def unpack_compressed_archives():
+    """
+    Розпаковує архівні відео, стиснені gzip попередньою версією архіву, поруч з ними.
+    Повертає кількість розпакованих файлів.
+    """
+    unpacked = 0
+    for stored in StoredVideo.objects.filter(path__endswith='.gz'):
+        unpacked_path = stored.path.removesuffix('.gz')
+        temporary_path = f"{unpacked_path}.tmp"
+        with gzip.open(stored.path, 'rb') as source, open(temporary_path, 'wb') as destination:
+            shutil.copyfileobj(source, destination, VIDEO_WRITE_BUFFER)
+        os.replace(temporary_path, unpacked_path)
+        _move_stored_video(stored, unpacked_path)
+        unpacked += 1
+    return unpacked
+
+
+def delete_orphans():
+    # Видаляє файли, на які не посилається жодне замовлення, разом з їхніми постерами та копіями для перегляду
+    orphans = StoredVideo.objects.filter(ref_count__lte=0,
+                                         created_time__lt=timezone.now() - ORPHAN_GRACE_PERIOD)
+    deleted = 0
+    for stored_id in list(orphans.values_list('id', flat=True)):
+        with transaction.atomic():
+            # Умови перевіряються ще раз під блокуванням: файл могли щойно видати як дублікат або послатись на нього
+            stored = orphans.select_for_update().filter(id=stored_id).first()
+            if stored is None:
+                continue
+            paths = {stored.path, *preview_paths(stored.path)}
+            for path in paths:
+                if os.path.exists(path):
+                    os.remove(path)
+            stored.delete()
+        deleted += 1
+    return deleted
+
+
+def import_legacy_videos():
+    """
+    Переносить у сховище відео, збережені до його появи під іменами з даними замовлення.
+    Повертає кількість перенесених файлів.
+    """
+    stored_paths = StoredVideo.objects.values('path')
+    legacy_paths = (SoldOrders.objects.exclude(path_to_video='')
+                    .exclude(path_to_video__in=stored_paths)
+                    .values_list('path_to_video', flat=True)
+                    .distinct())
+    imported = 0
+    for legacy_path in list(legacy_paths):
+        if not os.path.exists(legacy_path):
+            logger.warning("Legacy video %s is missing on disk", legacy_path)
+            continue
+        stored = store_video(legacy_path, extension=os.path.splitext(legacy_path)[1] or '.mp4')
+        SoldOrders.objects.filter(path_to_video=legacy_path).update(path_to_video=stored.path)
+        imported += 1
+    return imported
@@ -1,55 +1,157 @@
+import base64
+import binascii
+import hashlib
 import json
 import os
+from datetime import datetime, timedelta
 
-from django.conf import settings
 from django.contrib import messages
-from django.http import JsonResponse, HttpResponseNotAllowed, HttpResponse
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import (JsonResponse, HttpResponseNotAllowed, HttpResponse, HttpResponseBadRequest,
+                         HttpResponseForbidden, Http404)
 from django.shortcuts import render, redirect
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
 from . import crud
-from .utils.logger_config import logger
+from .middleware import QUERY_INSTRUMENTATION
+from .models import VideoUpload, SoldOrders
+from .utils.logger_config import get_logger
+from .utils.query_stats import request_stats_log
+from .utils.video_upload import (StreamingVideoUploadHandler, ChecksumMismatch, UploadBusy, VIDEO_UPLOAD_MAX_SIZE,
+                                 write_chunk, file_sha256, upload_lock, remove_upload_lock)
+from .utils.video_serving import serve_video
+from .video_storage import store_video
+
+logger = get_logger(__name__)
+
+# Найбільше правок в одному запиті update_offers_batch
+OFFERS_BATCH_MAX_EDITS = 500
 
 
 def start_page(request):
     if request.method == 'GET':
         user_id = request.user.id
         all_bets = crud.get_main_data_from_table(user_id)
-        logger.info(f"all_bets__{all_bets}")
-
-        servers = crud.query_servers()
-        games = set(server.game_name for server in servers)
-        regions = set(server.region for server in servers)
+        logger.debug("all_bets__%s", all_bets)
 
-        grouped_data_db = crud.get_grouped_data(servers)
-        grouped_data = json.dumps(grouped_data_db)
+        catalog = crud.get_server_catalog()
 
         double_add = json.dumps([{'server_name': server['server_name'],
                                   'game_name': server['game_name']} for server in all_bets])
 
         return render(request, 'main/index.html', context={"bets_list": all_bets,
-                                                           'games': games,
-                                                           'regions': regions,
-                                                           'servers_json': grouped_data,
+                                                           'games': catalog['games'],
+                                                           'regions': catalog['regions'],
+                                                           'catalog_version': catalog['version'],
                                                            'double_add': double_add
                                                            })
 
 
+def server_catalog(request):
+    """
+    Каталог серверів для форми додавання. Вміст визначається версією, тож запит з ?v=<версія>
+    кешується браузером назавжди, а без неї - перевіряється через ETag.
+    """
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    catalog = crud.get_server_catalog()
+    if request.GET.get('v') == catalog['version']:
+        cache_control = 'public, max-age=31536000, immutable'
+    else:
+        cache_control = 'public, no-cache'
+
+    etag = quote_etag(catalog['version'])
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(catalog['body'], content_type='application/json')
+    response['ETag'] = etag
+    response['Cache-Control'] = cache_control
+    return response
+
+
+def offers_table(request):
+    """
+    Таблиця лотів продавця в JSON для оновлення цін без перезавантаження сторінки.
+    ?fields=id,price,full_cost обмежує поля рядків; незмінна таблиця повертає 304 за ETag.
+    """
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    if not request.user.is_authenticated:
+        return HttpResponseForbidden()
+
+    allowed_fields = crud.OFFERS_TABLE_COLUMNS + crud.OFFERS_TABLE_CALCULATED_FIELDS
+    # Порядок і повтори полів представлення не змінюють
+    fields = sorted({field for field in request.GET.get('fields', '').split(',') if field})
+    unknown_fields = set(fields) - set(allowed_fields)
+    if unknown_fields:
+        return HttpResponseBadRequest(f"Невідомі поля: {', '.join(sorted(unknown_fields))}")
+
+    table = crud.load_offers_table(request.user.id)
+    # Різний набір полів - різне представлення, тож і різний ETag. Без ком: If-None-Match розбирається по комах
+    version = crud.get_offers_table_version(table)
+    if fields:
+        version = f"{version}-{hashlib.sha256(','.join(fields).encode()).hexdigest()[:8]}"
+    etag = quote_etag(version)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        rows = crud.calculate_offers_table(table)
+        if fields:
+            rows = [{field: row.get(field) for field in fields} for row in rows]
+        response = JsonResponse({'offers': rows})
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
 def update_table_data(request):
     if request.method == 'POST':
         user_id = request.user.id
         data = json.loads(request.body)
-        logger.info(data)
-        new_price = crud.update_price_delivery(data, user_id)
-        logger.info(new_price)
+        logger.debug("update_table_data__%s", data)
+        try:
+            new_price = crud.update_price_delivery(data, user_id)
+        except ValueError as e:
+            return JsonResponse({'success': False, 'error': str(e)}, status=400)
+        logger.debug("new_price__%s", new_price)
         return JsonResponse({'success': True, 'new_price': new_price})
     return HttpResponseNotAllowed(['POST'])
 
 
+def update_offers_batch(request):
+    """
+    Пакет правок таблиці лотів: {"edits": [{"row_id", "field_name", "new_value"}, ...]}.
+    Застосовується повністю або ніяк; у відповіді - перераховані ціни змінених лотів.
+    """
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    if not request.user.is_authenticated:
+        return HttpResponseForbidden()
+    try:
+        edits = json.loads(request.body)['edits']
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'success': False, 'error': "Очікується JSON з полем edits"}, status=400)
+    if not isinstance(edits, list) or not 0 < len(edits) <= OFFERS_BATCH_MAX_EDITS:
+        return JsonResponse({'success': False, 'error': f"edits - список з 1..{OFFERS_BATCH_MAX_EDITS} правок"},
+                            status=400)
+
+    try:
+        offers = crud.update_offers_batch(edits, request.user.id)
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    return JsonResponse({'success': True, 'offers': [
+        {field: offer.get(field) for field in ('id', 'price', 'full_cost', 'stock', 'interest_rate')}
+        for offer in offers]})
+
+
 def add_server(request):
     if request.method == 'POST':
         add_server_info = json.loads(request.body)
 
         add_server_info['auth_user_id'] = request.user.id
-        logger.info(f"add_server_info__{add_server_info}")
+        logger.debug("add_server_info__%s", add_server_info)
         crud.add_server_to_db(add_server_info)
 
     return JsonResponse({'success': True})
@@ -60,7 +162,7 @@ def handle_option_change(request):
     payload = json.loads(request.body)
     offer_id = payload["row_id"]
     action = payload["action"]
-    logger.info(f'Change option__{action} for__{offer_id},')
+    logger.info('Change option__%s for__%s,', action, offer_id)
     if action == 'delete':
         crud.delete_server_from_list(offer_id)
     else:
@@ -82,55 +184,279 @@ def show_order_info(request):
                                                                  "price_unit": round(price_unit, 2)})
 
 
+@csrf_exempt
 def upload_video(request, sold_order_number):
-    logger.info(f"sold_order_number__{sold_order_number}")
+    # Обробник завантаження треба замінити до того, як CsrfViewMiddleware прочитає request.POST,
+    # тому CSRF перевіряється вже в _upload_video. Анонімним запитам тіло не читаємо зовсім
+    if not request.user.is_authenticated:
+        return HttpResponseForbidden()
+    upload_handler = StreamingVideoUploadHandler(request)
+    request.upload_handlers = [upload_handler]
+    try:
+        return _upload_video(request, sold_order_number)
+    finally:
+        upload_handler.discard_files()
+
+
+@csrf_protect
+def _upload_video(request, sold_order_number):
+    logger.info("sold_order_number__%s", sold_order_number)
     user = request.user.id
 
     if request.method == 'POST':
         if 'video' in request.FILES:
             video_file = request.FILES['video']
-            sent_gold = int(request.POST.get('sent_gold'))
 
             try:
-                # Збереження файлу
-                filename = crud.create_video_filename(request, sold_order_number)
-                filepath = os.path.join(settings.MEDIA_ROOT, 'videos', filename)  # Шлях до папки videos
-                with open(filepath, 'wb+') as destination:
-                    for chunk in video_file.chunks():
-                        destination.write(chunk)
-                logger.info(f"filepath__{filepath}")
+                sent_gold = int(request.POST.get('sent_gold'))
+                if crud.get_order_waiting_video(user, sold_order_number) is None:
+                    raise SoldOrders.DoesNotExist(f"Order {sold_order_number} is not waiting for a video")
+                # Обробник уже записав файл поруч зі сховищем, лишається перейменувати
+                filepath = store_video(video_file.temporary_file_path(), video_file.sha256).path
+                logger.info("filepath__%s", filepath)
                 response = crud.update_sold_order_when_video_download(user, sold_order_number, filepath, sent_gold)
-                logger.info(f"response__{response}")
+                logger.info("response__%s", response)
 
                 return redirect('main:start_page')
             except Exception as e:
-                messages.success(request, 'Error saving video')
+                logger.error("Error saving video for order %s: %s", sold_order_number, e)
+                messages.error(request, 'Error saving video')
 
         else:
             messages.error(request, 'Будь ласка, виберіть файл.')
 
+    return redirect('main:show_order_info')
+
+
+def create_video_upload(request, sold_order_number):
+    """
+    Починає (або продовжує) завантаження відео шматками.
+    Тіло: {"size": байти, "sent_gold": кількість, "checksum": sha256 файлу, hex}.
+    """
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+
+    try:
+        payload = json.loads(request.body)
+        size = int(payload['size'])
+        sent_gold = int(payload['sent_gold'])
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'success': False, 'error': "Потрібні size та sent_gold"}, status=400)
+    checksum = str(payload.get('checksum') or '').lower()
+    # Без sha256 всього файлу finalize не зможе перевірити зібраний файл
+    if len(checksum) != 64 or any(char not in '0123456789abcdef' for char in checksum):
+        return JsonResponse({'success': False, 'error': "Потрібна checksum - sha256 файлу в hex"}, status=400)
+
+    if not 0 < size <= VIDEO_UPLOAD_MAX_SIZE:
+        return JsonResponse({'success': False, 'error': "Недопустимий розмір файлу"}, status=413)
+
+    sold_order = crud.get_order_waiting_video(request.user.id, sold_order_number)
+    if sold_order is None:
+        return JsonResponse({'success': False, 'error': "Замовлення не знайдено"}, status=404)
+    if not 0 <= sent_gold <= sold_order.quantity:
+        return JsonResponse({'success': False, 'error': "Відправлене золото не може перевищувати замовлене"},
+                            status=400)
+
+    upload = crud.start_video_upload(sold_order, size, sent_gold, checksum)
+    upload_url = reverse('main:video_upload_chunks', kwargs={'upload_id': upload.upload_id})
+    response = JsonResponse({'success': True,
+                             'upload_url': upload_url,
+                             'finalize_url': reverse('main:finalize_video_upload',
+                                                     kwargs={'upload_id': upload.upload_id}),
+                             'offset': upload.offset,
+                             'size': upload.size}, status=201)
+    response['Location'] = upload_url
+    return response
+
+
+def video_upload_chunks(request, upload_id):
+    """
+    HEAD - поточний зсув завантаження (Upload-Offset).
+    PATCH - наступний шматок файлу з позиції Upload-Offset, тіло application/offset+octet-stream.
+    Необов'язковий заголовок `Upload-Checksum: sha256 <base64>` перевіряє шматок перед зарахуванням.
+    """
+    upload = crud.get_video_upload(request.user.id, upload_id)
+    if upload is None or upload.status != VideoUpload.STATUS_UPLOADING:
+        return JsonResponse({'success': False, 'error': "Завантаження не знайдено"}, status=404)
+
+    if request.method in ('HEAD', 'GET'):
+        return _upload_offset_response(upload, status=200)
+    if request.method != 'PATCH':
+        return HttpResponseNotAllowed(['HEAD', 'PATCH'])
+
+    if request.content_type != 'application/offset+octet-stream':
+        return HttpResponse(status=415)
+    try:
+        offset = int(request.headers['Upload-Offset'])
+        length = int(request.headers['Content-Length'])
+        expected_sha256 = _parse_upload_checksum(request.headers.get('Upload-Checksum'))
+    except (KeyError, ValueError, binascii.Error):
+        return HttpResponseBadRequest("Потрібні коректні Upload-Offset, Content-Length та Upload-Checksum")
+
+    if offset + length > upload.size:
+        return HttpResponse(status=413)
+
+    # Повтор клієнта може прийти, поки попередній запит ще пише: зсув звіряється і зараховується
+    # під тим самим блокуванням, що й запис, інакше запізнілий запит обріже вже зараховані байти
+    try:
+        with upload_lock(upload.path):
+            upload.refresh_from_db(fields=['offset', 'status'])
+            if upload.status != VideoUpload.STATUS_UPLOADING:
+                return JsonResponse({'success': False, 'error': "Завантаження не знайдено"}, status=404)
+            if offset != upload.offset:
+                return _upload_offset_response(upload, status=409)
 
-def show_history_orders(request):
-    user_id = request.user.id
-    orders_history = crud.get_orders_history(user_id)
+            try:
+                written = write_chunk(upload.path, offset, request, length, expected_sha256)
+            except ChecksumMismatch as e:
+                logger.warning("Video upload %s: %s", upload.upload_id, e)
+                return HttpResponse(status=460, reason='Checksum Mismatch')
+
+            crud.advance_video_upload(upload, offset + written)
+            upload.offset = offset + written
+    except UploadBusy:
+        return _upload_offset_response(upload, status=409)
+    return _upload_offset_response(upload, status=204)
+
+
+def finalize_video_upload(request, upload_id):
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+
+    upload = crud.get_video_upload(request.user.id, upload_id)
+    if upload is None or upload.status != VideoUpload.STATUS_UPLOADING:
+        return JsonResponse({'success': False, 'error': "Завантаження не знайдено"}, status=404)
+
+    part_path = upload.path
+    try:
+        with upload_lock(part_path):
+            upload.refresh_from_db(fields=['offset', 'status'])
+            if upload.status != VideoUpload.STATUS_UPLOADING:
+                return JsonResponse({'success': False, 'error': "Завантаження не знайдено"}, status=404)
+            if upload.offset != upload.size:
+                return JsonResponse({'success': False, 'error': "Файл завантажено не повністю",
+                                     'offset': upload.offset}, status=409)
+
+            sha256 = file_sha256(part_path)
+            checksum_matches = sha256 == upload.checksum
+            if checksum_matches:
+                filepath = store_video(part_path, sha256).path
+                crud.complete_video_upload(upload, filepath)
+    except UploadBusy:
+        return JsonResponse({'success': False, 'error': "Шматок файлу ще записується"}, status=409)
+
+    if not checksum_matches:
+        logger.error("Video upload %s: sha256 %s does not match %s", upload.upload_id, sha256, upload.checksum)
+        crud.discard_video_upload(upload)
+        return JsonResponse({'success': False, 'error': "Контрольна сума файлу не збігається"}, status=422)
+    remove_upload_lock(part_path)
+    sold_order = upload.sold_order
+    logger.info("filepath__%s", filepath)
+
+    response = crud.update_sold_order_when_video_download(request.user.id, sold_order.sold_order_number,
+                                                          filepath, upload.sent_gold)
+    logger.info("response__%s", response)
+    return JsonResponse({'success': True, 'message': response, 'redirect_url': reverse('main:start_page')})
+
+
+def _upload_offset_response(upload, status):
+    response = HttpResponse(status=status)
+    response['Upload-Offset'] = upload.offset
+    response['Upload-Length'] = upload.size
+    response['Cache-Control'] = 'no-store'
+    return response
+
+
+def _parse_upload_checksum(header):
+    if not header:
+        return None
+    algorithm, _, value = header.partition(' ')
+    if algorithm.lower() != 'sha256':
+        raise ValueError(f"Unsupported checksum algorithm {algorithm}")
+    return base64.b64decode(value, validate=True)
+
+
+def stream_order_video(request, order_id):
+    """
+    Відео замовлення для перегляду: персоналу - будь-яке, продавцю - лише його власні.
+    `?version=review` віддає легку копію, `?version=thumbnail` - постер, створені process_videos.
+    """
+    order = crud.get_order_video(order_id)
+    if order is None:
+        raise Http404("Замовлення не знайдено")
+    if not (request.user.is_staff or (request.user.is_authenticated and order.seller.auth_user_id == request.user.id)):
+        return HttpResponseForbidden()
+
+    version = request.GET.get('version')
+    if version == 'review' and order.video_review_path:
+        path, etag_value = order.video_review_path, None
+    elif version == 'thumbnail':
+        path, etag_value = order.video_thumbnail, None
+    else:
+        stored = crud.get_stored_video(order.path_to_video)
+        path = order.path_to_video
+        etag_value = stored.sha256 if stored else None
+    if not path or not os.path.exists(path):
+        raise Http404("Відео не знайдено")
 
-    total_earned = 0  # Ініціалізуємо загальну суму
-    orders_with_balance = []
+    if etag_value is None:
+        stat = os.stat(path)
+        etag_value = f"{stat.st_size:x}-{int(stat.st_mtime):x}"
+    return serve_video(request, path, etag_value)
 
-    for order in orders_history:
 
-        total_earned += order.earned_without_admins_commission if not order.paid_in_salary else 0  # Додаємо значення до загальної суми
-        orders_with_balance.append({
-            'order': order,
-            'current_balance': total_earned  # Додаємо поточний баланс до кожного замовлення
-        })
-    return render(request, 'main/show_history.html', context={"orders_history": orders_with_balance})
+def show_history_orders(request):
+    """
+    Історія замовлень продавця сторінками від найновіших.
+    GET: date_from, date_to (YYYY-MM-DD, включно) та before - курсор наступної сторінки.
+    """
+    try:
+        date_from = _parse_history_date(request.GET.get('date_from'))
+        date_to = _parse_history_date(request.GET.get('date_to'))
+        before = _parse_history_cursor(request.GET.get('before'))
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+
+    orders_history, next_cursor = crud.get_orders_history_page(
+        request.user.id,
+        date_from=date_from,
+        date_to=date_to + timedelta(days=1) if date_to else None,
+        before=before,
+    )
+
+    next_url = None
+    if next_cursor is not None:
+        query = request.GET.copy()
+        query['before'] = f"{next_cursor[0].isoformat()}_{next_cursor[1]}"
+        next_url = f"{request.path}?{query.urlencode()}"
+    return render(request, 'main/show_history.html', context={
+        "orders_history": orders_history,
+        "next_url": next_url,
+        "date_from": request.GET.get('date_from', ''),
+        "date_to": request.GET.get('date_to', ''),
+        "is_first_page": before is None,
+    })
+
+
+def _parse_history_date(value):
+    # Початок дня в часовому поясі сайту
+    if not value:
+        return None
+    day = datetime.strptime(value, '%Y-%m-%d')
+    return timezone.make_aware(day)
+
+
+def _parse_history_cursor(value):
+    if not value:
+        return None
+    created_time, _, order_id = value.rpartition('_')
+    return datetime.fromisoformat(created_time), int(order_id)
 
 
 def show_balance(request):
     balance = crud.get_balance(request.user.id)
 
-    logger.info(f"balance__{balance}")
+    logger.info("balance__%s", balance)
     return render(request, 'users/base.html', context={'user_balance': balance})
 
 
@@ -139,3 +465,19 @@ def delete_server(request):
     row_id = data.get('row_id')
     crud.delete_server_from_list(row_id)
     return JsonResponse({"success": True})
+
+
+@staff_member_required
+def query_stats(request):
+    """
+    Зведення SQL-запитів за view з останніх запитів цього процесу (QueryInstrumentationMiddleware).
+    `?format=json` - те саме у JSON, POST - очистити історію.
+    """
+    if request.method == 'POST':
+        request_stats_log.clear()
+        return redirect('main:query_stats')
+
+    summary = request_stats_log.summary()
+    if request.GET.get('format') == 'json':
+        return JsonResponse({'views': summary})
+    return render(request, 'main/query_stats.html', {'summary': summary, 'enabled': QUERY_INSTRUMENTATION})
@@ -0,0 +1,66 @@
+"""
+Налаштування бази даних з оточення.
+За замовчуванням - спільний з торговим сервером файл SQLite у режимі WAL; DB_ENGINE=postgresql
+перемикає на PostgreSQL. Модуль не імпортує Django, тож ним користується і бенчмарк у дочірніх процесах.
+"""
+import os
+
+DEFAULT_SQLITE_PATH = r"E:\Common_database_to_web_and_server\G2G.sqlite"
+
+def sqlite_pragmas():
+    # Виконуються на кожному новому з'єднанні. Оточення читається під час виклику, а не імпорту:
+    # settings.py імпортує модуль до load_dotenv().
+    # WAL: читачі не блокують записувача і навпаки; synchronous=NORMAL у WAL не втрачає цілісності,
+    # лише останні транзакції при вимкненні живлення; mmap та cache_size зменшують кількість read().
+    return (
+        "PRAGMA journal_mode=WAL",
+        "PRAGMA synchronous=NORMAL",
+        f"PRAGMA mmap_size={int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))}",
+        f"PRAGMA cache_size={-int(os.getenv('SQLITE_CACHE_SIZE_KB', 64 * 1024))}",
+        "PRAGMA temp_store=MEMORY",
+    )
+
+
+def sqlite_busy_timeout():
+    # Скільки секунд чекати на блокування бази іншим процесом замість помилки "database is locked"
+    return float(os.getenv('SQLITE_BUSY_TIMEOUT', 20))
+
+
+def sqlite_config(path):
+    return {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": os.path.abspath(path),
+        "OPTIONS": {
+            "init_command": ";".join(sqlite_pragmas()),
+            "timeout": sqlite_busy_timeout(),
+            # Транзакція одразу бере блокування на запис: з DEFERRED дві транзакції, що читали й хочуть
+            # писати, отримують "database is locked" без очікування busy_timeout
+            "transaction_mode": "IMMEDIATE",
+        },
+    }
+
+
+def postgresql_config():
+    return {
+        "ENGINE": "django.db.backends.postgresql",
+        "NAME": os.getenv('POSTGRES_DB', 'g2g'),
+        "USER": os.getenv('POSTGRES_USER', 'g2g'),
+        "PASSWORD": os.getenv('POSTGRES_PASSWORD', ''),
+        "HOST": os.getenv('POSTGRES_HOST', 'localhost'),
+        "PORT": os.getenv('POSTGRES_PORT', '5432'),
+    }
+
+
+def database_config():
+    engine = os.getenv('DB_ENGINE', 'sqlite').lower()
+    if engine == 'postgresql':
+        config = postgresql_config()
+    elif engine == 'sqlite':
+        config = sqlite_config(os.getenv('SQLITE_PATH', DEFAULT_SQLITE_PATH))
+    else:
+        raise ValueError(f"Unsupported DB_ENGINE {engine!r}, expected 'sqlite' or 'postgresql'")
+
+    # Постійні з'єднання: без повторного відкриття файлу та PRAGMA на кожен запит
+    config["CONN_MAX_AGE"] = int(os.getenv('DB_CONN_MAX_AGE', 600))
+    config["CONN_HEALTH_CHECKS"] = True
+    return config
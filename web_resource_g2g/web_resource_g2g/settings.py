@@ -3,6 +3,8 @@ import os
 
 from dotenv import load_dotenv
 
+from .database import database_config
+
 load_dotenv()
  # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -27,6 +29,8 @@ CSRF_TRUSTED_ORIGINS = [
 # Application definition
 
 INSTALLED_APPS = [
+    # Першим: runserver daphne обслуговує і HTTP, і WebSocket через ASGI_APPLICATION
+    "daphne",
     "django.contrib.admin",
     "django.contrib.auth",
     "django.contrib.contenttypes",
@@ -44,6 +48,7 @@ MIDDLEWARE = [
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "main.middleware.QueryInstrumentationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -68,16 +73,19 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = "web_resource_g2g.wsgi.application"
+ASGI_APPLICATION = "web_resource_g2g.asgi.application"
+
+# Шар каналів для push-оновлень продавцям (main.realtime). Кожен процес сам опитує базу для своїх з'єднань
+# і пише лише в їхні канали, тож спільний шар між процесами не потрібен
+CHANNEL_LAYERS = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
 
 
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# Шлях до SQLite (SQLITE_PATH), PRAGMA та перемикання на PostgreSQL (DB_ENGINE) - у database.py
 DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": os.path.abspath(r"E:\Common_database_to_web_and_server\G2G.sqlite")
-    }
+    "default": database_config(),
 }
 
 
@@ -135,5 +143,32 @@ EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD')
 DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
 PASSWORD_RESET_CONFIRM_URL = 'password_reset_confirm'
 
+# Кеш комісії біржі та ставок продавців: час життя в секундах і alias із CACHES для спільного кешу процесів
+PRICE_CACHE_TTL = int(os.getenv('PRICE_CACHE_TTL', 300))
+PRICE_CACHE_BACKEND = os.getenv('PRICE_CACHE_BACKEND') or None
+# Скільки секунд тримати каталог серверів, якщо ServerUrls змінено поза Django
+SERVER_CATALOG_CACHE_TTL = int(os.getenv('SERVER_CATALOG_CACHE_TTL', 3600))
+
 MEDIA_URL = '/media/'  # URL для медіа-файлів
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')  # Директорія для зберігання медіа-файлів
+# Клас обробки відео для process_videos; main.video_processing.NullVideoProcessor - без ffmpeg
+VIDEO_PROCESSOR = os.getenv('VIDEO_PROCESSOR', 'main.video_processing.FFmpegVideoProcessor')
+# Максимальний розмір відео, яке продавець може завантажити, у байтах
+VIDEO_UPLOAD_MAX_SIZE = int(os.getenv('VIDEO_UPLOAD_MAX_SIZE', 4 * 1024 ** 3))
+# Через скільки днів відео виплачених замовлень переносяться в архів (manage.py video_retention)
+VIDEO_ARCHIVE_AFTER_DAYS = int(os.getenv('VIDEO_ARCHIVE_AFTER_DAYS', 30))
+# Тека архіву, напр. на дешевшому холодному томі; для x-accel-redirect має лежати всередині MEDIA_ROOT
+VIDEO_ARCHIVE_ROOT = os.getenv('VIDEO_ARCHIVE_ROOT', os.path.join(MEDIA_ROOT, 'videos_archive'))
+# Хто віддає відео після перевірки прав: '' - Django, 'x-accel-redirect' - nginx, 'x-sendfile' - Apache/lighttpd
+VIDEO_SERVE_BACKEND = os.getenv('VIDEO_SERVE_BACKEND', '')
+# internal-location nginx, що відповідає MEDIA_ROOT (для x-accel-redirect)
+VIDEO_ACCEL_REDIRECT_LOCATION = os.getenv('VIDEO_ACCEL_REDIRECT_LOCATION', '/protected-media/')
+# Облік SQL-запитів кожного запиту (main.middleware); зведення - /query_stats/ для персоналу.
+# Типово лише з DEBUG, на робочому сервері вмикається явно
+QUERY_INSTRUMENTATION = os.getenv('QUERY_INSTRUMENTATION', str(DEBUG)).lower() in ('1', 'true', 'yes')
+# Після скількох запитів до бази за один HTTP-запит писати попередження в лог
+QUERY_COUNT_WARNING = int(os.getenv('QUERY_COUNT_WARNING', 50))
+# Як часто (с) перевіряти ціни, замовлення та баланси підключених по WebSocket продавців
+REALTIME_POLL_INTERVAL = float(os.getenv('REALTIME_POLL_INTERVAL', 5))
+# Скільки днів історії зміни стоку зберігати окремими рядками (manage.py compact_stock_history)
+STOCK_HISTORY_RETENTION_DAYS = int(os.getenv('STOCK_HISTORY_RETENTION_DAYS', 90))